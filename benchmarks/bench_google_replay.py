@@ -0,0 +1,96 @@
+''' Replay a cassette of real google traffic through the code the
+search and details routes run, and time it. Record a cassette by
+running the app (one worker) with
+
+    GOOGLE_CASSETTE_MODE=record GOOGLE_CASSETTE_PATH=prod.jsonl.gz
+
+and using it for a while, then
+
+    python benchmarks/bench_google_replay.py prod.jsonl.gz
+
+Each recorded nearby search is run with nearbySearch and turned into
+GooglePlaces the way SearchResults does, and each details lookup goes
+through placeDetailsAsync, runs times over. The search cache is
+cleared first each time so every run asks the cassette. By default
+google's recorded latency is waited out, so the numbers are what
+users saw; --no-timing leaves just our own overhead.
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+# importing project needs a config, though nothing touches the db
+os.environ.setdefault('APP_SETTINGS', 'project._config.DevelopmentConfig')
+os.environ.setdefault('RESTIES_DB_URL', 'sqlite://')
+os.environ.setdefault('TEST_DB_URL', 'sqlite://')
+
+from project import app  # noqa: E402
+from project.models import GooglePlace  # noqa: E402
+from project.utils.cassette import cassette  # noqa: E402
+from project.utils.googleUtils import (NEARBY_URL, DETAILS_URL,  # noqa: E402
+                                       TIMEOUT, nearbySearch, searchCache,
+                                       placeDetailsAsync)
+
+
+def searchPage(params):
+    lat, lng = (float(part) for part in params['location'].split(','))
+    searchCache.entries.clear()
+    page = nearbySearch(lat, lng, int(params['radius']),
+                        params.get('keyword', ''), prefetch=False)
+    for result in page.get('results', []):
+        place = GooglePlace(result['place_id'], result)
+        place.name, place.vicinity, place.permanently_closed
+
+
+def detailsPage(params):
+    lookup = placeDetailsAsync(params['placeid'])
+    place = GooglePlace(params['placeid'], lookup.result(TIMEOUT)['result'])
+    place.name, place.formatted_address, place.opening_hours, place.location
+
+
+PATHS = (('search', NEARBY_URL, 'location', searchPage),
+         ('details', DETAILS_URL, 'placeid', detailsPage))
+
+
+def percentile(times, fraction):
+    times = sorted(times)
+    return times[min(len(times) - 1, int(len(times) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('cassette')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-timing', action='store_true',
+                        help="don't wait out google's recorded latency")
+    args = parser.parse_args()
+
+    cassette.configure('replay', args.cassette, timing=not args.no_timing)
+    # replayed calls are still counted. don't let them hit a budget
+    app.config['GOOGLE_BUDGETS'] = {}
+    requests = cassette.requests()
+
+    print('{:<10} {:>6} {:>10} {:>10} {:>10}'.format(
+        '', 'calls', 'p50 ms', 'p95 ms', 'max ms'))
+    for name, url, needs, run in PATHS:
+        recorded = [params for requestURL, params in requests
+                    if requestURL == url and needs in params]
+        times = []
+        for i in range(args.runs):
+            for params in recorded:
+                started = time.perf_counter()
+                run(params)
+                times.append((time.perf_counter() - started) * 1000)
+        if times:
+            print('{:<10} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+                name, len(times), percentile(times, 0.5),
+                percentile(times, 0.95), max(times)))
+        else:
+            print('{:<10} {:>6}'.format(name, 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+"""data versions on users and userPlaces
+
+Revision ID: 3f1c9a2d7b64
+Revises: 4af81849f99f
+Create Date: 2026-10-19 09:12:40.113520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9a2d7b64'
+down_revision = '4af81849f99f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('listVersion', sa.Integer(),
+                                     server_default='0', nullable=False))
+    op.add_column('userPlaces', sa.Column('version', sa.Integer(),
+                                          server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('userPlaces', 'version')
+    op.drop_column('users', 'listVersion')
@@ -0,0 +1,27 @@
+"""latitude and longitude on places
+
+Revision ID: 5b90e3c4a1d8
+Revises: 8d2e5b17c0a3
+Create Date: 2026-10-19 12:20:41.871902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b90e3c4a1d8'
+down_revision = '8d2e5b17c0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing places are filled in with `flask backfill-places`
+    op.add_column('places', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('places', sa.Column('longitude', sa.Float(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('places', 'longitude')
+    op.drop_column('places', 'latitude')
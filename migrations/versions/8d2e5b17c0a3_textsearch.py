@@ -0,0 +1,115 @@
+"""full text search indexes on place names, notes and visit comments
+
+Revision ID: 8d2e5b17c0a3
+Revises: 3f1c9a2d7b64
+Create Date: 2026-10-19 11:02:17.504311
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e5b17c0a3'
+down_revision = '3f1c9a2d7b64'
+branch_labels = None
+depends_on = None
+
+# the expressions have to match the ones in project.utils.textSearch
+# exactly for postgres to use the indexes
+POSTGRES_INDEXES = (
+    ('ix_places_placeName_tsv', 'places',
+     """to_tsvector('simple', "placeName")"""),
+    ('ix_userPlaces_notes_tsv', 'userPlaces',
+     """to_tsvector('simple', coalesce(notes, ''))"""),
+    ('ix_visits_comments_tsv', 'visits',
+     """to_tsvector('simple', coalesce(comments, ''))"""),
+)
+
+# one row per place name, notes and visit comment in each users list
+SQLITE_TABLE = '''
+    CREATE VIRTUAL TABLE placeSearch USING fts5(
+        body, "userID" UNINDEXED, "placeID" UNINDEXED,
+        kind UNINDEXED, "visitID" UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 1')
+'''
+
+SQLITE_TRIGGERS = (
+    '''CREATE TRIGGER placeSearch_userPlaces_insert
+       AFTER INSERT ON "userPlaces" BEGIN
+           INSERT INTO placeSearch (body, "userID", "placeID", kind)
+           SELECT "placeName", new."userID", new."placeID", 'name'
+           FROM places WHERE "placeID" = new."placeID";
+           INSERT INTO placeSearch (body, "userID", "placeID", kind)
+           VALUES (coalesce(new.notes, ''), new."userID", new."placeID",
+                   'notes');
+       END''',
+    '''CREATE TRIGGER placeSearch_userPlaces_notes
+       AFTER UPDATE OF notes ON "userPlaces" BEGIN
+           UPDATE placeSearch SET body = coalesce(new.notes, '')
+           WHERE "userID" = new."userID" AND "placeID" = new."placeID"
+             AND kind = 'notes';
+       END''',
+    '''CREATE TRIGGER placeSearch_userPlaces_delete
+       AFTER DELETE ON "userPlaces" BEGIN
+           DELETE FROM placeSearch
+           WHERE "userID" = old."userID" AND "placeID" = old."placeID"
+             AND kind IN ('name', 'notes');
+       END''',
+    '''CREATE TRIGGER placeSearch_places_name
+       AFTER UPDATE OF "placeName" ON places BEGIN
+           UPDATE placeSearch SET body = new."placeName"
+           WHERE "placeID" = new."placeID" AND kind = 'name';
+       END''',
+    '''CREATE TRIGGER placeSearch_visits_insert
+       AFTER INSERT ON visits BEGIN
+           INSERT INTO placeSearch (body, "userID", "placeID", kind,
+                                    "visitID")
+           VALUES (coalesce(new.comments, ''), new."userID", new."placeID",
+                   'visit', new."visitID");
+       END''',
+    '''CREATE TRIGGER placeSearch_visits_comments
+       AFTER UPDATE OF comments ON visits BEGIN
+           UPDATE placeSearch SET body = coalesce(new.comments, '')
+           WHERE kind = 'visit' AND "visitID" = new."visitID";
+       END''',
+    '''CREATE TRIGGER placeSearch_visits_delete
+       AFTER DELETE ON visits BEGIN
+           DELETE FROM placeSearch
+           WHERE kind = 'visit' AND "visitID" = old."visitID";
+       END''',
+)
+
+SQLITE_BACKFILL = (
+    '''INSERT INTO placeSearch (body, "userID", "placeID", kind)
+       SELECT p."placeName", up."userID", up."placeID", 'name'
+       FROM "userPlaces" up JOIN places p ON p."placeID" = up."placeID"''',
+    '''INSERT INTO placeSearch (body, "userID", "placeID", kind)
+       SELECT coalesce(notes, ''), "userID", "placeID", 'notes'
+       FROM "userPlaces"''',
+    '''INSERT INTO placeSearch (body, "userID", "placeID", kind, "visitID")
+       SELECT coalesce(comments, ''), "userID", "placeID", 'visit', "visitID"
+       FROM visits''',
+)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name, table, expression in POSTGRES_INDEXES:
+            op.execute('CREATE INDEX "{}" ON "{}" USING gin ({})'.format(
+                name, table, expression))
+    elif dialect == 'sqlite':
+        op.execute(SQLITE_TABLE)
+        for statement in SQLITE_TRIGGERS + SQLITE_BACKFILL:
+            op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for name, table, expression in POSTGRES_INDEXES:
+            op.execute('DROP INDEX "{}"'.format(name))
+    elif dialect == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            op.execute('DROP TRIGGER {}'.format(statement.split()[2]))
+        op.execute('DROP TABLE placeSearch')
@@ -0,0 +1,27 @@
+"""indexes for paging visits newest first
+
+Revision ID: a93c1e7d2f48
+Revises: e18b6d3f5a20
+Create Date: 2026-10-19 15:02:33.418207
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93c1e7d2f48'
+down_revision = 'e18b6d3f5a20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_visits_user_place_date', 'visits',
+                    ['userID', 'placeID', 'visitDate', 'visitID'])
+    op.create_index('ix_visits_user_date', 'visits',
+                    ['userID', 'visitDate', 'visitID'])
+
+
+def downgrade():
+    op.drop_index('ix_visits_user_date', table_name='visits')
+    op.drop_index('ix_visits_user_place_date', table_name='visits')
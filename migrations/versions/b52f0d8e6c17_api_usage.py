@@ -0,0 +1,33 @@
+"""google api usage table
+
+Revision ID: b52f0d8e6c17
+Revises: a93c1e7d2f48
+Create Date: 2026-10-19 17:20:41.905316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b52f0d8e6c17'
+down_revision = 'a93c1e7d2f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'apiUsage',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('endpoint', sa.String(), nullable=False),
+        sa.Column('route', sa.String(), nullable=False),
+        sa.Column('userID', sa.String(), nullable=False),
+        sa.Column('calls', sa.Integer(), nullable=False),
+        sa.Column('cost', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'endpoint', 'route', 'userID')
+    )
+
+
+def downgrade():
+    op.drop_table('apiUsage')
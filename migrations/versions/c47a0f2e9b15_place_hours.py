@@ -0,0 +1,28 @@
+"""compiled opening hours and utc offset on places
+
+Revision ID: c47a0f2e9b15
+Revises: 5b90e3c4a1d8
+Create Date: 2026-10-19 13:05:09.220417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a0f2e9b15'
+down_revision = '5b90e3c4a1d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing places are filled in with `flask backfill-places`
+    op.add_column('places', sa.Column('hours', sa.String(), nullable=True))
+    op.add_column('places', sa.Column('utcOffset', sa.Integer(),
+                                      nullable=True))
+
+
+def downgrade():
+    op.drop_column('places', 'utcOffset')
+    op.drop_column('places', 'hours')
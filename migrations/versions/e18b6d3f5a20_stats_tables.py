@@ -0,0 +1,84 @@
+"""stats tables
+
+Revision ID: e18b6d3f5a20
+Revises: c47a0f2e9b15
+Create Date: 2026-10-19 14:11:52.630184
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e18b6d3f5a20'
+down_revision = 'c47a0f2e9b15'
+branch_labels = None
+depends_on = None
+
+BACKFILL = (
+    '''INSERT INTO "placeStats"
+           ("userID", "placeID", visits, "firstVisit", "lastVisit")
+       SELECT up."userID", up."placeID", count(v."visitID"),
+              min(v."visitDate"), max(v."visitDate")
+       FROM "userPlaces" up
+       LEFT JOIN visits v ON v."userID" = up."userID"
+                         AND v."placeID" = up."placeID"
+       GROUP BY up."userID", up."placeID"''',
+    '''INSERT INTO "userStats" ("userID", places, "visitedPlaces", visits)
+       SELECT "userID", count(*),
+              sum(CASE WHEN visits > 0 THEN 1 ELSE 0 END), sum(visits)
+       FROM "placeStats"
+       GROUP BY "userID"''',
+)
+
+MONTH = {
+    'postgresql': '''date_trunc('month', "visitDate")::date''',
+    'sqlite': '''date("visitDate", 'start of month')''',
+}
+
+
+def upgrade():
+    op.create_table(
+        'userStats',
+        sa.Column('userID', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('places', sa.Integer(), nullable=False),
+        sa.Column('visitedPlaces', sa.Integer(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['userID'], ['users.userID'], ),
+        sa.PrimaryKeyConstraint('userID')
+    )
+    op.create_table(
+        'placeStats',
+        sa.Column('userID', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('placeID', sa.String(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=False),
+        sa.Column('firstVisit', sa.Date(), nullable=True),
+        sa.Column('lastVisit', sa.Date(), nullable=True),
+        sa.ForeignKeyConstraint(['placeID'], ['places.placeID'], ),
+        sa.ForeignKeyConstraint(['userID'], ['users.userID'], ),
+        sa.PrimaryKeyConstraint('userID', 'placeID')
+    )
+    op.create_table(
+        'monthStats',
+        sa.Column('userID', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('visits', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['userID'], ['users.userID'], ),
+        sa.PrimaryKeyConstraint('userID', 'month')
+    )
+
+    # existing lists and visits. `flask rebuild-stats` does the same
+    for statement in BACKFILL:
+        op.execute(statement)
+    month = MONTH.get(op.get_bind().dialect.name)
+    if month is not None:
+        op.execute('''INSERT INTO "monthStats" ("userID", month, visits)
+                      SELECT "userID", {0}, count(*) FROM visits
+                      GROUP BY "userID", {0}'''.format(month))
+
+
+def downgrade():
+    op.drop_table('monthStats')
+    op.drop_table('placeStats')
+    op.drop_table('userStats')
@@ -6,21 +6,41 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
 
+from project.utils.rateLimit import RateLimiter
+from project.utils.fragmentCache import FragmentCache
+from project.utils.assetUtils import Assets
+from project.utils.autocomplete import Autocomplete
+from project.utils.diskCache import DiskCache
+from project.utils.quotaUtils import usage
+from project.utils.cassette import cassette
+
 app = Flask(__name__)
 app.config.from_object(os.environ['APP_SETTINGS'])
 bcrypt = Bcrypt(app)
 db = SQLAlchemy(app)
 app.jinja_env.add_extension('jinja2.ext.do')
 migrate = Migrate(app, db)
+limiter = RateLimiter(app)
+fragments = FragmentCache(app)
+assets = Assets(app)
+autocomplete = Autocomplete(app)
+photos = DiskCache(app, 'PHOTO_CACHE')
+maps = DiskCache(app, 'MAP_CACHE')
+usage.init_app(app)
+cassette.init_app(app)
 
 from project.users.views import users_blueprint
 from project.places.views import places_blueprint
+from project.api.views import api_blueprint
 
 print(os.environ['APP_SETTINGS'])
 
 # register our blueprints
 app.register_blueprint(users_blueprint)
 app.register_blueprint(places_blueprint)
+app.register_blueprint(api_blueprint)
+
+from project import commands  # registers the cli commands
 
 
 @app.errorhandler(404)
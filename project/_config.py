@@ -14,6 +14,73 @@ class Config(object):
     TESTING = False
     SQLALCHEMY_DATABASE_URI = os.environ['RESTIES_DB_URL']
     SQLALCHEMY_TRACK_MODIFICATIONS = True
+    # google data on the details page is treated as a snapshot that is
+    # good for this many seconds before the page is rebuilt
+    PLACE_SNAPSHOT_TTL = 15 * 60
+    # most keywords and zip codes one search can fan out to
+    SEARCH_MAX_KEYWORDS = 5
+    SEARCH_MAX_ZIPS = 3
+    # zip codes are validated against the zipCodes table once it has
+    # this many (the census gazetteer, from flask load-zips, has ~33k)
+    ZIP_INDEX_COMPLETE = 30000
+    # visits shown per page, on the details and history pages
+    VISITS_PAGE_SIZE = 20
+    # most rendered template fragments each worker keeps
+    FRAGMENT_CACHE_SIZE = 512
+    # search box suggestions: seconds before a worker rebuilds an
+    # index, users whose lists each worker keeps indexed, how many of
+    # the most listed places are suggested to everyone, and how many
+    # suggestions are shown
+    AUTOCOMPLETE_TTL = 5 * 60
+    AUTOCOMPLETE_USERS = 1000
+    AUTOCOMPLETE_POPULAR = 2000
+    AUTOCOMPLETE_LIMIT = 8
+    # shortest prefix worth asking google about
+    AUTOCOMPLETE_GOOGLE_MIN = 3
+    # flask import-places: google lookups at once, most lookups a
+    # second, and rows inserted (and saved as progress) at a time
+    IMPORT_WORKERS = 4
+    IMPORT_RATE = 10
+    IMPORT_BATCH = 50
+    # place photos are proxied at this width and kept on disk, up to
+    # PHOTO_CACHE_SIZE bytes (in PHOTO_CACHE_DIR, default instance/)
+    PHOTO_MAX_WIDTH = 400
+    PHOTO_CACHE_SIZE = 200 * 1024 * 1024
+    # static map images, (width, height) by name, and the zoom they're
+    # drawn at. kept on disk like photos
+    MAP_SIZES = {'thumb': (80, 60), 'wide': (450, 275)}
+    MAP_ZOOM = 15
+    MAP_CACHE_SIZE = 50 * 1024 * 1024
+    # dollars of google calls a day, by endpoint (see quotaUtils) and
+    # in 'total'. calls that would go over fail, and pages fall back to
+    # cached or stored data. empty means no limit
+    GOOGLE_BUDGETS = {'total': 50.0}
+    # seconds between saves of each workers google usage, and days of
+    # it kept
+    GOOGLE_USAGE_FLUSH = 60
+    GOOGLE_USAGE_DAYS = 90
+    # record google's answers to GOOGLE_CASSETTE_PATH, or replay them
+    # from it without touching the network (see utils/cassette.py)
+    GOOGLE_CASSETTE_MODE = os.environ.get('GOOGLE_CASSETTE_MODE') or None
+    GOOGLE_CASSETTE_PATH = os.environ.get('GOOGLE_CASSETTE_PATH',
+                                          'google.cassette.jsonl.gz')
+    # number of proxies in front of the app (heroku's router is 1)
+    PROXY_COUNT = int(os.environ.get('PROXY_COUNT', 0))
+    # rate limits are (requests, seconds) per client IP or user
+    # set RATELIMIT_STORAGE_URL to a redis url to share across workers
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    RATELIMITS = {
+        'login': {'ip': (20, 60), 'user': (5, 60)},
+        'register': {'ip': (5, 3600)},
+        'search': {'ip': (30, 60), 'user': (20, 60)},
+        'autocomplete': {'ip': (300, 60), 'user': (120, 60)},
+        'export': {'ip': (20, 3600), 'user': (10, 3600)},
+        # photos not cached yet, which cost a google call each
+        'photo': {'ip': (120, 60), 'user': (60, 60)},
+        # maps not cached yet, other than of places in the users list
+        'map': {'ip': (120, 60), 'user': (60, 60)},
+    }
 
 
 class ProductionConfig(Config):
@@ -28,6 +95,7 @@ class StagingConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
     SQLALCHEMY_DATABASE_URI = os.environ['TEST_DB_URL']
 
 
@@ -0,0 +1,327 @@
+# project/api/views.py
+
+###############
+#   imports   #
+###############
+
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, request, session
+from flask_restful import Api, Resource, abort
+from sqlalchemy.exc import IntegrityError
+
+from project import db, limiter
+from project.models import Place, UserPlace, Visit
+from project.places.views import (addPlaceToUserList, recordVisit,
+                                  updateVisit, updateNotes, getUserPlace,
+                                  iterSearchForPlace, iterMoreResults,
+                                  milesToMeters,
+                                  getUserZip, getUserRadius)
+from project.utils.httpUtils import (makeETag, notModified,
+                                     notModifiedResponse, setETag)
+from project.utils.versionUtils import dataVersion, placeVersion
+from project.utils.pageUtils import keysetPage
+
+##############
+#   config   #
+##############
+
+api_blueprint = Blueprint('api', __name__, url_prefix='/api/v1')
+api = Api(api_blueprint)
+
+# page size if the client doesn't ask for one, and the most it can ask for
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+PLACE_FIELDS = ('placeID', 'placeName', 'notes', 'version')
+VISIT_FIELDS = ('visitID', 'placeID', 'visitDate', 'comments')
+SEARCH_FIELDS = ('placeID', 'name', 'vicinity', 'rating',
+                 'price_level', 'location', 'inList')
+
+########################
+#   helper functions   #
+########################
+
+
+def api_login_required(test):
+    '''like login_required, but answers 401 instead of redirecting'''
+    @wraps(test)
+    def wrap(*args, **kwargs):
+        if 'logged_in' in session:
+            return test(*args, **kwargs)
+        abort(401, message='You need to login first.')
+    return wrap
+
+
+def jsonBody():
+    '''the request body as a dict. only application/json bodies
+    are accepted, which browsers won't send cross site without asking'''
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, message='Expected a JSON object.')
+    return data
+
+
+def parseDate(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        abort(400, message='Dates must be formatted YYYY-MM-DD.')
+
+
+def parseFields(allowed):
+    '''fields the client asked for with ?fields=a,b (sparse fieldset).
+    all of them if it didn't ask'''
+    fields = request.args.get('fields')
+    if not fields:
+        return allowed
+    fields = tuple(f.strip() for f in fields.split(',') if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        abort(400, message='Unknown fields: {}'.format(', '.join(unknown)))
+    return fields
+
+
+def parseLimit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        abort(400, message='limit must be a number.')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def paginate(query, columns, serialize, descending=False):
+    '''a page of query for ?cursor= and ?limit=, ordered by columns'''
+    try:
+        rows, nextCursor = keysetPage(query, columns,
+                                      request.args.get('cursor'),
+                                      parseLimit(), descending)
+    except ValueError:
+        abort(400, message='Invalid cursor.')
+    return {'data': [serialize(row) for row in rows], 'next': nextCursor}
+
+
+def conditional(etag, build):
+    '''304 if the client already has etag, else the body from build()'''
+    if notModified(etag):
+        return notModifiedResponse(etag)
+    return setETag(api.make_response(build(), 200), etag)
+
+
+def sparse(row, fields):
+    return {field: row[field] for field in fields}
+
+
+def userPlacesQuery(userID):
+    return db.session.query(Place.placeID, Place.placeName,
+                            UserPlace.notes, UserPlace.version).\
+        join(UserPlace, UserPlace.placeID == Place.placeID).\
+        filter(UserPlace.userID == userID)
+
+
+def visitsQuery(userID):
+    return db.session.query(Visit.visitID, Visit.placeID,
+                            Visit.visitDate, Visit.comments).\
+        filter(Visit.userID == userID)
+
+
+def placeRow(userID, placeID):
+    row = userPlacesQuery(userID).filter(Place.placeID == placeID).first()
+    if row is None:
+        abort(404, message="That place isn't in your list.")
+    return row._asdict()
+
+
+def visitRow(visit):
+    return {'visitID': visit.visitID, 'placeID': visit.placeID,
+            'visitDate': visit.visitDate.isoformat(),
+            'comments': visit.comments}
+
+
+def getVisit(visitID):
+    visit = db.session.query(Visit).filter_by(
+        userID=session['userID'], visitID=visitID).first()
+    if visit is None:
+        abort(404, message='No such visit.')
+    return visit
+
+
+#################
+#   resources   #
+#################
+
+
+class PlaceList(Resource):
+    '''the places in the logged in users list, A-Z'''
+    decorators = [api_login_required]
+
+    def get(self):
+        fields = parseFields(PLACE_FIELDS)
+        userID = session['userID']
+        etag = makeETag('places', userID, dataVersion(userID),
+                        request.query_string)
+        return conditional(etag, lambda: paginate(
+            userPlacesQuery(userID), (Place.placeName, Place.placeID),
+            lambda row: sparse(row._asdict(), fields)))
+
+    def post(self):
+        placeID = jsonBody().get('placeID')
+        if not placeID:
+            abort(400, message='placeID is required.')
+        try:
+            addPlaceToUserList(placeID)
+        except IntegrityError:
+            db.session.rollback()
+            abort(409, message='That place is already in your list.')
+        except (KeyError, AttributeError):
+            # google didn't know the place
+            db.session.rollback()
+            abort(404, message='No such place.')
+        return placeRow(session['userID'], placeID), 201
+
+
+class PlaceItem(Resource):
+    decorators = [api_login_required]
+
+    def get(self, placeID):
+        fields = parseFields(PLACE_FIELDS)
+        userID = session['userID']
+        version = placeVersion(userID, placeID)
+        if version is None:
+            abort(404, message="That place isn't in your list.")
+        etag = makeETag('place', userID, placeID, version,
+                        request.query_string)
+        return conditional(etag, lambda: sparse(
+            placeRow(userID, placeID), fields))
+
+
+class Notes(Resource):
+    decorators = [api_login_required]
+
+    def get(self, placeID):
+        return sparse(placeRow(session['userID'], placeID),
+                      ('notes', 'version'))
+
+    def put(self, placeID):
+        notes = jsonBody().get('notes')
+        if notes is not None and not isinstance(notes, str):
+            abort(400, message='notes must be a string.')
+        version = updateNotes(session['userID'], placeID, notes)
+        if version is None:
+            abort(404, message="That place isn't in your list.")
+        return {'notes': notes, 'version': version}
+
+
+class PlaceVisits(Resource):
+    '''visits to one place, newest first'''
+    decorators = [api_login_required]
+
+    def get(self, placeID):
+        fields = parseFields(VISIT_FIELDS)
+        userID = session['userID']
+        version = placeVersion(userID, placeID)
+        if version is None:
+            abort(404, message="That place isn't in your list.")
+        etag = makeETag('visits', userID, placeID, version,
+                        request.query_string)
+        return conditional(etag, lambda: paginate(
+            visitsQuery(userID).filter(Visit.placeID == placeID),
+            (Visit.visitDate, Visit.visitID),
+            lambda row: sparse(visitRow(row), fields),
+            descending=True))
+
+    def post(self, placeID):
+        data = jsonBody()
+        if getUserPlace(placeID, session['userID']) is None:
+            abort(404, message="That place isn't in your list.")
+        visit = recordVisit(placeID, parseDate(data.get('visitDate')),
+                            data.get('comments'))
+        return visitRow(visit), 201
+
+
+class VisitList(Resource):
+    '''every visit by the logged in user, newest first'''
+    decorators = [api_login_required]
+
+    def get(self):
+        fields = parseFields(VISIT_FIELDS)
+        userID = session['userID']
+        etag = makeETag('visits', userID, dataVersion(userID),
+                        request.query_string)
+        return conditional(etag, lambda: paginate(
+            visitsQuery(userID), (Visit.visitDate, Visit.visitID),
+            lambda row: sparse(visitRow(row), fields),
+            descending=True))
+
+
+class VisitItem(Resource):
+    decorators = [api_login_required]
+
+    def get(self, visitID):
+        fields = parseFields(VISIT_FIELDS)
+        return sparse(visitRow(getVisit(visitID)), fields)
+
+    def patch(self, visitID):
+        data = jsonBody()
+        visit = getVisit(visitID)
+        visitDate = visit.visitDate
+        if 'visitDate' in data:
+            visitDate = parseDate(data['visitDate'])
+        comments = data.get('comments', visit.comments)
+        updateVisit(visit, visitDate, comments)
+        return visitRow(visit)
+
+
+class Search(Resource):
+    '''search google for places near a zip code.
+    ?q=ramen&zipCode=20001&radius=5 (radius in miles).
+    next is a token for the next page: ?token=...'''
+    decorators = [api_login_required]
+
+    @limiter.limit('search', methods=('GET',), json=True)
+    def get(self):
+        fields = parseFields(SEARCH_FIELDS)
+        token = request.args.get('token')
+        if token:
+            places = iterMoreResults(token)
+        else:
+            searchTerm = request.args.get('q', '').strip()
+            if not searchTerm:
+                abort(400, message='q is required.')
+            zipCode = request.args.get('zipCode') or getUserZip()
+            radius = request.args.get('radius') or getUserRadius()
+            try:
+                radius = milesToMeters(radius)
+            except ValueError:
+                abort(400, message='radius must be a number.')
+            places = iterSearchForPlace(searchTerm=searchTerm,
+                                        zipCode=zipCode, radius=radius)
+        data = [sparse(searchRow(place), fields) for place in places]
+        # so clients can tell these from a search with no results
+        if places.overBudget:
+            abort(503, message="Search is out of google budget for today.")
+        if places.failed:
+            abort(503, message="Couldn't reach google. Try again in a bit.")
+        return {'data': data, 'next': places.nextPageToken}
+
+
+def searchRow(place):
+    location = (place.geometry or {}).get('location')
+    return {'placeID': place.placeID, 'name': place.name,
+            'vicinity': place.vicinity, 'rating': place.rating,
+            'price_level': place.price_level, 'location': location,
+            'inList': place.inList}
+
+
+##############
+#   routes   #
+##############
+
+api.add_resource(PlaceList, '/places')
+api.add_resource(PlaceItem, '/places/<string:placeID>')
+api.add_resource(Notes, '/places/<string:placeID>/notes')
+api.add_resource(PlaceVisits, '/places/<string:placeID>/visits')
+api.add_resource(VisitList, '/visits')
+api.add_resource(VisitItem, '/visits/<int:visitID>')
+api.add_resource(Search, '/search')
@@ -0,0 +1,206 @@
+# project/commands.py
+
+'''
+Management commands. Run with the flask cli, e.g.
+
+    FLASK_APP=run.py flask build-assets
+'''
+
+import csv
+import sys
+
+import click
+
+from project import app, db
+from project.models import Place, GooglePlace, User, ZipCode
+from project.utils.assetUtils import buildAssets
+from project.utils.zipUtils import zipIndex
+from project.utils.statsUtils import rebuildStats
+from project.utils.versionUtils import bumpListVersions
+from project.utils.exportUtils import FORMATS, exportLines, gzipChunks
+from project.utils.importUtils import (ImportProgress, importPlaces,
+                                       readSavedPlaces)
+from project.utils.quotaUtils import (REPORT_GROUPS, callerAs, usage,
+                                      usageReport)
+
+# column names for zip, latitude and longitude. the census gazetteer
+# (https://www.census.gov/geographies/reference-files/time-series/geo/
+# gazetteer-files.html) uses the first of each
+ZIP_COLUMNS = ('GEOID', 'ZCTA5', 'zip', 'zipCode')
+LAT_COLUMNS = ('INTPTLAT', 'lat', 'latitude')
+LNG_COLUMNS = ('INTPTLONG', 'lng', 'lon', 'longitude')
+
+
+@app.cli.command('build-assets')
+def build_assets():
+    '''fingerprint, compress and write a manifest for static files'''
+    manifest = buildAssets(app.static_folder)
+    click.echo('built {} assets'.format(len(manifest)))
+
+
+@app.cli.command('backfill-places')
+def backfill_places():
+    '''look up the location and hours of places stored without them'''
+    places = Place.query.filter(db.or_(Place.latitude.is_(None),
+                                       Place.utcOffset.is_(None))).all()
+    filled = 0
+    with callerAs('backfill-places'):
+        for place in places:
+            try:
+                googlePlace = GooglePlace(place.placeID)
+            except AttributeError:
+                click.echo('could not look up {}'.format(place.placeID))
+                continue
+            if place.updateFromGoogle(googlePlace):
+                filled += 1
+                # the lists it's on show its map and hours
+                bumpListVersions(place.placeID)
+                db.session.commit()
+    usage.flush()
+    click.echo('updated {} of {} places'.format(filled, len(places)))
+
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats():
+    '''recompute every users stats tables from their lists and visits'''
+    users = rebuildStats()
+    db.session.commit()
+    click.echo('rebuilt stats for {} users'.format(users))
+
+
+def pickColumn(header, names):
+    for name in names:
+        if name in header:
+            return name
+    raise click.ClickException('no {} column'.format(' or '.join(names)))
+
+
+@app.cli.command('load-zips')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def load_zips(path):
+    '''add zip code centroids from a gazetteer file (tab or comma
+    separated) to the zipCodes table'''
+    with open(path, newline='') as f:
+        dialect = csv.Sniffer().sniff(f.readline(), delimiters='\t,')
+        f.seek(0)
+        reader = csv.DictReader(f, dialect=dialect)
+        # the census file pads the last header with spaces
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        zipColumn = pickColumn(reader.fieldnames, ZIP_COLUMNS)
+        latColumn = pickColumn(reader.fieldnames, LAT_COLUMNS)
+        lngColumn = pickColumn(reader.fieldnames, LNG_COLUMNS)
+        known = set(zipCode for zipCode, in db.session.query(ZipCode.zipCode))
+        batch = []
+        added = 0
+        for row in reader:
+            zipCode = row[zipColumn].strip().zfill(5)
+            if zipCode in known:
+                continue
+            known.add(zipCode)
+            batch.append({'zipCode': zipCode,
+                          'latitude': float(row[latColumn]),
+                          'longitude': float(row[lngColumn])})
+            if len(batch) == 1000:
+                db.session.bulk_insert_mappings(ZipCode, batch)
+                added += len(batch)
+                batch = []
+        db.session.bulk_insert_mappings(ZipCode, batch)
+        added += len(batch)
+    db.session.commit()
+    zipIndex.load()
+    click.echo('added {} zip codes, {} in all'.format(added, len(zipIndex)))
+
+
+@app.cli.command('export-user')
+@click.argument('userName')
+@click.option('--format', 'fmt', type=click.Choice(sorted(FORMATS)),
+              default='ndjson')
+@click.option('--gzip', 'compress', is_flag=True, help='gzip the output')
+@click.option('-o', '--output', type=click.Path(dir_okay=False),
+              help='file to write, stdout if not given')
+def export_user(username, fmt, compress, output):
+    '''write a users places, notes and visits as ndjson or csv'''
+    user = User.query.filter_by(userName=username).first()
+    if user is None:
+        raise click.ClickException('no user {}'.format(username))
+    lines = exportLines(user.userID, fmt)
+    if output:
+        out = open(output, 'wb')
+    else:
+        out = sys.stdout.buffer
+    try:
+        if compress:
+            for chunk in gzipChunks(lines):
+                out.write(chunk)
+        else:
+            for line in lines:
+                out.write(line.encode('utf-8'))
+    finally:
+        if output:
+            out.close()
+
+
+@app.cli.command('import-places')
+@click.argument('userName')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--progress', 'progressPath', type=click.Path(dir_okay=False),
+              help='progress file, to resume an import that stopped. '
+                   'defaults to PATH.progress')
+@click.option('--retry-failed', is_flag=True,
+              help='look up rows that failed last time again')
+def import_places(username, path, progressPath, retry_failed):
+    '''add saved places from a CSV (name, address, notes) or a google
+    takeout Saved Places.json to a users list'''
+    user = User.query.filter_by(userName=username).first()
+    if user is None:
+        raise click.ClickException('no user {}'.format(username))
+    with open(path, newline='', encoding='utf-8') as f:
+        try:
+            places = readSavedPlaces(f, path)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    progress = ImportProgress(progressPath or path + '.progress')
+    todo = len(progress.todo(places, retry_failed))
+    click.echo('{} places, {} to import'.format(len(places), todo))
+    done = [0]
+
+    def report(rows):
+        done[0] += len(rows)
+        for row in rows:
+            if row.get('error'):
+                click.echo('  failed: {} ({})'.format(row['name'],
+                                                      row['error']))
+        click.echo('{}/{}'.format(done[0], todo))
+
+    with callerAs('import-places', user.userID):
+        added = importPlaces(user.userID, places, progress,
+                             workers=app.config['IMPORT_WORKERS'],
+                             rate=app.config['IMPORT_RATE'],
+                             batchSize=app.config['IMPORT_BATCH'],
+                             retryFailed=retry_failed, report=report)
+    usage.flush()
+    click.echo('added {} places, {} failed in all (see {})'.format(
+        added, len(progress.failed()), progress.path))
+
+
+@app.cli.command('google-usage')
+@click.option('--days', default=7, help='days back to report, with today')
+@click.option('--by', type=click.Choice(REPORT_GROUPS), default='endpoint')
+def google_usage(days, by):
+    '''google api calls and their estimated cost'''
+    rows = usageReport(days, by)
+    budgets = app.config['GOOGLE_BUDGETS']
+    click.echo('{:<40} {:>8} {:>10}'.format(by, 'calls', 'cost'))
+    for group, calls, cost in rows:
+        click.echo('{:<40} {:>8} {:>10.2f}'.format(
+            str(group or '-'), calls, cost))
+    click.echo('{:<40} {:>8} {:>10.2f}'.format(
+        'all', sum(row[1] for row in rows), sum(row[2] for row in rows)))
+    if budgets:
+        today = usageReport(1, 'endpoint')
+        spent = dict((endpoint, cost) for endpoint, calls, cost in today)
+        spent['total'] = sum(spent.values())
+        click.echo('budgets today:')
+        for name, budget in sorted(budgets.items()):
+            click.echo('  {:<12} ${:.2f} of ${:.2f}'.format(
+                name, spent.get(name, 0), budget))
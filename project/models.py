@@ -1,12 +1,12 @@
 # project/models.py
 
 import uuid
-from os import environ
 
-import requests
 from sqlalchemy.dialects.postgresql import UUID
 
 from project import db
+from project.utils.googleUtils import placeDetails
+from project.utils.hoursUtils import Hours
 
 
 class Place(db.Model):
@@ -18,11 +18,33 @@ class Place(db.Model):
 
     placeID = db.Column(db.String, primary_key=True)
     placeName = db.Column(db.String, nullable=False)
+    # from google's geometry, for sorting a list by distance
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    # compiled weekly hours (see hoursUtils) and google's utc_offset,
+    # for telling what's open without calling google
+    hours = db.Column(db.String, nullable=True)
+    utcOffset = db.Column(db.Integer, nullable=True)
     userPlaces = db.relationship('UserPlace', backref=db.backref('place'))
 
-    def __init__(self, placeID, placeName):
+    def __init__(self, placeID, placeName, latitude=None, longitude=None):
         self.placeID = placeID
         self.placeName = placeName
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def updateFromGoogle(self, googlePlace):
+        '''copy the location and hours of a GooglePlace. returns True
+        if anything changed'''
+        hours = Hours.fromGoogle(googlePlace.opening_hours,
+                                 googlePlace.utc_offset)
+        values = googlePlace.location + (hours.toJSON() if hours else None,
+                                         googlePlace.utc_offset)
+        if values == (self.latitude, self.longitude, self.hours,
+                      self.utcOffset):
+            return False
+        self.latitude, self.longitude, self.hours, self.utcOffset = values
+        return True
 
     def __repr__(self):
         # TODO add ID to repr
@@ -45,6 +67,9 @@ class User(db.Model):
     role = db.Column(db.String, default='user')
     zipCode = db.Column(db.String, nullable=False)
     search_radius = db.Column(db.Integer, default=12, nullable=False)
+    # bumped whenever a place is added to (or removed from) the list
+    listVersion = db.Column(db.Integer, default=0, server_default='0',
+                            nullable=False)
     userPlaces = db.relationship('UserPlace', backref=db.backref('user'))
 
     def __init__(self, userName=None, fname=None, lname=None, email=None,
@@ -73,6 +98,9 @@ class UserPlace(db.Model):
     placeID = db.Column(db.String, db.ForeignKey(
         'places.placeID'), primary_key=True)
     notes = db.Column(db.String, nullable=True)
+    # bumped whenever notes or visits for this place change
+    version = db.Column(db.Integer, default=0, server_default='0',
+                        nullable=False)
 
     # something wrong here, expecting str but getting Column
     '''__table_args__ = (db.ForeignKeyConstraint(
@@ -88,12 +116,20 @@ class UserPlace(db.Model):
 class Visit(db.Model):
 
     __tablename__ = 'visits'
+    # visits are paged newest first, for one place and for everything,
+    # by seeking these to the last (visitDate, visitID) seen
+    __table_args__ = (
+        db.Index('ix_visits_user_place_date', 'userID', 'placeID',
+                 'visitDate', 'visitID'),
+        db.Index('ix_visits_user_date', 'userID', 'visitDate', 'visitID'),
+    )
 
     visitID = db.Column(db.Integer, primary_key=True)
     visitDate = db.Column(db.Date, nullable=False)
     comments = db.Column(db.String, nullable=True)
     userID = db.Column(UUID(as_uuid=True), db.ForeignKey('users.userID'))
     placeID = db.Column(db.String, db.ForeignKey('places.placeID'))
+    place = db.relationship('Place')
 
     def __init__(self, visitDate, comments, userID, placeID):
         self.visitDate = visitDate
@@ -116,6 +152,70 @@ class ZipCode(db.Model):
         self.longitude = longitude
 
 
+class UserStats(db.Model):
+    """ Running totals for a user's stats page. Kept up to date by
+    project.utils.statsUtils in the same transaction as the write. """
+    __tablename__ = 'userStats'
+
+    userID = db.Column(UUID(as_uuid=True), db.ForeignKey('users.userID'),
+                       primary_key=True)
+    places = db.Column(db.Integer, default=0, nullable=False)
+    visitedPlaces = db.Column(db.Integer, default=0, nullable=False)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+
+
+class PlaceStats(db.Model):
+    """ Visit count and first and last visit to each place in a
+    user's list. """
+    __tablename__ = 'placeStats'
+
+    userID = db.Column(UUID(as_uuid=True), db.ForeignKey('users.userID'),
+                       primary_key=True)
+    placeID = db.Column(db.String, db.ForeignKey('places.placeID'),
+                        primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+    firstVisit = db.Column(db.Date, nullable=True)
+    lastVisit = db.Column(db.Date, nullable=True)
+    place = db.relationship('Place')
+
+
+class MonthStats(db.Model):
+    """ Visits a user made in a month. month is the first of the
+    month. """
+    __tablename__ = 'monthStats'
+
+    userID = db.Column(UUID(as_uuid=True), db.ForeignKey('users.userID'),
+                       primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    visits = db.Column(db.Integer, default=0, nullable=False)
+
+
+class ApiUsage(db.Model):
+    """ Google API calls made in a day, to one endpoint, from one
+    route, for one user, and what they cost. route is 'background' and
+    userID '' for calls made outside a request. See quotaUtils. """
+    __tablename__ = 'apiUsage'
+
+    day = db.Column(db.Date, primary_key=True)
+    endpoint = db.Column(db.String, primary_key=True)
+    route = db.Column(db.String, primary_key=True)
+    # not a foreign key. usage outlives users, and calls made by no
+    # one have to go somewhere
+    userID = db.Column(db.String, primary_key=True)
+    calls = db.Column(db.Integer, default=0, nullable=False)
+    cost = db.Column(db.Float, default=0, nullable=False)
+
+
+# attributes of GooglePlace that are read from google's json
+PLACE_FIELDS = (
+    'address_components', 'adr_address', 'formatted_address',
+    'formatted_phone_number', 'geometry', 'icon',
+    'international_phone_number', 'name', 'opening_hours', 'photos',
+    'permanently_closed', 'place_id', 'price_level', 'rating', 'scope',
+    'types', 'url', 'utc_offset', 'vicinity', 'website',
+)
+
+
 class GooglePlace(object):
     """A place (usually restaurant or bar) as pulled
     Google Places API.
@@ -218,11 +318,8 @@ class GooglePlace(object):
     def __init__(self, placeID, lookup=None):
         ''' take placeID as param,
         and also lookup (which is a json response of Google data)
-        if lookup is None, we don't yet have place details, so:
-                lookup and set all other
-                attributes with placeID in this __init__
-        else if lookup False, we already have details so no need to lookup
-        use checkAttr to make sure attribute is in response
+        if lookup is None, we don't yet have place details, so
+        look them up with placeID.
 
         lookup is json response or none
         when lookup is none, thats when we're using google maps api
@@ -233,44 +330,16 @@ class GooglePlace(object):
         so we've already searched through the API, returned the json response
         and now just need to build the object.
         these will have less attributes than place lookup.
+        fields google didn't send are None.
         '''
 
         self.placeID = placeID
 
         # call function to get json object with place data
-        if not lookup:
-            self.lookup = self.lookupPlace(placeID)['result']
-            print('got lookup info for:', placeID)
-        else:
-            self.lookup = lookup
-            print('already have lookup info for:', placeID)
-
-        # set attributes
-        self.address_components = self.checkAttr(
-            self.lookup, 'address_components')
-        self.adr_address = self.checkAttr(self.lookup, 'adr_address')
-        self.formatted_address = self.checkAttr(
-            self.lookup, 'formatted_address')
-        self.formatted_phone_number = self.checkAttr(
-            self.lookup, 'formatted_phone_number')
-        self.geometry = self.checkAttr(self.lookup, 'geometry')
-        self.icon = self.checkAttr(self.lookup, 'icon')
-        self.international_phone_number = self.checkAttr(
-            self.lookup, 'international_phone_number')
-        self.name = self.checkAttr(self.lookup, 'name')
-        self.opening_hours = self.checkAttr(self.lookup, 'opening_hours')
-        self.photos = self.checkAttr(self.lookup, 'photos')
-        self.permanently_closed = self.checkAttr(
-            self.lookup, 'permanently_closed')
-        self.place_id = self.checkAttr(self.lookup, 'place_id')
-        self.price_level = self.checkAttr(self.lookup, 'price_level')
-        self.rating = self.checkAttr(self.lookup, 'rating')
-        self.scope = self.checkAttr(self.lookup, 'scope')
-        self.types = self.checkAttr(self.lookup, 'types')
-        self.url = self.checkAttr(self.lookup, 'url')
-        self.utc_offset = self.checkAttr(self.lookup, 'utc_offset')
-        self.vicinity = self.checkAttr(self.lookup, 'vicinity')
-        self.website = self.checkAttr(self.lookup, 'website')
+        if lookup is None:
+            lookup = self.lookupPlace(placeID)['result']
+        for field in PLACE_FIELDS:
+            setattr(self, field, lookup.get(field))
 
         # additional attributes
         # inList defaults to False
@@ -280,26 +349,13 @@ class GooglePlace(object):
 
     def lookupPlace(self, placeID):
         '''lookup place based on placeID and return json response'''
+        return placeDetails(placeID)
 
-        url = ('https://maps.googleapis.com/maps/api/place'
-               '/details/json?placeid={}&key={}').format(
-            placeID, environ['GOOGLE_API_RESTIES'])
-
-        request = requests.get(url)
-        if request.status_code != 200:
-            raise AttributeError('Request returned bad response')
-        else:
-            return request.json()
-
-    def checkAttr(self, lookup, attr):
-        '''because not all places return an attribute
-        use this to check if an attribute is returned or not
-        if not, set to None
-        '''
-        if attr in lookup:
-            return lookup[attr]
-        else:
-            return None
+    @property
+    def location(self):
+        '''(lat, lng) from geometry, or (None, None)'''
+        location = (self.geometry or {}).get('location') or {}
+        return location.get('lat'), location.get('lng')
 
     def __str__(self):
         return self.name
@@ -19,7 +19,8 @@ class NotesForm(Form):
 
 class SearchForm(Form):
 	searchTerm = StringField('Search')
-	zipCode = IntegerField('Zip Code')
+	# one or more, like "20001, 20009"
+	zipCode = StringField('Zip Code')
 	radius = IntegerField('Radius')
 
 	def __init__(self,zipCode,radius, *args, **kwargs):
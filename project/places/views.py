@@ -5,18 +5,45 @@
 ###############
 
 from functools import wraps
+import math
 from os import environ
+import re
 from datetime import date
-import requests
+from io import BytesIO
+import time
+from urllib.parse import urlencode
 
-from flask import (flash, redirect, render_template,
-                   request, session, url_for, Blueprint, abort)
+from flask import (flash, redirect, render_template, make_response,
+                   request, session, url_for, Blueprint, abort, current_app,
+                   jsonify, send_file, Response)
+import requests
 from sqlalchemy.exc import IntegrityError
 
-from project import db
-from project.models import Place, GooglePlace, Visit, ZipCode, User, UserPlace
+from project import db, limiter, fragments, autocomplete, photos, maps
+from project.models import (Place, GooglePlace, Visit, User,
+                            UserPlace, PlaceStats)
 from .forms import VisitForm, NotesForm, SearchForm
-from project.utils.zipUtils import zipCheck
+from project.utils.zipUtils import zipCheck, zipIndex, knownZip
+from project.utils.googleUtils import (nearbySearch, nearbySearchPage,
+                                       fanOutSearch, placeDetailsAsync,
+                                       placeAutocomplete, placePhoto,
+                                       staticMap, GOOGLE_ERRORS, TIMEOUT)
+from project.utils.versionUtils import (bumpListVersion, bumpListVersions,
+                                        bumpPlaceVersion, listVersion,
+                                        placeVersion, dataVersion)
+from project.utils.statsUtils import (recordPlaceAdded, recordVisitAdded,
+                                      recordVisitChanged, userStats)
+from project.utils.recommendUtils import overduePlaces
+from project.utils.pageUtils import decodeCursor, keysetPage
+from project.utils.httpUtils import (makeETag, pageETag, pageNotModified,
+                                     notModified, notModifiedResponse,
+                                     setETag, setImmutable, streamTemplate)
+from project.utils.rateLimit import sessionUser, tooManyRequests
+from project.utils.quotaUtils import OverBudget
+from project.utils.textSearch import searchUserPlaces
+from project.utils.autocomplete import suggestion
+from project.utils.geoUtils import nearest
+from project.utils.hoursUtils import Hours, openNow
 
 ##############
 #   config   #
@@ -24,6 +51,13 @@ from project.utils.zipUtils import zipCheck
 
 places_blueprint = Blueprint('places', __name__)
 
+# what a google photo_reference looks like
+PHOTO_REF = re.compile(r'^[\w-]{16,1024}$')
+# lat,lng in a map url
+MAP_COORDS = re.compile(r'^(-?\d{1,2}\.\d{5}),(-?\d{1,3}\.\d{5})$')
+# how far off a place can be from a map url's (rounded) spot
+MAP_SPOT = 0.00001
+
 ########################
 #   helper functions   #
 ########################
@@ -63,13 +97,57 @@ def getUserPlace(placeID, userID):
                                                  userID=userID).first()
 
 
-def getVisits(placeID):
-    if 'logged_in' not in session:
-        return None
-    else:
-        userID = session['userID']
-        return db.session.query(Visit).filter_by(userID=userID,
-                                                 placeID=placeID)
+VISIT_ORDER = (Visit.visitDate, Visit.visitID)
+
+
+def getVisits(placeID, cursor=None):
+    '''a page of the logged in users visits to placeID, newest first,
+    and the cursor for the next page'''
+    return keysetPage(
+        db.session.query(Visit).filter_by(userID=session['userID'],
+                                          placeID=placeID),
+        VISIT_ORDER, cursor,
+        current_app.config['VISITS_PAGE_SIZE'], descending=True)
+
+
+def getVisitCount(placeID):
+    '''from the stats table, rather than counting every visit'''
+    row = db.session.query(PlaceStats.visits).filter_by(
+        userID=session['userID'], placeID=placeID).first()
+    return row[0] if row else 0
+
+
+class VisitsPage(object):
+    ''' The details page's visits and visit count, queried the first
+    time the template reads them. When the visits fragment is cached
+    it never does. A bad cursor is a ValueError up front. '''
+
+    def __init__(self, placeID, cursor=None):
+        if cursor:
+            decodeCursor(cursor, VISIT_ORDER)
+        self.placeID = placeID
+        self.cursor = cursor
+        self.page = None
+        self.visitCount = None
+
+    def load(self):
+        if self.page is None:
+            self.page = getVisits(self.placeID, self.cursor)
+        return self.page
+
+    def __iter__(self):
+        return iter(self.load()[0])
+
+    @property
+    def older(self):
+        '''cursor for the next page, or None'''
+        return self.load()[1]
+
+    @property
+    def count(self):
+        if self.visitCount is None:
+            self.visitCount = getVisitCount(self.placeID)
+        return self.visitCount
 
 
 def getUserZip():
@@ -84,18 +162,88 @@ def getUserRadius():
 
 def getLatLngFromZip(zipCode):
     zipCheck(zipCode)
-    return db.session.query(ZipCode).filter_by(zipCode=zipCode).with_entities(
-        ZipCode.latitude, ZipCode.longitude).first()
-
-
-def searchForPlace(searchTerm, **kwargs):
-
-    if 'zipCode' in kwargs:
-        zipCode = kwargs['zipCode']
-        print(f'set zipcode to {zipCode}')
-    else:
-        print("didn't supply zip, so getting from user profile")
-        zipCode = getUserZip()
+    return zipIndex.lookup(zipCode)
+
+
+class SearchResults(object):
+    ''' One page of search results as GooglePlaces. Nothing is fetched
+    until it's iterated, so a streamed page can go out before google
+    answers. nextPageToken is set once the page has been fetched, and
+    count is the number of places it yielded (closed ones are left
+    out). overBudget is set instead if google's budget for today is
+    spent (and the page wasn't cached), and failed if google couldn't
+    be reached or gave a bad answer. the headers of a streamed page
+    are already sent by then, so the template says so instead. '''
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.nextPageToken = None
+        self.overBudget = False
+        self.failed = False
+        self.count = 0
+
+    def __iter__(self):
+        try:
+            page = self.fetch()
+            results = page['results']
+        except OverBudget:
+            self.overBudget = True
+            return
+        except GOOGLE_ERRORS:
+            current_app.logger.exception('google search failed')
+            self.failed = True
+            return
+        self.nextPageToken = page.get('next_page_token')
+
+        # check which places are already in the user's list in one query
+        inList = set(placeID for placeID, in db.session.query(
+            UserPlace.placeID).filter(
+            UserPlace.userID == session['userID'],
+            UserPlace.placeID.in_([r['place_id'] for r in results])))
+
+        # since search can (and most likely will) return multiple,
+        # iterate through and create Google Places out of them
+        for result in results:
+            # GooglePlace neeeds id and result
+            newPlace = GooglePlace(result['place_id'], result)
+            newPlace.inList = result['place_id'] in inList
+            # filter out anywhere permanently closed
+            # maybe keep and notify instead?
+            if not newPlace.permanently_closed:
+                self.count += 1
+                yield newPlace
+
+
+def splitKeywords(searchTerm):
+    '''"ramen OR pho, tacos" -> ['ramen', 'pho', 'tacos']'''
+    keywords = []
+    for keyword in re.split(r'\s+OR\s+|,', searchTerm):
+        keyword = keyword.strip()
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords[:current_app.config['SEARCH_MAX_KEYWORDS']]
+
+
+def splitZips(zipCodes):
+    '''"20001 OR 20009" -> ['20001', '20009']. zips known not to exist
+    are dropped'''
+    zips = []
+    for zipCode in re.findall(r'\b\d{5}\b', str(zipCodes)):
+        if zipCode not in zips and knownZip(zipCode):
+            zips.append(zipCode)
+    return zips[:current_app.config['SEARCH_MAX_ZIPS']]
+
+
+def iterSearchForPlace(searchTerm, **kwargs):
+    '''first page of places near a zip code matching searchTerm.
+    zipCode defaults to the users zip and radius (meters) to 20000.
+
+    searchTerm and zipCode can each hold several values, separated by
+    commas or OR. every keyword is searched near every zip at once
+    and the results merged'''
+    zipCodes = splitZips(kwargs.get('zipCode', ''))
+    if not zipCodes:
+        zipCodes = [getUserZip()]
     if 'radius' in kwargs:
         radius = kwargs['radius']
     else:
@@ -103,49 +251,21 @@ def searchForPlace(searchTerm, **kwargs):
         radius = 20000
 
     # get lat and lng info from zip code table
-    lat, lng = getLatLngFromZip(zipCode)
-    # generate search url
-    url = ('https://maps.googleapis.com/maps/api/place/nearbysearch/json?'
-           'location={lat},{lng}&radius={radius}&'
-           'type=food&keyword={keyword}&key={key}').format(
-        lat=lat,
-        lng=lng,
-        radius=radius,
-        keyword=searchTerm,
-        key=environ['GOOGLE_API_RESTIES']
-    )
-    # use requests to lookup place
-    print(url)
-    request = requests.get(url)
-    # ensure valid response
-    if request.status_code != 200:
-        raise AttributeError('Request returned bad response')
-
-    # if valid response, return results from json response
-    results = request.json()['results']
-
-    # create empty list to hold places
-    places = []
-    # since search can (and most likely will) return multiple,
-    # iterate through and create Google Places out of them
-    # and append to places list
-    for result in results:
-        # GooglePlace neeeds id and result
-        newPlace = GooglePlace(result['place_id'], result)
-        # filter out anywhere permanently closed
-        # maybe keep and notify instead?
-        # check if place already in user's list
-        # if so, replace key with
-
-        if db.session.query(UserPlace).\
-            filter_by(placeID=result['place_id'],
-                      userID=session['userID']).first():
-            newPlace.inList = True
-
-        if not newPlace.permanently_closed:
-            places.append(newPlace)
-
-    return places
+    locations = [tuple(getLatLngFromZip(zipCode)) for zipCode in zipCodes]
+    # search terms come in with + for spaces
+    keywords = splitKeywords(searchTerm.replace('+', ' '))
+    if not keywords:
+        return SearchResults(lambda: {'results': []})
+    if len(locations) == 1 and len(keywords) == 1:
+        lat, lng = locations[0]
+        return SearchResults(
+            lambda: nearbySearch(lat, lng, radius, keywords[0]))
+    return SearchResults(lambda: fanOutSearch(locations, radius, keywords))
+
+
+def iterMoreResults(token):
+    '''the page of search results after the one that gave out token'''
+    return SearchResults(lambda: nearbySearchPage(token))
 
 
 def addPlaceToUserList(placeID):
@@ -158,10 +278,55 @@ def addPlaceToUserList(placeID):
     newPlace = tryPlace(placeID)
     newUserPlace = UserPlace(session['userID'], placeID)
     db.session.add(newUserPlace)
+    recordPlaceAdded(session['userID'], placeID)
+    bumpListVersion(session['userID'])
     db.session.commit()
+    autocomplete.addPlace(session['userID'], placeID, newPlace.placeName)
     return newPlace
 
 
+def recordVisit(placeID, visitDate, comments):
+    '''insert a visit for the logged in user'''
+    newVisit = Visit(visitDate, comments, session['userID'], placeID)
+    db.session.add(newVisit)
+    recordVisitAdded(session['userID'], placeID, visitDate)
+    bumpPlaceVersion(session['userID'], placeID)
+    db.session.commit()
+    return newVisit
+
+
+def updateVisit(visit, visitDate, comments):
+    '''change the date and comments of an existing visit'''
+    oldDate = visit.visitDate
+    visit.visitDate = visitDate
+    visit.comments = comments
+    recordVisitChanged(visit.userID, visit.placeID, oldDate, visitDate)
+    bumpPlaceVersion(visit.userID, visit.placeID)
+    db.session.commit()
+    return visit
+
+
+def updateNotes(userID, placeID, notes):
+    '''replace the notes on a place in the users list.
+    notes and version are set in a single UPDATE.
+    returns the new version, or None if the place isn't in the users
+    list'''
+    updated = db.session.query(UserPlace).filter_by(
+        userID=userID, placeID=placeID).update(
+        {UserPlace.notes: notes, UserPlace.version: UserPlace.version + 1},
+        synchronize_session=False)
+    # read in the same transaction, so it's the version this update made
+    version = placeVersion(userID, placeID) if updated == 1 else None
+    db.session.commit()
+    fragments.invalidate(userID)
+    return version
+
+
+def getPlace(placeID):
+    '''the stored Place, for when all we need is the name'''
+    return db.session.query(Place).filter_by(placeID=placeID).first()
+
+
 def tryPlace(placeID):
     ''' Checks if a place is already in DB
     If it is not, it inserts. If it is, does nothing.
@@ -172,13 +337,88 @@ def tryPlace(placeID):
         # just to get name. Should update in future to take ID and name
         googlePlace = GooglePlace(placeID)
         place = Place(placeID, googlePlace.name)
+        place.updateFromGoogle(googlePlace)
         db.session.add(place)
         db.session.commit()
     return place
 
 
+def storedSnapshot(place):
+    '''a GooglePlace with what's stored about a Place, for when
+    google can't be asked'''
+    return GooglePlace(place.placeID, {
+        'place_id': place.placeID,
+        'name': place.placeName,
+        'geometry': {'location': {'lat': place.latitude,
+                                  'lng': place.longitude}},
+        'url': 'https://www.google.com/maps/search/?' + urlencode({
+            'api': 1, 'query': place.placeName,
+            'query_place_id': place.placeID}),
+    })
+
+
+def snapshotEpoch():
+    '''number of the current PLACE_SNAPSHOT_TTL window. google data
+    on the details page is reused (by the browser) within a window'''
+    return int(time.time() // current_app.config['PLACE_SNAPSHOT_TTL'])
+
+
+@places_blueprint.app_template_global()
+def map_url(lat, lng, size='thumb'):
+    '''url of the static map of lat, lng, or None without both.
+    coordinates are rounded (to about a meter) so each spot has one
+    url, and one cached image'''
+    if lat is None or lng is None:
+        return None
+    return url_for('places.staticMapImage', size=size,
+                   coords='{:.5f},{:.5f}'.format(lat, lng))
+
+
+def inUserList(lat, lng):
+    '''whether a place in the users list is at lat, lng (as rounded
+    by map_url)'''
+    return db.session.query(UserPlace.placeID).join(Place).filter(
+        UserPlace.userID == session['userID'],
+        Place.latitude.between(lat - MAP_SPOT, lat + MAP_SPOT),
+        Place.longitude.between(lng - MAP_SPOT, lng + MAP_SPOT)
+    ).first() is not None
+
+
+def cachedImage(cache, key, etag, limit, fetch, mimetype):
+    '''serve the image in cache under key, calling fetch() for its
+    bytes if it isn't there. only fetches count against the limit,
+    which is a name in RATELIMITS, or a function returning one (or
+    None for no limit) that's only called on a miss.
+    images never change for a url, so browsers keep them a year.
+    they're behind a login, so shared caches don't'''
+    if notModified(etag):
+        return setImmutable(Response(status=304), etag, private=True)
+    f = cache.open(key)
+    if f is None:
+        if callable(limit):
+            limit = limit()
+        if limit and current_app.config['RATELIMIT_ENABLED']:
+            retryAfter = limiter.check(limit, sessionUser)
+            if retryAfter:
+                return tooManyRequests(retryAfter)
+        try:
+            data = fetch()
+        except (AttributeError, requests.RequestException):
+            abort(404)
+        cache.put(key, data)
+        # served from memory, since another worker could evict the
+        # file before it's read
+        f = BytesIO(data)
+    return setImmutable(send_file(f, mimetype=mimetype, add_etags=False),
+                        etag, private=True)
+
+
 def milesToMeters(miles):
-    return int(int(miles) * 1609.34)
+    '''"2.5" -> 4023. ValueError if miles isn't a number'''
+    meters = float(miles) * 1609.34
+    if not math.isfinite(meters):
+        raise ValueError('radius must be finite')
+    return int(meters)
 
 ##############
 #   routes   #
@@ -187,14 +427,124 @@ def milesToMeters(miles):
 
 @places_blueprint.route('/')
 def userPlaces():
-    return render_template(
+    '''the users list, A-Z. with ?zip= (or ?lat=&lng=) and ?radius=
+    in miles, just the places that close, nearest first. with ?open=1
+    just the places open now'''
+    if 'logged_in' not in session:
+        return render_template('userPlaces.html')
+    zipCode = request.args.get('zip', '').strip()
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', type=float)
+    openOnly = request.args.get('open') == '1'
+    if zipCode or (lat is not None and lng is not None) or openOnly:
+        return filteredUserPlaces(zipCode, lat, lng, radius, openOnly)
+    version = listVersion(session['userID'])
+    etag = pageETag('userPlaces', session['userID'], version)
+    if pageNotModified(etag):
+        return notModifiedResponse(etag)
+    return setETag(streamTemplate(
         'userPlaces.html',
-        places=getUserPlaces()
-    )
+        # only queried if the list fragment isn't cached
+        places=getUserPlaces(),
+        version=version
+    ), etag)
+
+
+def filteredUserPlaces(zipCode, lat, lng, radius, openOnly):
+    '''the near me and/or open now version of the list page'''
+    near = bool(zipCode) or (lat is not None and lng is not None)
+    if zipCode:
+        if not re.match(r'^\d{5}$', zipCode) or not knownZip(zipCode):
+            flash('That zip code doesn\'t look right.')
+            return redirect(url_for('places.userPlaces'))
+        try:
+            lat, lng = getLatLngFromZip(zipCode)
+        except Exception:
+            flash('Couldn\'t find zip code {}.'.format(zipCode))
+            return redirect(url_for('places.userPlaces'))
+    elif near:
+        # label coordinates with the closest zip, if there is one
+        closest = zipIndex.nearest(lat, lng)
+        zipCode = closest[0] if closest else ''
+
+    places = getUserPlaces().with_entities(
+        Place.placeID, Place.placeName, Place.latitude, Place.longitude,
+        Place.hours, Place.utcOffset).all()
+    if openOnly:
+        isOpen = openNow(places)
+        places = [place for place, placeOpen in zip(places, isOpen)
+                  if placeOpen]
+    if near:
+        filtered = nearest(places, lat, lng, radius)
+    else:
+        filtered = [(place, None)
+                    for place in sorted(places, key=lambda p: p.placeName)]
+
+    # open now changes with the clock, so the etag is the result itself
+    etag = pageETag('filtered', session['userID'], zipCode, radius,
+                    [(place.placeID, miles) for place, miles in filtered])
+    if pageNotModified(etag):
+        return notModifiedResponse(etag)
+    return setETag(make_response(render_template(
+        'userPlaces.html',
+        filtered=filtered,
+        zipCode=zipCode,
+        radius=radius,
+        openOnly=openOnly
+    )), etag)
+
+
+@places_blueprint.route('/stats')
+@login_required
+def stats():
+    '''totals, visits by month, favorites and places not visited in a
+    while. read from the stats tables, never from visits'''
+    # days since a visit change at midnight as well as on writes
+    etag = pageETag('stats', session['userID'],
+                    dataVersion(session['userID']), date.today())
+    if pageNotModified(etag):
+        return notModifiedResponse(etag)
+    return setETag(make_response(render_template(
+        'stats.html', stats=userStats(session['userID']),
+        today=date.today())), etag)
+
+
+@places_blueprint.route('/visits')
+@login_required
+def visitHistory():
+    '''every visit, newest first, a page at a time'''
+    cursor = request.args.get('cursor')
+    etag = pageETag('visitHistory', session['userID'],
+                    dataVersion(session['userID']), cursor)
+    if pageNotModified(etag):
+        return notModifiedResponse(etag)
+    query = db.session.query(
+        Visit.visitID, Visit.visitDate, Visit.comments, Visit.placeID,
+        Place.placeName).join(Place, Place.placeID == Visit.placeID).\
+        filter(Visit.userID == session['userID'])
+    try:
+        visits, nextCursor = keysetPage(
+            query, (Visit.visitDate, Visit.visitID), cursor,
+            current_app.config['VISITS_PAGE_SIZE'], descending=True)
+    except ValueError:
+        abort(404)
+    return setETag(make_response(render_template(
+        'visits.html', visits=visits, nextCursor=nextCursor,
+        first=not cursor)), etag)
+
+
+@places_blueprint.route('/overdue')
+@login_required
+def overdue():
+    '''places in the list that are due a visit, most overdue first'''
+    return render_template('overdue.html',
+                           places=overduePlaces(session['userID']))
 
 
 @places_blueprint.route('/search', methods=['GET', 'POST'])
 @login_required
+@limiter.limit('search')
 def search():
     zipCode = getUserZip()
     radius = getUserRadius()
@@ -204,20 +554,80 @@ def search():
         searchTerm = request.form['searchTerm'].replace(' ', '+')
         zipCode = request.form['zipCode']
         radius = milesToMeters(request.form['radius'])
-        return render_template(
+        # results are fetched while the page streams
+        return streamTemplate(
             'results.html',
-            places=searchForPlace(searchTerm=searchTerm,
-                                  zipCode=zipCode,
-                                  radius=radius),
+            places=iterSearchForPlace(searchTerm=searchTerm,
+                                      zipCode=zipCode,
+                                      radius=radius),
             searchTerm=searchTerm,
             searchTermLookup=searchTerm,
             key=environ['GOOGLE_API_RESTIES'],
-            zipCode=zipCode
+            zipCode=zipCode,
+            offset=0
         )
 
     return render_template('search.html', form=form)
 
 
+@places_blueprint.route('/search/more')
+@login_required
+@limiter.limit('search', methods=('GET',))
+def moreResults():
+    '''next page of a search. the page is usually already in the search
+    cache, prefetched while the user read the previous one'''
+    token = request.args.get('token')
+    if not token:
+        return redirect(url_for('places.search'))
+    searchTerm = request.args.get('searchTerm', '')
+    # results shown on the pages before, for numbering
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    return streamTemplate(
+        'results.html',
+        places=iterMoreResults(token),
+        searchTerm=searchTerm,
+        searchTermLookup=searchTerm,
+        key=environ['GOOGLE_API_RESTIES'],
+        zipCode=request.args.get('zipCode', ''),
+        offset=offset
+    )
+
+
+@places_blueprint.route('/find')
+@login_required
+def find():
+    '''search the places, notes and visit comments in the users list'''
+    query = request.args.get('q', '').strip()
+    places = searchUserPlaces(session['userID'], query) if query else []
+    return render_template('find.html', query=query, places=places)
+
+
+@places_blueprint.route('/autocomplete')
+@limiter.limit('autocomplete', methods=('GET',), json=True)
+def autocompleteSuggestions():
+    '''suggestions for the search box as the user types. google is
+    only asked when nothing in the list or popular places matches'''
+    if 'logged_in' not in session:
+        return jsonify(message='Login required.'), 401
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify(results=[])
+    limit = current_app.config['AUTOCOMPLETE_LIMIT']
+    results = autocomplete.suggest(session['userID'], query, limit)
+    if (not results and
+            len(query) >= current_app.config['AUTOCOMPLETE_GOOGLE_MIN']):
+        lat, lng = getLatLngFromZip(getUserZip())
+        radius = milesToMeters(getUserRadius())
+        try:
+            predictions = placeAutocomplete(query, lat, lng, radius)
+        except Exception:
+            current_app.logger.exception('google autocomplete failed')
+            predictions = []
+        results = [suggestion(placeID, name, False)
+                   for placeID, name in predictions[:limit]]
+    return jsonify(results=results)
+
+
 @places_blueprint.route('/addPlace/<string:placeID>', methods=['POST'])
 @login_required
 def addPlace(placeID):
@@ -244,41 +654,113 @@ def addPlace(placeID):
 @places_blueprint.route('/details/<string:placeID>')
 @login_required
 def details(placeID):
-    place = GooglePlace(placeID)
-    if 'logged_in' in session:
-        notes = db.session.query(UserPlace).filter_by(
-            placeID=placeID, userID=session['userID']).first().notes
-    else:
-        notes = None
+    # answer revalidations before asking google for anything
+    version = placeVersion(session['userID'], placeID)
+    if version is None:
+        abort(404)
+    stored = getPlace(placeID)
+    # the page changes when the place opens or closes, even if google's
+    # data hasn't
+    hours = Hours.fromPlace(stored)
+    # ?visits= is the cursor for older visits
+    cursor = request.args.get('visits')
+    etag = pageETag('details', session['userID'], placeID, version,
+                    snapshotEpoch(), hours.status() if hours else None,
+                    cursor)
+    if pageNotModified(etag):
+        return notModifiedResponse(etag)
 
-    # add a button to edit each visit.
-    return render_template(
+    try:
+        visits = VisitsPage(placeID, cursor)
+    except ValueError:
+        abort(404)
+    # ask google for the place, and query notes while that's in
+    # flight. visits are only queried if their fragment isn't cached
+    lookup = placeDetailsAsync(placeID)
+    notes = getUserPlace(placeID, session['userID']).notes
+    snapshot = False
+    try:
+        place = GooglePlace(placeID, lookup.result(TIMEOUT)['result'])
+    except OverBudget:
+        # out of google budget for today, so show what's stored
+        snapshot = True
+        place = storedSnapshot(stored)
+    except GOOGLE_ERRORS:
+        current_app.logger.exception('google details failed')
+        flash('Couldn\'t get the details of {} from Google. Please try '
+              'again in a bit.'.format(stored.placeName))
+        return redirect(url_for('places.userPlaces'))
+    if not snapshot and stored.updateFromGoogle(place):
+        # keep the stored hours (used by the list page) fresh
+        bumpListVersions(placeID)
+        db.session.commit()
+        hours = Hours.fromPlace(stored)
+
+    response = make_response(render_template(
         # note: template uses unique api key only for displaying maps
         # when migrating to prod, restrict to only traffic from website
         'details.html',
         place=place,
         notes=notes,
-        visits=getVisits(placeID),
+        visits=visits,
+        cursor=cursor,
+        version=version,
+        epoch=snapshotEpoch(),
+        hours=hours.status() if hours else None,
+        snapshot=snapshot,
         key=environ['GOOGLE_API_RESTIES']
-    )
+    ))
+    # the browser shouldn't hang on to a snapshot once google is back
+    return response if snapshot else setETag(response, etag)
+
+
+@places_blueprint.route('/photo/<ref>')
+@login_required
+def photo(ref):
+    '''a place photo, by its google photo_reference. fetched from
+    google once and served from the disk cache after that. a ref is
+    always the same photo, so browsers keep it for a year'''
+    if not PHOTO_REF.match(ref):
+        abort(404)
+    width = current_app.config['PHOTO_MAX_WIDTH']
+    key = 'photo/{}/{}'.format(ref, width)
+    return cachedImage(photos, key, makeETag(key), 'photo',
+                       lambda: placePhoto(ref, width), 'image/jpeg')
+
+
+@places_blueprint.route('/map/<size>/<coords>.png')
+@login_required
+def staticMapImage(size, coords):
+    '''a small map of a spot (lat,lng to 5 places), from google's
+    static maps once and the disk cache after that'''
+    match = MAP_COORDS.match(coords)
+    sizes = current_app.config['MAP_SIZES']
+    if match is None or size not in sizes:
+        abort(404)
+    lat, lng = float(match.group(1)), float(match.group(2))
+    width, height = sizes[size]
+    zoom = current_app.config['MAP_ZOOM']
+    key = 'map/{}/{}x{}/{}'.format(coords, width, height, zoom)
+    # a list page asks for a thumbnail of every place on it at once,
+    # so maps of the users own places aren't limited. there are only
+    # as many as their list is long
+    return cachedImage(maps, key, makeETag(key),
+                       lambda: None if inUserList(lat, lng) else 'map',
+                       lambda: staticMap(lat, lng, width, height, zoom),
+                       'image/png')
 
 
 @places_blueprint.route('/addVisit/<string:placeID>', methods=['GET', 'POST'])
 @login_required
 def addVisit(placeID):
     error = None
-    place = GooglePlace(placeID)
+    place = getPlace(placeID)
+    if place is None:
+        abort(404)
     form = VisitForm(request.form)
     if request.method == 'POST':
         if form.validate_on_submit():
-            newVisit = Visit(
-                form.visitDate.data,
-                form.comments.data,
-                session['userID'],
-                placeID
-            )
-            db.session.add(newVisit)
-            db.session.commit()
+            recordVisit(placeID, form.visitDate.data, form.comments.data)
             flash('Visit recorded! I hope you enjoyed!')
             return redirect(url_for('places.details', placeID=placeID))
     return render_template('addVisit.html', form=form,
@@ -290,16 +772,14 @@ def addVisit(placeID):
 def editVisit(visitID):
     visit = db.session.query(Visit).filter_by(
         userID=session['userID'], visitID=visitID).first()
-    print(visitID)
-    place = GooglePlace(visit.placeID)
+    if visit is None:
+        abort(404)
+    place = visit.place
     error = None
     form = VisitForm(request.form, visitDate=visit.visitDate)
     if request.method == 'POST':
         if form.validate_on_submit():
-            print(visit.visitID)
-            visit.visitDate = form.visitDate.data
-            visit.comments = form.comments.data
-            db.session.commit()
+            updateVisit(visit, form.visitDate.data, form.comments.data)
             flash('Visit updated!')
             return redirect(url_for('places.details', placeID=visit.placeID))
     return render_template('addVisit.html', form=form,
@@ -309,13 +789,14 @@ def editVisit(visitID):
 @places_blueprint.route('/editNotes/<string:placeID>', methods=['GET', 'POST'])
 @login_required
 def editNotes(placeID):
-    '''temporary until I figure out how to javascript it in the details page'''
+    '''for browsers without javascript. details page edits notes in place'''
     error = None
     place = getUserPlace(placeID, session['userID'])
+    if place is None:
+        abort(404)
     form = NotesForm(request.form)
     if request.method == 'POST':
-        place.notes = form.notes.data
-        db.session.commit()
+        updateNotes(session['userID'], placeID, form.notes.data)
         flash('Notes updated!')
         return redirect(url_for('places.details', placeID=placeID))
     return render_template('editNotes.html', place=place,
@@ -329,7 +810,7 @@ def editNotes(placeID):
 #   --did a lot, but could do more                                            #
 #                                                                             #
 #   allow people to edit notes on places page                                 #
-#   --temp workaround is editNotes page. need JS for in page                  #
+#   --done with JS + api. editNotes page is the no-JS fallback                #
 # --also having a date auto pop'd when a note is added.
 # --maybe like a table
 #                                                                             #
@@ -340,6 +821,7 @@ def editNotes(placeID):
 #                                                                             #
 #   search bar in header                                                      #
 #   --returns places in list (if found)                                       #
+#   ----done, /find searches names, notes and visit comments                  #
 #   --and wider search                                                        #
 #   --or maybe have a radio button?                                           #
 #                                                                             #
@@ -0,0 +1,63 @@
+//suggestions for the header search box
+//choosing a place in your list opens its page, anything else gets added to it
+//if nothing is picked the form still goes to /find
+
+(function() {
+    var input = $('#header_find');
+    var list = $('#header_suggestions');
+    var suggestions = {};
+    var timer = null;
+    var last = '';
+
+    function show(results) {
+        suggestions = {};
+        list.empty();
+        $.each(results, function(i, place) {
+            suggestions[place.name] = place;
+            list.append($('<option>').attr('value', place.name)
+                .text(place.inList ? 'in your list' : 'add to your list'));
+        });
+    }
+
+    function pick(place) {
+        if (place.inList) {
+            window.location = place.url;
+        } else {
+            $('<form method="POST">').attr('action', place.url)
+                .appendTo('body').submit();
+        }
+    }
+
+    //only on an explicit choice. typing a name out in full isn't one,
+    //since picking a place not in the list adds it
+    input.on('keydown', function(e) {
+        if (e.which === 13 && suggestions[input.val()]) {
+            e.preventDefault();
+            pick(suggestions[input.val()]);
+        }
+    });
+
+    input.on('input', function(e) {
+        var q = $.trim(input.val());
+        var event = e.originalEvent;
+        //what browsers send when an option of the datalist is chosen
+        if (suggestions[input.val()] && event &&
+                event.inputType === 'insertReplacementText') {
+            pick(suggestions[input.val()]);
+            return;
+        }
+        clearTimeout(timer);
+        if (!q || q === last) {
+            return;
+        }
+        //wait for a pause in typing
+        timer = setTimeout(function() {
+            last = q;
+            $.getJSON(input.data('url'), {q: q}).done(function(data) {
+                if ($.trim(input.val()) === q) {
+                    show(data.results);
+                }
+            });
+        }, 120);
+    });
+})();
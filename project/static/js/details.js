@@ -0,0 +1,107 @@
+//in page editing of notes and visits on the details page
+//saves go straight to the json api, so nothing reloads
+//the links still work (as full pages) without javascript
+
+function sendJSON(method, url, data) {
+    return $.ajax({
+        type: method,
+        url: url,
+        data: JSON.stringify(data),
+        contentType: 'application/json',
+        dataType: 'json'
+    }).fail(function(xhr) {
+        var message = (xhr.responseJSON && xhr.responseJSON.message) || 'Something went wrong :(';
+        Materialize.toast(message, 4000);
+    });
+}
+
+//notes
+$('#notes_edit').click(function(e) {
+    e.preventDefault();
+    $('#notes_editor').removeClass('hide');
+    $('#notes_edit').addClass('hide');
+    $('#notes_input').focus().trigger('autoresize');
+});
+
+$('#notes_cancel').click(function(e) {
+    e.preventDefault();
+    $('#notes_editor').addClass('hide');
+    $('#notes_edit').removeClass('hide');
+});
+
+$('#notes_save').click(function(e) {
+    e.preventDefault();
+    sendJSON('PUT', $('#notes').data('url'), {notes: $('#notes_input').val()})
+        .done(function(data) {
+            $('#notes_text').text(data.notes || 'No notes.');
+            $('#notes_editor').addClass('hide');
+            $('#notes_edit').removeClass('hide');
+            Materialize.toast('Notes updated!', 3000);
+        });
+});
+
+//visits
+//one editor is shared by "record a visit" and every "edit" link.
+//editing holds the visit being edited, or null when adding
+var editing = null;
+
+function openVisitEditor(visit) {
+    editing = visit;
+    $('#visit_date_input').val(visit ? visit.data('date') : new Date().toISOString().slice(0, 10));
+    $('#visit_comments_input').val(visit ? visit.find('.visit_comments').text() : '');
+    $('#visit_editor').removeClass('hide');
+    $('#visit_comments_input').focus().trigger('autoresize');
+}
+
+//the list is one page of visits, so the total comes from the page
+function updateVisitCount(added) {
+    var count = $('#visit_count').data('count') + added;
+    $('#visit_count').data('count', count);
+    $('#visit_count').text(count == 1 ? "You've been here 1 time." : "You've been here " + count + " times.");
+}
+
+$('#visit_add').click(function(e) {
+    e.preventDefault();
+    openVisitEditor(null);
+});
+
+$('#visit_list').on('click', '.visit_edit', function(e) {
+    e.preventDefault();
+    openVisitEditor($(this).closest('.visit'));
+});
+
+$('#visit_cancel').click(function(e) {
+    e.preventDefault();
+    $('#visit_editor').addClass('hide');
+});
+
+$('#visit_save').click(function(e) {
+    e.preventDefault();
+    var data = {visitDate: $('#visit_date_input').val(), comments: $('#visit_comments_input').val()};
+    var saving = editing;
+    var request = saving ? sendJSON('PATCH', saving.data('url'), data)
+                         : sendJSON('POST', $('#visits').data('url'), data);
+    request.done(function(visit) {
+        var item = saving;
+        if (!item) {
+            item = $('<li class="visit">On <span class="visit_date"></span> you said: "<span class="visit_comments"></span>" <a href="#!" class="visit_edit">Edit</a></li>');
+            item.data('url', $('#visits').data('url').replace(/places\/[^\/]+\/visits$/, 'visits/' + visit.visitID));
+            $('#visit_list').prepend(item);
+        }
+        item.data('date', visit.visitDate);
+        item.find('.visit_date').text(visit.visitDate);
+        item.find('.visit_comments').text(visit.comments || '');
+        $('#visit_editor').addClass('hide');
+        updateVisitCount(saving ? 0 : 1);
+        Materialize.toast(saving ? 'Visit updated!' : 'Visit recorded! I hope you enjoyed!', 3000);
+    });
+});
+
+//map
+//the page has a static map. swap in google's embed when it's clicked
+$('#map_load').click(function(e) {
+    e.preventDefault();
+    $('<iframe width="450" height="275" frameborder="0" style="border:0" allowfullscreen>')
+        .attr('src', $('#map').data('src'))
+        .appendTo($('#map').empty());
+});
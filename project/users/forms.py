@@ -5,6 +5,8 @@ from wtforms import StringField, PasswordField, IntegerField
 from wtforms.validators import DataRequired, Length, EqualTo
 from wtforms.validators import Email, ValidationError, NumberRange
 
+from project.utils.zipUtils import knownZip
+
 
 def zipCheck(form, field):
     '''ensure zip code is numeric'''
@@ -12,6 +14,12 @@ def zipCheck(form, field):
         raise ValidationError('Zip code can only be numeric values')
 
 
+def zipExists(form, field):
+    '''ensure zip code is a real one (once we know them all)'''
+    if field.data.isnumeric() and not knownZip(field.data):
+        raise ValidationError("That zip code doesn't exist")
+
+
 class RegisterForm(Form):
     userName = StringField(
         'Username',
@@ -24,7 +32,7 @@ class RegisterForm(Form):
         validators=[DataRequired(),
                     Length(min=5, max=5,
                            message='Zip Code must be exactly 5 digits'),
-                    zipCheck]
+                    zipCheck, zipExists]
     )
     email = StringField(
         'Email',
@@ -64,7 +72,7 @@ class UpdateProfileForm(Form):
         validators=[DataRequired(),
                     Length(min=5, max=5,
                            message='Zip Code must be exactly 5 digits'),
-                    zipCheck]
+                    zipCheck, zipExists]
     )
     email = StringField(
         'Email',
@@ -8,14 +8,16 @@ from functools import wraps
 from os import environ
 import requests
 
-from flask import flash, redirect, render_template
-from flask import request, session, url_for, Blueprint
+from flask import flash, redirect, render_template, Response
+from flask import request, session, url_for, Blueprint, abort, jsonify
+from flask import stream_with_context
 from sqlalchemy.exc import IntegrityError
 
 from .forms import RegisterForm, LoginForm, UpdateProfileForm
-from project import db, bcrypt
+from project import db, bcrypt, limiter
 from project.models import User, ZipCode
 from project.utils.zipUtils import zipCheck
+from project.utils.exportUtils import FORMATS, exportLines, gzipChunks
 
 ##############
 #   config   #
@@ -42,6 +44,12 @@ def login_required(test):
     return wrap
 
 
+def loginName():
+    '''the user a login attempt is for. limiting on this
+    slows down guessing one user's password from many IPs'''
+    return request.form.get('userName')
+
+
 ##############
 #   routes   #
 ##############
@@ -59,6 +67,7 @@ def logout():
 
 
 @users_blueprint.route('/login', methods=['GET', 'POST'])
+@limiter.limit('login', userKey=loginName)
 def login():
     error = None
     form = LoginForm(request.form)
@@ -83,6 +92,7 @@ def login():
 
 
 @users_blueprint.route('/register/', methods=['GET', 'POST'])
+@limiter.limit('register')
 def register():
     error = None
     form = RegisterForm(request.form)
@@ -144,3 +154,33 @@ def update_profile():
             return redirect(url_for('users.user_info'))
     return render_template('update_profile.html', form=form, error=error, user=user)
 
+
+
+@users_blueprint.route('/export/<fmt>', methods=['GET'])
+@login_required
+@limiter.limit('export', methods=('GET',))
+def export(fmt):
+    '''download the users places, notes and visits as ndjson or csv.
+    streamed, and gzipped on the way out if the browser takes it'''
+    if fmt not in FORMATS:
+        abort(404)
+    body = exportLines(session['userID'], fmt)
+    headers = {
+        'Content-Disposition':
+            'attachment; filename=resties.{}'.format(fmt),
+        'Vary': 'Accept-Encoding',
+    }
+    if 'gzip' in request.accept_encodings:
+        body = gzipChunks(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), headers=headers,
+                    mimetype=FORMATS[fmt])
+
+
+@users_blueprint.route('/ratelimits/', methods=['GET'])
+@login_required
+def ratelimits():
+    '''counts of rate limited requests. admins only'''
+    if session.get('role') != 'admin':
+        abort(404)
+    return jsonify(limiter.counters())
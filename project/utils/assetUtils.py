@@ -0,0 +1,162 @@
+'''
+project.utils.assetUtils
+
+Fingerprinted static assets. buildAssets copies everything under
+static/ into static/dist/ with a content hash in the file name, writes
+gzip (and brotli, if installed) copies next to each compressible file,
+and records the mapping in static/dist/manifest.json.
+
+Templates link assets with asset_url('css/materialize.min.css'). Built
+assets are served from /assets/ with a year long immutable cache, since
+a changed file gets a new name. Without a manifest asset_url falls
+back to the plain /static/ url.
+'''
+import gzip
+import json
+import mimetypes
+import os
+import posixpath
+import re
+from hashlib import sha1
+
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+# already compressed formats aren't worth compressing again
+COMPRESS = ('.css', '.js', '.svg', '.eot', '.ttf', '.json', '.txt')
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def fingerprint(path, content):
+    '''css/site.css -> css/site.<hash>.css'''
+    root, ext = posixpath.splitext(path)
+    return '{}.{}{}'.format(root, sha1(content).hexdigest()[:12], ext)
+
+
+def rewriteCSS(path, content, manifest):
+    '''point url()s in a stylesheet at the fingerprinted files.
+    urls are relative to the stylesheet, and so are the rewritten ones'''
+    base = posixpath.dirname(path)
+
+    def replace(match):
+        quote, url = match.groups()
+        if re.match(r'^([a-z]+:|/|#)', url):
+            return match.group(0)
+        target = re.split(r'[?#]', url, 1)[0]
+        suffix = url[len(target):]
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        if resolved not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(manifest[resolved], base)
+        return 'url({0}{1}{2}{0})'.format(quote, hashed, suffix)
+
+    text = content.decode('utf-8')
+    return CSS_URL.sub(replace, text).encode('utf-8')
+
+
+def writeFile(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if path.endswith(COMPRESS):
+        # mtime=0 so rebuilding unchanged files gives identical output
+        with open(path + '.gz', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb',
+                               compresslevel=9, mtime=0) as f:
+                f.write(content)
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content))
+
+
+def buildAssets(staticDir):
+    '''fingerprint and compress everything in staticDir into
+    staticDir/dist. returns the manifest'''
+    outDir = os.path.join(staticDir, DIST)
+    sources = []
+    for root, dirs, files in os.walk(staticDir):
+        dirs[:] = [d for d in dirs
+                   if os.path.join(root, d) != outDir]
+        for name in files:
+            full = os.path.join(root, name)
+            sources.append(os.path.relpath(full, staticDir).replace(
+                os.sep, '/'))
+
+    # stylesheets last, so everything they point at is already hashed
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(staticDir, path), 'rb') as f:
+            content = f.read()
+        if path.endswith('.css'):
+            content = rewriteCSS(path, content, manifest)
+        manifest[path] = fingerprint(path, content)
+        writeFile(os.path.join(outDir, manifest[path]), content)
+
+    with open(os.path.join(outDir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets(object):
+    ''' Serves built assets and gives templates asset_url. '''
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.version = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.distDir = os.path.join(app.static_folder, DIST)
+        self.manifest = self.loadManifest()
+        # changes whenever any built asset does. pages link assets by
+        # their fingerprinted names, so their etags include it
+        self.version = sha1(json.dumps(
+            self.manifest, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        app.extensions['assets'] = self
+        app.add_url_rule('/assets/<path:filename>', 'assets', self.serve)
+        app.jinja_env.globals['asset_url'] = self.url
+
+    def loadManifest(self):
+        try:
+            with open(os.path.join(self.distDir, MANIFEST)) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def url(self, filename):
+        if filename in self.manifest:
+            return url_for('assets', filename=self.manifest[filename])
+        return url_for('static', filename=filename)
+
+    def serve(self, filename):
+        '''send a built asset, precompressed if the client takes it'''
+        path = os.path.realpath(os.path.join(self.distDir, filename))
+        if (not path.startswith(os.path.realpath(self.distDir) + os.sep) or
+                not os.path.isfile(path)):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or \
+            'application/octet-stream'
+        accepted = request.accept_encodings
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[candidate] and os.path.isfile(path + suffix):
+                encoding, path = candidate, path + suffix
+                break
+
+        response = send_file(path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.cache_control.public = True
+        response.cache_control.max_age = ONE_YEAR
+        response.headers['Cache-Control'] += ', immutable'
+        return response
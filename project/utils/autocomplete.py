@@ -0,0 +1,189 @@
+'''
+project.utils.autocomplete
+
+Suggestions for the header search box, answered from memory so typing
+doesn't cost a query per keystroke.
+
+Each worker keeps a PrefixIndex per recently active user (the places
+in their list) and one of the places in the most lists. An index is
+built with one query the first time it's needed and rebuilt after
+AUTOCOMPLETE_TTL seconds, which is as stale as a list can get in the
+other workers. The worker that adds a place inserts it straight into
+that user's index.
+'''
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from flask import url_for
+
+# index entries looked at per lookup. a one letter prefix can match
+# thousands, and only the best few are shown
+MAX_SCAN = 500
+
+
+def normalize(text):
+    '''lowercase words without accents, punctuation or extra spaces'''
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def nameKeys(name):
+    '''every word onwards of the normalized name, so "Range Cafe"
+    matches both "ran" and "caf"'''
+    words = normalize(name).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex(object):
+    ''' Sorted array of (key, rank, placeID), searched with bisect.
+    lower rank sorts first among matches. '''
+
+    def __init__(self, places=()):
+        self.entries = []
+        self.names = {}
+        self.lock = threading.Lock()
+        for rank, (placeID, name) in enumerate(places):
+            self.names[placeID] = name
+            self.entries.extend((key, rank, placeID)
+                                for key in nameKeys(name))
+        self.entries.sort()
+        self.built = time.time()
+
+    def __contains__(self, placeID):
+        return placeID in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, placeID, name, rank=None):
+        '''new places rank after the rest, unless given a rank'''
+        with self.lock:
+            if placeID in self.names:
+                return
+            if rank is None:
+                rank = len(self.names)
+            self.names[placeID] = name
+            for key in nameKeys(name):
+                insort(self.entries, (key, rank, placeID))
+
+    def search(self, prefix, limit=8):
+        '''(placeID, name) of up to limit places with a word starting
+        with prefix, best rank first'''
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            start = bisect_left(self.entries, (prefix,))
+            matches = {}
+            for key, rank, placeID in self.entries[start:start + MAX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                matches[placeID] = min(rank, matches.get(placeID, rank))
+        best = sorted(matches, key=lambda placeID: (
+            matches[placeID], self.names[placeID]))
+        return [(placeID, self.names[placeID]) for placeID in best[:limit]]
+
+
+class Autocomplete(object):
+    ''' The per user and popular prefix indexes of a worker. '''
+
+    def __init__(self, app=None):
+        self.users = OrderedDict()
+        self.popular = None
+        self.lock = threading.Lock()
+        self.ttl = 5 * 60
+        self.maxUsers = 1000
+        self.popularSize = 2000
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.setdefault('AUTOCOMPLETE_TTL', 5 * 60)
+        self.maxUsers = app.config.setdefault('AUTOCOMPLETE_USERS', 1000)
+        self.popularSize = app.config.setdefault('AUTOCOMPLETE_POPULAR',
+                                                 2000)
+
+    def fresh(self, index):
+        return index is not None and index.built + self.ttl > time.time()
+
+    def userIndex(self, userID):
+        userID = str(userID)
+        with self.lock:
+            index = self.users.get(userID)
+            if self.fresh(index):
+                self.users.move_to_end(userID)
+                return index
+        index = PrefixIndex(loadUserPlaces(userID))
+        with self.lock:
+            self.users[userID] = index
+            self.users.move_to_end(userID)
+            while len(self.users) > self.maxUsers:
+                self.users.popitem(last=False)
+        return index
+
+    def popularIndex(self):
+        if not self.fresh(self.popular):
+            self.popular = PrefixIndex(loadPopularPlaces(self.popularSize))
+        return self.popular
+
+    def addPlace(self, userID, placeID, placeName):
+        '''put a newly added place in the users index, if this worker
+        has one'''
+        with self.lock:
+            index = self.users.get(str(userID))
+        if index is not None:
+            index.add(placeID, placeName)
+
+    def clear(self):
+        with self.lock:
+            self.users.clear()
+            self.popular = None
+
+    def suggest(self, userID, prefix, limit=8):
+        '''places from the users list, then popular ones they don't
+        have yet. dicts of placeID, name, inList and url'''
+        mine = self.userIndex(userID)
+        suggestions = [suggestion(placeID, name, True)
+                       for placeID, name in mine.search(prefix, limit)]
+        if len(suggestions) < limit:
+            # ask for extra, some will be in the users list already
+            popular = self.popularIndex().search(prefix, limit * 2)
+            suggestions.extend(
+                suggestion(placeID, name, False)
+                for placeID, name in popular if placeID not in mine)
+        return suggestions[:limit]
+
+
+def suggestion(placeID, name, inList):
+    '''places in the list link to their page, anything else is added
+    to the list (with a POST) when picked'''
+    endpoint = 'places.details' if inList else 'places.addPlace'
+    return {'placeID': placeID, 'name': name, 'inList': inList,
+            'url': url_for(endpoint, placeID=placeID)}
+
+
+def loadUserPlaces(userID):
+    # imported here since this module is loaded before the models
+    from project import db
+    from project.models import Place, UserPlace
+    return db.session.query(Place.placeID, Place.placeName).\
+        join(UserPlace, UserPlace.placeID == Place.placeID).\
+        filter(UserPlace.userID == userID).\
+        order_by(Place.placeName).all()
+
+
+def loadPopularPlaces(size):
+    '''the places in the most lists, most popular first'''
+    from project import db
+    from project.models import Place, UserPlace
+    lists = db.func.count(UserPlace.userID)
+    return db.session.query(Place.placeID, Place.placeName).\
+        join(UserPlace, UserPlace.placeID == Place.placeID).\
+        group_by(Place.placeID, Place.placeName).\
+        order_by(lists.desc(), Place.placeName).\
+        limit(size).all()
@@ -0,0 +1,158 @@
+'''
+project.utils.cassette
+
+Recording google's answers, and playing them back.
+
+With GOOGLE_CASSETTE_MODE = 'record' every call googleUtils makes is
+also written to GOOGLE_CASSETTE_PATH: the url and params (without the
+api key), the status, the body and how long google took to answer.
+With 'replay' calls are answered from the cassette instead, after
+waiting as long as google did, and nothing goes over the network. So
+the search and details paths can be profiled and benchmarked
+repeatably against real payloads (see
+benchmarks/bench_google_replay.py).
+
+A cassette is gzipped json lines. Recording appends, so one can be
+built up over several runs (record with a single worker, though, or
+their lines get mixed up). A request recorded more than once is
+played back in the order it was recorded, then its last answer
+repeats.
+'''
+import gzip
+import json
+import threading
+import time
+from base64 import b64decode, b64encode
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode
+
+MODES = (None, 'record', 'replay')
+
+
+class CassetteMiss(AttributeError):
+    ''' A call made while replaying that the cassette doesn't have.
+    An AttributeError like any other failed google call. '''
+
+
+def requestKey(url, params):
+    '''url with its params sorted and the api key left out'''
+    return url + '?' + urlencode(sorted(
+        (name, str(value)) for name, value in params.items()
+        if name != 'key'))
+
+
+def isText(contentType):
+    return contentType.startswith('text/') or 'json' in contentType
+
+
+class Cassette(object):
+    ''' The recording, or playback, of this worker's google calls. '''
+
+    def __init__(self, app=None):
+        self.mode = None
+        self.path = None
+        # wait as long as google took when replaying
+        self.timing = True
+        # request key -> answers, in recorded order
+        self.answers = {}
+        self.played = Counter()
+        self.file = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.configure(app.config.setdefault('GOOGLE_CASSETTE_MODE', None),
+                       app.config.setdefault('GOOGLE_CASSETTE_PATH', None))
+
+    def configure(self, mode, path, timing=True):
+        if mode not in MODES:
+            raise ValueError('GOOGLE_CASSETTE_MODE is record, replay '
+                             'or nothing, not {}'.format(mode))
+        if mode and not path:
+            raise ValueError('GOOGLE_CASSETTE_PATH is needed to {}'.format(
+                mode))
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            self.mode, self.path, self.timing = mode, path, timing
+            self.answers = {}
+            self.played.clear()
+        if mode == 'replay':
+            self.load()
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def load(self):
+        answers = {}
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        answers.setdefault(entry['request'], []).append(
+                            entry)
+            except EOFError:
+                # recorded by a worker that was killed, so there's no
+                # gzip trailer. every line it flushed is there
+                pass
+        with self.lock:
+            self.answers = answers
+
+    def requests(self):
+        '''(url, params) of every request in the cassette'''
+        requests = []
+        for key in self.answers:
+            url, query = key.split('?', 1)
+            requests.append((url, dict(parse_qsl(query))))
+        return requests
+
+    def record(self, url, params, status, contentType, body, elapsed):
+        '''add one call (body is bytes) to the cassette'''
+        entry = {'request': requestKey(url, params), 'status': status,
+                 'type': contentType, 'elapsed': round(elapsed, 4)}
+        if isText(contentType):
+            entry['text'] = body.decode('utf-8')
+        else:
+            entry['base64'] = b64encode(body).decode('ascii')
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self.lock:
+            if self.file is None:
+                self.file = gzip.open(self.path, 'at', encoding='utf-8')
+            self.file.write(line)
+            # so a worker that's killed doesn't lose its last calls
+            self.file.flush()
+
+    def answer(self, url, params):
+        '''(status, contentType, body bytes, seconds to wait) recorded
+        for a request. CassetteMiss if there isn't one'''
+        key = requestKey(url, params)
+        with self.lock:
+            answers = self.answers.get(key)
+            if not answers:
+                raise CassetteMiss('nothing recorded for {}'.format(key))
+            entry = answers[min(self.played[key], len(answers) - 1)]
+            self.played[key] += 1
+        if 'text' in entry:
+            body = entry['text'].encode('utf-8')
+        else:
+            body = b64decode(entry['base64'])
+        return (entry['status'], entry['type'], body,
+                entry['elapsed'] if self.timing else 0)
+
+    def replay(self, url, params):
+        '''answer, after waiting as long as google did.
+        (status, contentType, body)'''
+        status, contentType, body, delay = self.answer(url, params)
+        time.sleep(delay)
+        return status, contentType, body
+
+
+cassette = Cassette()
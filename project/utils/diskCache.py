@@ -0,0 +1,132 @@
+'''
+project.utils.diskCache
+
+Files fetched from google (place photos, say) kept on local disk, so
+each is fetched once and served from disk after that.
+
+A cache is a directory capped at <PREFIX>_SIZE bytes. Every worker
+tracks the files in least recently used order (rebuilt from their
+mtimes at start up, and touched when used) and deletes from the old
+end when over the cap. Workers sharing a directory each evict by what
+they know, so the cap is a little soft.
+'''
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from hashlib import sha1
+
+
+class DiskCache(object):
+    ''' Size capped, LRU evicted files in a directory. Config is read
+    from <prefix>_DIR and <prefix>_SIZE. '''
+
+    def __init__(self, app=None, prefix='DISK_CACHE'):
+        self.prefix = prefix
+        self.directory = None
+        self.maxSize = 100 * 1024 * 1024
+        # file name -> size, least recently used first
+        self.files = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.setdefault(
+            self.prefix + '_DIR',
+            os.path.join(app.instance_path, self.prefix.lower()))
+        self.maxSize = app.config.setdefault(self.prefix + '_SIZE',
+                                             self.maxSize)
+        self.load()
+
+    def load(self):
+        '''pick up the files already in the directory, oldest first'''
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.'):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name, stat.st_size))
+        with self.lock:
+            self.files.clear()
+            self.size = 0
+            for mtime, name, size in sorted(found):
+                self.files[name] = size
+                self.size += size
+            self.evict()
+
+    def fileName(self, key):
+        return sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        '''path of the file for key, or None if it isn't cached'''
+        name = self.fileName(key)
+        path = os.path.join(self.directory, name)
+        try:
+            # the mtime is the recency order after a restart
+            os.utime(path)
+        except FileNotFoundError:
+            # never cached, or evicted by another worker
+            with self.lock:
+                self.size -= self.files.pop(name, 0)
+            return None
+        with self.lock:
+            if name not in self.files:
+                # cached by another worker
+                self.files[name] = os.path.getsize(path)
+                self.size += self.files[name]
+            self.files.move_to_end(name)
+        return path
+
+    def open(self, key):
+        '''the file for key, open for reading, or None if it isn't
+        cached. unlike a path, an open file can still be read after
+        another worker evicts it'''
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except FileNotFoundError:
+            # evicted since get
+            with self.lock:
+                self.size -= self.files.pop(self.fileName(key), 0)
+            return None
+
+    def put(self, key, data):
+        '''store data (bytes) for key. returns its path'''
+        name = self.fileName(key)
+        path = os.path.join(self.directory, name)
+        # written under a temporary name and renamed, so nobody sees
+        # half a file
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+        with self.lock:
+            self.size += len(data) - self.files.pop(name, 0)
+            self.files[name] = len(data)
+            self.evict()
+        return path
+
+    def evict(self):
+        '''delete least recently used files until under the cap.
+        caller holds the lock'''
+        while self.size > self.maxSize and len(self.files) > 1:
+            name, size = self.files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for name in self.files:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+            self.files.clear()
+            self.size = 0
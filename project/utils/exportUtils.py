@@ -0,0 +1,96 @@
+'''
+project.utils.exportUtils
+
+A user's data (their places with notes, then every visit) as NDJSON
+or CSV, produced a row at a time.
+
+Rows are read with yield_per, which on postgres streams them from a
+server side cursor, and each line is handed on as soon as it's
+written. So an export holds one batch of rows and one compressor in
+memory, however big the list is, whether it's going to a response or
+a file.
+'''
+import csv
+import io
+import json
+import zlib
+
+from project import db
+from project.models import Place, UserPlace, Visit
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+# CSV has one set of columns for both kinds of row. kind says which
+CSV_COLUMNS = ('kind', 'placeID', 'placeName', 'notes', 'latitude',
+               'longitude', 'visitID', 'visitDate', 'comments')
+# rows fetched from the db at a time
+BATCH = 500
+# compressed bytes gathered before they're sent
+CHUNK = 16 * 1024
+
+
+def exportRows(userID):
+    '''dicts of every place in the users list, then every visit,
+    oldest first'''
+    places = db.session.query(
+        Place.placeID, Place.placeName, UserPlace.notes, Place.latitude,
+        Place.longitude).join(UserPlace, UserPlace.placeID == Place.placeID).\
+        filter(UserPlace.userID == userID).\
+        order_by(Place.placeName, Place.placeID).yield_per(BATCH)
+    for row in places:
+        place = row._asdict()
+        place['kind'] = 'place'
+        yield place
+
+    visits = db.session.query(
+        Visit.visitID, Visit.placeID, Place.placeName, Visit.visitDate,
+        Visit.comments).join(Place, Place.placeID == Visit.placeID).\
+        filter(Visit.userID == userID).\
+        order_by(Visit.visitDate, Visit.visitID).yield_per(BATCH)
+    for row in visits:
+        visit = row._asdict()
+        visit['kind'] = 'visit'
+        visit['visitDate'] = visit['visitDate'].isoformat()
+        yield visit
+
+
+def ndjsonLines(rows):
+    for row in rows:
+        yield json.dumps(row, sort_keys=True) + '\n'
+
+
+def csvLines(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def exportLines(userID, fmt):
+    '''text lines of the users export in fmt (ndjson or csv)'''
+    lines = ndjsonLines if fmt == 'ndjson' else csvLines
+    return lines(exportRows(userID))
+
+
+def gzipChunks(lines):
+    '''gzip lines of text on the fly, in chunks of about CHUNK bytes'''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    pending = []
+    size = 0
+    for line in lines:
+        data = compressor.compress(line.encode('utf-8'))
+        if data:
+            pending.append(data)
+            size += len(data)
+            if size >= CHUNK:
+                yield b''.join(pending)
+                pending = []
+                size = 0
+    pending.append(compressor.flush())
+    yield b''.join(pending)
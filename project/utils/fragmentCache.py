@@ -0,0 +1,73 @@
+'''
+project.utils.fragmentCache
+
+Cache for rendered pieces of templates. Use it from a template with
+a call block. Everything inside is rendered once per key:
+
+    {% call fragment('userPlaces', version) %}
+      ...expensive loop...
+    {% endcall %}
+
+Keys are the fragment name, the logged in user and whatever else is
+passed (usually a data version from versionUtils), so a write that
+bumps a version makes the old entry unreachable. Write routes also
+invalidate a user's entries so they don't sit around until evicted.
+'''
+import threading
+from collections import OrderedDict
+
+from flask import session
+from markupsafe import Markup
+
+
+class FragmentCache(object):
+    ''' Bounded LRU of rendered fragments, shared by the threads
+    of a worker. '''
+
+    def __init__(self, app=None):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.maxSize = 512
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.maxSize = app.config.setdefault('FRAGMENT_CACHE_SIZE', 512)
+        app.jinja_env.globals['fragment'] = self.fragment
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, userID):
+        '''drop every fragment rendered for userID'''
+        with self.lock:
+            stale = [key for key in self.entries if key[1] == userID]
+            for key in stale:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def fragment(self, name, *keyParts, **kwargs):
+        '''template global used with {% call %}. pass shared=True for
+        fragments that look the same for every user'''
+        caller = kwargs['caller']
+        userID = None if kwargs.get('shared') else session.get('userID')
+        key = (name, userID) + keyParts
+        html = self.get(key)
+        if html is None:
+            html = Markup(caller())
+            self.set(key, html)
+        return html
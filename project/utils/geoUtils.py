@@ -0,0 +1,36 @@
+'''
+project.utils.geoUtils
+
+Distances between coordinates. Everything takes and returns degrees
+and miles. The haversine is done with numpy over whole arrays, so
+measuring a list of places from a point is one pass, not a loop.
+'''
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine(lat, lng, lats, lngs):
+    '''great circle miles from (lat, lng) to each of lats, lngs'''
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lngs = np.radians(np.asarray(lngs, dtype=float))
+    a = (np.sin((lats - lat) / 2) ** 2 +
+         np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def nearest(rows, lat, lng, radius=None):
+    '''(row, miles) for rows with .latitude and .longitude, closest
+    first. rows without a location are left out, and so are rows
+    farther than radius miles if it's given'''
+    rows = [row for row in rows if row.latitude is not None and
+            row.longitude is not None]
+    if not rows:
+        return []
+    miles = haversine(lat, lng, [row.latitude for row in rows],
+                      [row.longitude for row in rows])
+    order = np.argsort(miles, kind='stable')
+    if radius is not None:
+        order = order[miles[order] <= radius]
+    return [(rows[i], float(miles[i])) for i in order]
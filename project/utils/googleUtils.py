@@ -0,0 +1,404 @@
+'''
+project.utils.googleUtils
+
+Calls to the Google Places and Geocoding APIs, and the search cache.
+
+Every call goes through googleGet (blocking, with requests) or
+asyncGoogle (asyncio, with aiohttp). asyncGoogle runs its own event
+loop in a thread of each worker, so a sync Flask view can start a call,
+do other work (like its db queries) while it's in flight, and then
+wait for the result.
+
+Nearby search returns 20 results a page, plus a next_page_token for
+the next page. A token isn't valid until a couple of seconds after
+it's issued, so as soon as a page comes back the next one is fetched
+in the background (waiting out that delay) and put in the cache, where
+it's usually waiting by the time the user asks for more.
+
+Every call is counted (and checked against the daily budgets) by
+quotaUtils, and can be recorded to or replayed from a cassette (see
+cassette). Work handed to another thread is wrapped in bindCaller so
+its calls are still counted against the route that started it.
+'''
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from os import environ
+
+import aiohttp
+import requests
+
+from project.utils.quotaUtils import usage, bindCaller, caller, OverBudget
+from project.utils.cassette import cassette
+
+logger = logging.getLogger(__name__)
+
+NEARBY_URL = 'https://maps.googleapis.com/maps/api/place/nearbysearch/json'
+DETAILS_URL = 'https://maps.googleapis.com/maps/api/place/details/json'
+GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+AUTOCOMPLETE_URL = \
+    'https://maps.googleapis.com/maps/api/place/autocomplete/json'
+FIND_PLACE_URL = \
+    'https://maps.googleapis.com/maps/api/place/findplacefromtext/json'
+PHOTO_URL = 'https://maps.googleapis.com/maps/api/place/photo'
+STATIC_MAP_URL = 'https://maps.googleapis.com/maps/api/staticmap'
+# names the calls are counted (and budgeted) under
+ENDPOINTS = {
+    NEARBY_URL: 'nearby',
+    DETAILS_URL: 'details',
+    GEOCODE_URL: 'geocode',
+    AUTOCOMPLETE_URL: 'autocomplete',
+    FIND_PLACE_URL: 'findPlace',
+    PHOTO_URL: 'photo',
+    STATIC_MAP_URL: 'staticMap',
+}
+
+# seconds to wait for google before giving up
+TIMEOUT = 10
+# what a failed call can raise, sync or async: a bad status (an
+# AttributeError, as OverBudget is), the network or a timeout, or an
+# answer missing what we expected in it
+GOOGLE_ERRORS = (AttributeError, KeyError, ValueError,
+                 requests.RequestException, aiohttp.ClientError,
+                 asyncio.TimeoutError, FutureTimeout)
+
+# seconds before google will accept a new next_page_token
+NEXT_PAGE_DELAY = 2
+# times to try a token that google says isn't valid (yet)
+NEXT_PAGE_ATTEMPTS = 5
+
+# background prefetches, shared by every request in this worker
+executor = ThreadPoolExecutor(max_workers=4)
+# searches that run side by side for one request. separate from the
+# prefetches, which spend most of their time sleeping
+searchExecutor = ThreadPoolExecutor(max_workers=8)
+# reciprocal rank fusion constant. bigger flattens the difference
+# between ranks when merging results of several searches
+RRF_K = 10
+
+
+class TTLCache(object):
+    ''' Thread safe LRU cache whose entries expire after ttl seconds. '''
+
+    def __init__(self, maxSize=256, ttl=600):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+
+class SearchCache(TTLCache):
+    ''' Pages of nearby search results, keyed by the search for first
+    pages and by next_page_token for the rest. Also tracks next pages
+    that are being prefetched so a request for one waits for the
+    prefetch instead of fetching it again. '''
+
+    def __init__(self, maxSize=256, ttl=600):
+        TTLCache.__init__(self, maxSize, ttl)
+        self.pending = {}
+
+    def prefetch(self, token):
+        '''start fetching the page for token in the background'''
+        with self.lock:
+            if token in self.pending:
+                return
+            self.pending[token] = executor.submit(
+                bindCaller(self.fetchNext), token, NEXT_PAGE_DELAY)
+
+    def fetchNext(self, token, delay):
+        try:
+            page = fetchNextPage(token, delay)
+            self.set(('page', token), page)
+            return page
+        finally:
+            with self.lock:
+                self.pending.pop(token, None)
+
+    def nextPage(self, token):
+        '''page for token, from the cache, a running prefetch,
+        or google, in that order'''
+        page = self.get(('page', token))
+        if page is not None:
+            return page
+        with self.lock:
+            future = self.pending.get(token)
+        if future is not None:
+            return future.result()
+        # the prefetch happened in another worker, or has expired.
+        # the token is at least a request old, so try it right away
+        return self.fetchNext(token, 0)
+
+
+searchCache = SearchCache()
+# autocomplete predictions. people type the same prefixes a lot
+autocompleteCache = TTLCache(maxSize=1024, ttl=3600)
+# find place matches, for imports run again after failing part way
+findPlaceCache = TTLCache(maxSize=4096, ttl=24 * 3600)
+
+
+def fetch(url, params):
+    '''GET a google api url, or its answer from the cassette.
+    returns (status, content type, body bytes)'''
+    endpoint = ENDPOINTS[url]
+    usage.check(endpoint)
+    if cassette.replaying:
+        answer = cassette.replay(url, params)
+    else:
+        params['key'] = environ['GOOGLE_API_RESTIES']
+        started = time.time()
+        request = requests.get(url, params=params, timeout=TIMEOUT)
+        answer = (request.status_code,
+                  request.headers.get('Content-Type', ''), request.content)
+        if cassette.recording:
+            cassette.record(url, params, *answer,
+                            elapsed=time.time() - started)
+    usage.record(endpoint)
+    return answer
+
+
+def googleGet(url, **params):
+    '''GET a google api url and return the json'''
+    status, contentType, body = fetch(url, params)
+    if status != 200:
+        raise AttributeError('Request returned bad response')
+    return json.loads(body.decode('utf-8'))
+
+
+def googleImage(url, **params):
+    '''GET a google api url that answers with an image (after a
+    redirect). returns the bytes'''
+    status, contentType, body = fetch(url, params)
+    if status != 200 or not contentType.startswith('image/'):
+        raise AttributeError('Request returned bad response')
+    return body
+
+
+class AsyncGoogleClient(object):
+    ''' Runs google calls on an asyncio event loop in a background
+    thread, one per worker process. submit() can be called from any
+    thread and returns a concurrent.futures.Future.
+
+    The loop is started on first use, and again after a fork (gunicorn
+    forks workers from a parent that may have imported this). '''
+
+    def __init__(self):
+        self.loop = None
+        self.session = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None and self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.session = None
+            self.loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=self.loop.run_forever,
+                                      name='google-asyncio', daemon=True)
+            thread.start()
+
+    async def get(self, url, params, who):
+        # checked and counted here, on the loop, so an OverBudget
+        # comes out of the future like any other failure
+        usage.check(ENDPOINTS[url])
+        if cassette.replaying:
+            status, contentType, body, delay = cassette.answer(url, params)
+            await asyncio.sleep(delay)
+        else:
+            status, contentType, body = await self.request(url, params)
+        usage.record(ENDPOINTS[url], who)
+        if status != 200:
+            raise AttributeError('Request returned bad response')
+        return json.loads(body.decode('utf-8'))
+
+    async def request(self, url, params):
+        if self.session is None:
+            # made on the loop's thread, which is where it's used
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=TIMEOUT))
+        params = {name: str(value) for name, value in params.items()}
+        params['key'] = environ['GOOGLE_API_RESTIES']
+        started = self.loop.time()
+        async with self.session.get(url, params=params) as response:
+            answer = (response.status,
+                      response.headers.get('Content-Type', ''),
+                      await response.read())
+        if cassette.recording:
+            cassette.record(url, params, *answer,
+                            elapsed=self.loop.time() - started)
+        return answer
+
+    def submit(self, url, **params):
+        '''start a GET of a google api url. the future's result is
+        the json'''
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self.get(url, params, caller()), self.loop)
+
+
+asyncGoogle = AsyncGoogleClient()
+
+
+def placeDetails(placeID):
+    '''json details for placeID'''
+    return googleGet(DETAILS_URL, placeid=placeID)
+
+
+def placeDetailsAsync(placeID):
+    '''start looking up details for placeID. returns a future'''
+    return asyncGoogle.submit(DETAILS_URL, placeid=placeID)
+
+
+def geocode(address):
+    '''json geocoding results for address'''
+    return googleGet(GEOCODE_URL, address=address)
+
+
+def placePhoto(ref, maxWidth):
+    '''jpeg bytes of a place photo, by its photo_reference, scaled
+    down to maxWidth pixels wide'''
+    return googleImage(PHOTO_URL, photoreference=ref, maxwidth=maxWidth)
+
+
+def staticMap(lat, lng, width, height, zoom):
+    '''png bytes of a width x height map (at twice the pixels, for
+    high dpi screens) centered on lat, lng with a marker there'''
+    return googleImage(STATIC_MAP_URL, center='{},{}'.format(lat, lng),
+                       zoom=zoom, size='{}x{}'.format(width, height),
+                       scale=2, format='png',
+                       markers='{},{}'.format(lat, lng))
+
+
+def placeAutocomplete(text, lat, lng, radius):
+    '''(placeID, name) of establishments google predicts for text,
+    favoring ones within radius meters of lat, lng'''
+    key = (text.lower(), round(lat, 2), round(lng, 2), radius)
+    predictions = autocompleteCache.get(key)
+    if predictions is None:
+        response = googleGet(AUTOCOMPLETE_URL, input=text,
+                             types='establishment', radius=radius,
+                             location='{},{}'.format(lat, lng))
+        predictions = [
+            (prediction['place_id'],
+             prediction.get('structured_formatting', {}).get(
+                 'main_text', prediction['description']))
+            for prediction in response.get('predictions', [])]
+        autocompleteCache.set(key, predictions)
+    return predictions
+
+
+def findPlace(text, lat=None, lng=None):
+    '''google's best match for a name and/or address, as a dict of
+    place_id, name and geometry. None if nothing matches. biased
+    towards lat, lng if given'''
+    key = (text.lower(), lat, lng)
+    candidates = findPlaceCache.get(key)
+    if candidates is None:
+        params = {'input': text, 'inputtype': 'textquery',
+                  'fields': 'place_id,name,geometry'}
+        if lat is not None and lng is not None:
+            params['locationbias'] = 'point:{},{}'.format(lat, lng)
+        candidates = googleGet(FIND_PLACE_URL, **params).get(
+            'candidates', [])
+        findPlaceCache.set(key, candidates)
+    return candidates[0] if candidates else None
+
+
+def fetchNextPage(token, delay):
+    '''fetch the page for a next_page_token, waiting out the delay
+    before google activates it'''
+    time.sleep(delay)
+    for attempt in range(NEXT_PAGE_ATTEMPTS):
+        page = googleGet(NEARBY_URL, pagetoken=token)
+        if page.get('status') != 'INVALID_REQUEST':
+            return page
+        time.sleep(NEXT_PAGE_DELAY / 2.0)
+    raise AttributeError('next_page_token never became valid')
+
+
+def nearbySearch(lat, lng, radius, keyword, prefetch=True):
+    '''first page of places matching keyword within radius meters of
+    lat, lng. starts prefetching the second page'''
+    key = ('search', round(lat, 5), round(lng, 5), radius, keyword)
+    page = searchCache.get(key)
+    if page is None:
+        page = googleGet(NEARBY_URL, location='{},{}'.format(lat, lng),
+                         radius=radius, type='food', keyword=keyword)
+        searchCache.set(key, page)
+    if prefetch and page.get('next_page_token'):
+        searchCache.prefetch(page['next_page_token'])
+    return page
+
+
+def fanOutSearch(locations, radius, keywords):
+    '''search every keyword near every (lat, lng) in locations at the
+    same time, and merge the first pages into one page.
+
+    places found by more than one search, or ranked higher, come first
+    (reciprocal rank fusion), with google's rating breaking ties.
+    takes about as long as the slowest single search'''
+    search = bindCaller(nearbySearch)
+    futures = [searchExecutor.submit(search, lat, lng, radius, keyword,
+                                     False)
+               for lat, lng in locations for keyword in keywords]
+
+    scores = {}
+    places = {}
+    failures = 0
+    overBudget = None
+    for future in futures:
+        try:
+            page = future.result()
+        except OverBudget as e:
+            overBudget = e
+            failures += 1
+            continue
+        except Exception:
+            logger.exception('one search of a fan out failed')
+            failures += 1
+            continue
+        for rank, result in enumerate(page.get('results', [])):
+            placeID = result['place_id']
+            places.setdefault(placeID, result)
+            scores[placeID] = scores.get(placeID, 0) + 1.0 / (RRF_K + rank)
+    if failures == len(futures):
+        raise overBudget or AttributeError('Request returned bad response')
+
+    ranked = sorted(places, key=lambda placeID: (
+        -scores[placeID], -(places[placeID].get('rating') or 0)))
+    return {'results': [places[placeID] for placeID in ranked]}
+
+
+def nearbySearchPage(token):
+    '''the page after the one that gave out token. starts prefetching
+    the page after that'''
+    page = searchCache.nextPage(token)
+    if page.get('next_page_token'):
+        searchCache.prefetch(page['next_page_token'])
+    return page
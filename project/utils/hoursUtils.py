@@ -0,0 +1,171 @@
+'''
+project.utils.hoursUtils
+
+Opening hours, worked out locally instead of trusting google's
+open_now (which is stale as soon as it's cached).
+
+google gives opening_hours.periods, each an open and close day (0 is
+Sunday) and HHMM time in the place's own time, and utc_offset in
+minutes. compileHours turns those into minutes of the week, as a
+sorted list of [start, end) intervals with the ones that run past
+Saturday night split in two. That's small enough to store on the
+Place, so the list page can tell what's open without calling google.
+'''
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+
+WEEK = 7 * 24 * 60
+DAY = 24 * 60
+DAY_NAMES = ('Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat')
+
+
+def periodMinute(point):
+    '''{'day': 1, 'time': '1130'} -> minutes since sunday midnight'''
+    time = point['time']
+    return point['day'] * DAY + int(time[:2]) * 60 + int(time[2:])
+
+
+def compileHours(periods):
+    '''sorted, merged [start, end) week minutes the place is open.
+    None if google didn't give hours'''
+    if not periods:
+        return None
+    intervals = []
+    for period in periods:
+        start = periodMinute(period['open'])
+        if 'close' not in period:
+            # google's way of saying open all the time
+            return [[0, WEEK]]
+        end = periodMinute(period['close'])
+        if end <= start:
+            end += WEEK
+        if end > WEEK:
+            intervals.extend([[start, WEEK], [0, end - WEEK]])
+        else:
+            intervals.append([start, end])
+    intervals.sort()
+    merged = [intervals[0]]
+    for start, end in intervals[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def weekMinute(utcOffset, now=None):
+    '''minute of the week right now where the place is'''
+    local = (now or datetime.utcnow()) + timedelta(minutes=utcOffset or 0)
+    # python's week starts monday, google's sunday
+    return ((local.weekday() + 1) % 7) * DAY + local.hour * 60 + local.minute
+
+
+def formatMinute(minute, withDay=False):
+    '''week minute -> "9:30 PM", or "Tue 9:30 PM"'''
+    minute %= WEEK
+    hour, mins = divmod(minute % DAY, 60)
+    text = '{}:{:02d} {}'.format(hour % 12 or 12, mins,
+                                 'AM' if hour < 12 else 'PM')
+    if withDay:
+        text = '{} {}'.format(DAY_NAMES[minute // DAY], text)
+    return text
+
+
+class Hours(object):
+    ''' Compiled hours of one place. '''
+
+    def __init__(self, intervals, utcOffset):
+        self.intervals = intervals
+        self.utcOffset = utcOffset or 0
+
+    @classmethod
+    def fromGoogle(cls, openingHours, utcOffset):
+        '''from a GooglePlace's opening_hours and utc_offset, or None'''
+        intervals = compileHours((openingHours or {}).get('periods'))
+        if intervals is None:
+            return None
+        return cls(intervals, utcOffset)
+
+    @classmethod
+    def fromPlace(cls, place):
+        '''from a Place's stored hours, or None'''
+        if not place.hours:
+            return None
+        return cls(json.loads(place.hours), place.utcOffset)
+
+    def toJSON(self):
+        return json.dumps(self.intervals, separators=(',', ':'))
+
+    def alwaysOpen(self):
+        return self.intervals == [[0, WEEK]]
+
+    def containing(self, minute):
+        for start, end in self.intervals:
+            if start <= minute < end:
+                return end
+        return None
+
+    def isOpen(self, now=None):
+        return self.containing(weekMinute(self.utcOffset, now)) is not None
+
+    def closesAt(self, now=None):
+        '''week minute the place next closes if it's open now, else
+        None. None too if it never closes'''
+        minute = weekMinute(self.utcOffset, now)
+        end = self.containing(minute)
+        if end is None or self.alwaysOpen():
+            return None
+        if end == WEEK and self.intervals[0][0] == 0:
+            # open through saturday midnight into sunday
+            end = WEEK + self.intervals[0][1]
+        return end
+
+    def opensNext(self, now=None):
+        '''week minute the place next opens if it's closed now,
+        else None'''
+        minute = weekMinute(self.utcOffset, now)
+        if self.containing(minute) is not None:
+            return None
+        for start, end in self.intervals:
+            if start > minute:
+                return start
+        return self.intervals[0][0] + WEEK
+
+    def status(self, now=None):
+        '''what the details page says: open or not, and when that
+        changes as text ("9:30 PM", or "Tue 11:00 AM" if not today)'''
+        minute = weekMinute(self.utcOffset, now)
+        isOpen = self.containing(minute) is not None
+        change = self.closesAt(now) if isOpen else self.opensNext(now)
+        text = None
+        if change is not None:
+            text = formatMinute(change, withDay=change // DAY != minute // DAY)
+        return {'open': isOpen, 'change': text}
+
+
+def openNow(places, now=None):
+    '''numpy bool array, True where the place (a row with hours and
+    utcOffset) is open now. places without hours are False.
+
+    every interval of every place is checked in one pass'''
+    starts, ends, owners, offsets = [], [], [], []
+    for i, place in enumerate(places):
+        offsets.append(place.utcOffset or 0)
+        for start, end in json.loads(place.hours) if place.hours else ():
+            starts.append(start)
+            ends.append(end)
+            owners.append(i)
+    if not starts:
+        return np.zeros(len(offsets), dtype=bool)
+
+    # minute of the week at each place, as weekMinute does it
+    now = now or datetime.utcnow()
+    utcMinute = (((now.weekday() + 1) % 7) * DAY + now.hour * 60 +
+                 now.minute)
+    minutes = (utcMinute + np.array(offsets)) % WEEK
+    owners = np.array(owners)
+    local = minutes[owners]
+    inside = (np.array(starts) <= local) & (local < np.array(ends))
+    return np.bincount(owners[inside], minlength=len(offsets)) > 0
@@ -0,0 +1,73 @@
+'''
+project.utils.httpUtils
+
+Helpers for conditional (etag) and streamed responses
+'''
+from hashlib import sha1
+
+from flask import (Response, current_app, get_flashed_messages, request,
+                   session, stream_with_context)
+from werkzeug.http import quote_etag
+
+
+def makeETag(*parts):
+    '''weak etag built from whatever identifies a version of a response,
+    usually the user, a data version and any request args'''
+    digest = sha1('|'.join(str(part) for part in parts).encode('utf-8'))
+    return digest.hexdigest()[:20]
+
+
+def pageETag(*parts):
+    '''makeETag for html pages, which also change when the assets
+    they link to are rebuilt'''
+    assets = current_app.extensions.get('assets')
+    return makeETag(*parts + (assets.version if assets else '',))
+
+
+def notModified(etag):
+    '''True if the client already has the response with this etag'''
+    return request.if_none_match.contains_weak(etag)
+
+
+def pageNotModified(etag):
+    '''notModified for html pages. a page with flashed messages
+    waiting to be shown is always rendered'''
+    return '_flashes' not in session and notModified(etag)
+
+
+def notModifiedResponse(etag):
+    return setETag(Response(status=304), etag)
+
+
+def setETag(response, etag):
+    '''add the weak etag to a response. no-cache makes the browser
+    revalidate each time, which is cheap once it has an etag'''
+    response.headers['ETag'] = quote_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def setImmutable(response, etag, maxAge=365 * 24 * 3600, private=False):
+    '''add a strong etag and let anyone (browsers and proxies) cache
+    the response for maxAge seconds without asking again. for
+    responses that never change for a url. private ones (behind a
+    login) are only kept by the browser'''
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = '{}, max-age={}, immutable'.format(
+        'private' if private else 'public', maxAge)
+    return response
+
+
+def streamTemplate(name, bufferSize=5, **context):
+    '''render a template as a stream so the page shell reaches the
+    browser while the rest (say, a loop over search results still
+    being fetched) is produced. bufferSize is how many template
+    chunks are sent at a time'''
+    app = current_app._get_current_object()
+    # flashes are popped from the session, and the session cookie is
+    # written before the body streams, so pop them now
+    get_flashed_messages()
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(name).stream(context)
+    stream.enable_buffering(bufferSize)
+    return Response(stream_with_context(stream))
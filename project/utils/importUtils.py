@@ -0,0 +1,272 @@
+'''
+project.utils.importUtils
+
+Bulk import of saved places into a user's list, from a CSV of names
+and addresses (Google Maps' saved list CSVs work as is) or a Google
+Takeout "Saved Places.json".
+
+Rows without a place id are matched with google's find place,
+IMPORT_WORKERS at a time on a thread pool and throttled to IMPORT_RATE
+calls a second. Places already in the places table aren't looked up again,
+new ones get their details (for location and hours) the same way.
+Each batch of IMPORT_BATCH rows is inserted with bulk inserts and
+committed, then written to the progress file, so an import that
+stops part way picks up after the last batch when run again.
+'''
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+from project import db
+from project.models import GooglePlace, Place, PlaceStats, UserPlace, \
+    UserStats
+from project.utils.googleUtils import findPlace
+from project.utils.quotaUtils import bindCaller
+from project.utils.rateLimit import MemoryStore
+from project.utils.statsUtils import increment
+from project.utils.versionUtils import bumpListVersion
+
+NAME_COLUMNS = ('name', 'Name', 'title', 'Title')
+ADDRESS_COLUMNS = ('address', 'Address')
+NOTES_COLUMNS = ('notes', 'Notes', 'note', 'Note', 'comment', 'Comment')
+URL_COLUMNS = ('url', 'URL')
+PLACE_ID_COLUMNS = ('placeID', 'place_id')
+
+
+def pick(row, names):
+    '''first of the columns in row that has a value, else None'''
+    for name in names:
+        value = (row.get(name) or '').strip()
+        if value:
+            return value
+    return None
+
+
+def urlPlaceID(url):
+    '''the place id in a google maps url, if it has one. most saved
+    place urls only have a cid, which the places api doesn't take'''
+    query = parse_qs(urlparse(url or '').query)
+    for name in ('query_place_id', 'place_id'):
+        if query.get(name):
+            return query[name][0]
+    return None
+
+
+def savedPlace(name, address=None, notes=None, url=None, placeID=None,
+               lat=None, lng=None):
+    '''one row to import. key identifies it in the progress file'''
+    placeID = placeID or urlPlaceID(url)
+    return {'key': placeID or url or '{}|{}'.format(name, address or ''),
+            'name': name, 'address': address, 'notes': notes,
+            'placeID': placeID, 'lat': lat, 'lng': lng}
+
+
+def readCSV(f):
+    '''saved places from a CSV with a name column, and optionally
+    address, notes, url and placeID columns. ValueError if there's no
+    name column'''
+    reader = csv.DictReader(f)
+    if not set(reader.fieldnames or ()) & set(NAME_COLUMNS):
+        raise ValueError('no name column')
+    places = []
+    for row in reader:
+        name = pick(row, NAME_COLUMNS)
+        if name:
+            places.append(savedPlace(
+                name, pick(row, ADDRESS_COLUMNS), pick(row, NOTES_COLUMNS),
+                pick(row, URL_COLUMNS), pick(row, PLACE_ID_COLUMNS)))
+    return places
+
+
+def readTakeout(f):
+    '''saved places from a takeout geojson file. takeout has used
+    both "Title"/"Location" and "location"/"google_maps_url"'''
+    try:
+        features = json.load(f)['features']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('not a takeout saved places file')
+    places = []
+    for feature in features:
+        properties = feature.get('properties') or {}
+        location = properties.get('location') or \
+            properties.get('Location') or {}
+        name = location.get('name') or location.get('Business Name') or \
+            properties.get('Title')
+        if not name:
+            continue
+        lng, lat = ((feature.get('geometry') or {}).get('coordinates') or
+                    (0, 0))[:2]
+        if (lat, lng) == (0, 0):
+            # what takeout gives when it doesn't know
+            lat = lng = None
+        places.append(savedPlace(
+            name, location.get('address') or location.get('Address'),
+            properties.get('Comment'),
+            properties.get('google_maps_url') or
+            properties.get('Google Maps URL'), lat=lat, lng=lng))
+    return places
+
+
+def readSavedPlaces(f, path):
+    '''readTakeout for .json files, readCSV for anything else'''
+    if path.lower().endswith('.json'):
+        return readTakeout(f)
+    return readCSV(f)
+
+
+class Throttle(object):
+    ''' Spaces out calls from any number of threads to rate a second,
+    allowing short bursts of up to burst calls. '''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.store = MemoryStore()
+
+    def wait(self):
+        while True:
+            allowed, retryAfter = self.store.take(
+                'calls', self.burst, self.rate, time.time())
+            if allowed:
+                return
+            time.sleep(retryAfter)
+
+
+class ImportProgress(object):
+    ''' What's been done in an import: one json line per row, with
+    its key, placeID if it was imported and error if it wasn't.
+    Kept in memory only if there's no path. '''
+
+    def __init__(self, path=None):
+        self.path = path
+        self.rows = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self.rows[row['key']] = row
+
+    def failed(self):
+        return [row for row in self.rows.values() if row.get('error')]
+
+    def todo(self, places, retryFailed=False):
+        '''places not done yet. failed ones are left out unless
+        retryFailed, since they'd most likely fail again'''
+        return [place for place in places
+                if place['key'] not in self.rows or
+                (retryFailed and self.rows[place['key']].get('error'))]
+
+    def record(self, rows):
+        for row in rows:
+            self.rows[row['key']] = row
+        if self.path:
+            with open(self.path, 'a') as f:
+                for row in rows:
+                    f.write(json.dumps(row, sort_keys=True) + '\n')
+
+
+def resolve(place, throttle):
+    '''place id of a saved place. raises LookupError if google can't
+    find it'''
+    if place['placeID']:
+        return place['placeID']
+    query = ', '.join(part for part in (place['name'], place['address'])
+                      if part)
+    throttle.wait()
+    match = findPlace(query, place['lat'], place['lng'])
+    if match is None:
+        raise LookupError('no match for {}'.format(query))
+    return match['place_id']
+
+
+def lookupPlace(placeID, throttle):
+    '''a new Place (not added to the session) from google details'''
+    throttle.wait()
+    googlePlace = GooglePlace(placeID)
+    place = Place(placeID, googlePlace.name)
+    place.updateFromGoogle(googlePlace)
+    return place
+
+
+def importBatch(userID, batch, executor, throttle, listed):
+    '''resolve, look up and insert one batch. listed is the set of
+    place ids in the users list, and grows with what's added.
+    returns the progress rows of the batch'''
+    rows = []
+    resolved = {}
+    futures = [(place, executor.submit(bindCaller(resolve), place, throttle))
+               for place in batch]
+    for place, future in futures:
+        try:
+            resolved[place['key']] = future.result()
+        except Exception as e:
+            rows.append({'key': place['key'], 'name': place['name'],
+                         'error': str(e) or type(e).__name__})
+
+    placeIDs = set(resolved.values())
+    stored = set(placeID for placeID, in db.session.query(
+        Place.placeID).filter(Place.placeID.in_(placeIDs))) if placeIDs \
+        else set()
+    lookups = [(placeID, executor.submit(bindCaller(lookupPlace), placeID,
+                                         throttle))
+               for placeID in placeIDs - stored]
+    newPlaces = []
+    missing = {}
+    for placeID, future in lookups:
+        try:
+            newPlaces.append(future.result())
+        except Exception as e:
+            missing[placeID] = str(e) or type(e).__name__
+
+    userPlaces = []
+    for place in batch:
+        placeID = resolved.get(place['key'])
+        if placeID is None:
+            continue
+        if placeID in missing:
+            rows.append({'key': place['key'], 'name': place['name'],
+                         'error': 'details failed: ' + missing[placeID]})
+            continue
+        row = {'key': place['key'], 'name': place['name'],
+               'placeID': placeID, 'added': placeID not in listed}
+        if row['added']:
+            listed.add(placeID)
+            userPlaces.append({'userID': userID, 'placeID': placeID,
+                               'notes': place['notes']})
+        rows.append(row)
+
+    db.session.bulk_save_objects(newPlaces)
+    db.session.bulk_insert_mappings(UserPlace, userPlaces)
+    if userPlaces:
+        db.session.bulk_insert_mappings(PlaceStats, [
+            {'userID': userID, 'placeID': row['placeID'], 'visits': 0}
+            for row in userPlaces])
+        increment(UserStats, {'places': len(userPlaces)}, userID=userID)
+        bumpListVersion(userID)
+    db.session.commit()
+    return rows
+
+
+def importPlaces(userID, places, progress, workers=4, rate=10, batchSize=50,
+                 retryFailed=False, report=None):
+    '''add saved places to the users list, skipping what progress
+    says is done. report(rows) is called after each batch with its
+    progress rows. returns the number of places added'''
+    todo = progress.todo(places, retryFailed)
+    listed = set(placeID for placeID, in db.session.query(
+        UserPlace.placeID).filter(UserPlace.userID == userID))
+    throttle = Throttle(rate, burst=workers)
+    added = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(todo), batchSize):
+            rows = importBatch(userID, todo[start:start + batchSize],
+                               executor, throttle, listed)
+            progress.record(rows)
+            added += sum(1 for row in rows if row.get('added'))
+            if report is not None:
+                report(rows)
+    return added
@@ -0,0 +1,60 @@
+'''
+project.utils.pageUtils
+
+Keyset pagination, used by the api and the visit history pages.
+
+A page is the rows after a cursor in a fixed order. The cursor is the
+sort key of the last row of the previous page, base64 JSON encoded,
+so getting a page is an index seek to the cursor plus a page of rows.
+It costs the same however far back it is, unlike OFFSET, which reads
+and throws away everything before the page.
+'''
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import date, datetime
+
+from sqlalchemy import Date, literal, tuple_
+
+
+def encodeCursor(values):
+    values = [v.isoformat() if isinstance(v, date) else v for v in values]
+    return urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode()
+
+
+def decodeCursor(cursor, columns):
+    '''turn a cursor back into sort key values, typed like columns.
+    raises ValueError if it isn't a cursor for columns'''
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode('utf-8')).
+                            decode('utf-8'))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return [datetime.strptime(v, '%Y-%m-%d').date()
+                if isinstance(c.type, Date) else v
+                for c, v in zip(columns, values)]
+    except (binascii.Error, UnicodeDecodeError, TypeError):
+        raise ValueError('Invalid cursor.')
+
+
+def keysetPage(query, columns, cursor=None, limit=50, descending=False):
+    '''up to limit rows of query after cursor, ordered by columns
+    (which together must be unique). returns the rows and the cursor
+    for the next page, None on the last page'''
+    if cursor:
+        key = tuple_(*columns)
+        after = tuple_(*[literal(v, c.type) for c, v
+                         in zip(columns, decodeCursor(cursor, columns))])
+        query = query.filter(key < after if descending else key > after)
+    if descending:
+        query = query.order_by(*[c.desc() for c in columns])
+    else:
+        query = query.order_by(*columns)
+
+    rows = query.limit(limit + 1).all()
+    nextCursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        nextCursor = encodeCursor([getattr(rows[-1], c.key)
+                                   for c in columns])
+    return rows, nextCursor
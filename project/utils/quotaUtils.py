@@ -0,0 +1,231 @@
+'''
+project.utils.quotaUtils
+
+What the google calls cost, and a daily budget for them.
+
+googleUtils counts every call here by endpoint, the route that made
+it and the user it was for, priced from GOOGLE_COSTS. Counts are
+kept in memory and added to the apiUsage table at most every
+GOOGLE_USAGE_FLUSH seconds (after a request, or when a command
+finishes). That's also when a worker reads back what every worker
+has spent today, and drops rows older than GOOGLE_USAGE_DAYS.
+
+GOOGLE_BUDGETS caps a day's spending in dollars, per endpoint and in
+all ('total'). A call that would go over raises OverBudget, which is
+an AttributeError like any failed google call, so callers fall back
+the way they already do: cached search pages, the stored snapshot of
+a place, suggestions from the users own list.
+'''
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, timedelta
+from functools import wraps
+
+from flask import has_request_context, request, session
+
+logger = logging.getLogger(__name__)
+
+# list price of a call to each endpoint, in dollars
+COSTS = {
+    'details': 0.017,
+    'nearby': 0.032,
+    'findPlace': 0.017,
+    'geocode': 0.005,
+    'autocomplete': 0.00283,
+    'photo': 0.007,
+    'staticMap': 0.002,
+}
+REPORT_GROUPS = ('endpoint', 'route', 'userID', 'day')
+
+# the caller set by callerAs, for this thread
+local = threading.local()
+
+
+class OverBudget(AttributeError):
+    ''' A google call that would go over a daily budget. '''
+
+
+def caller():
+    '''(route, userID) the calls made now are counted against'''
+    who = getattr(local, 'caller', None)
+    if who is not None:
+        return who
+    if has_request_context():
+        return (request.endpoint or request.path,
+                str(session.get('userID') or ''))
+    return ('background', '')
+
+
+@contextmanager
+def callerAs(route, userID=''):
+    '''count the calls made in this block (on this thread) against
+    route and userID'''
+    previous = getattr(local, 'caller', None)
+    local.caller = (route, str(userID or ''))
+    try:
+        yield
+    finally:
+        local.caller = previous
+
+
+def bindCaller(fn):
+    '''fn, with its calls counted against whoever is calling now
+    wherever it runs. for work handed to another thread'''
+    route, userID = caller()
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        with callerAs(route, userID):
+            return fn(*args, **kwargs)
+    return run
+
+
+class GoogleUsage(object):
+    ''' Calls and cost counted by this worker, and today's spending
+    by all of them as of the last flush. '''
+
+    def __init__(self, app=None):
+        self.app = None
+        # (day, endpoint, route, userID) -> calls, and -> cost
+        self.calls = Counter()
+        self.costs = Counter()
+        # endpoint (and 'total') -> dollars spent today
+        self.spent = Counter()
+        self.day = date.today()
+        self.pruned = None
+        self.lastFlush = time.time()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GOOGLE_COSTS', COSTS)
+        app.config.setdefault('GOOGLE_BUDGETS', {})
+        app.config.setdefault('GOOGLE_USAGE_FLUSH', 60)
+        app.config.setdefault('GOOGLE_USAGE_DAYS', 90)
+        app.extensions['googleUsage'] = self
+        app.after_request(self.afterRequest)
+        self.app = app
+
+    def price(self, endpoint):
+        return self.app.config['GOOGLE_COSTS'].get(endpoint, 0)
+
+    def rollover(self):
+        '''start a new day of spending. caller holds the lock'''
+        today = date.today()
+        if today != self.day:
+            self.day = today
+            self.spent.clear()
+
+    def check(self, endpoint):
+        '''raise OverBudget if a call to endpoint would go over its
+        budget or the total'''
+        if self.app is None:
+            return
+        budgets = self.app.config['GOOGLE_BUDGETS']
+        price = self.price(endpoint)
+        with self.lock:
+            self.rollover()
+            for name in (endpoint, 'total'):
+                budget = budgets.get(name)
+                if budget is not None and self.spent[name] + price > budget:
+                    raise OverBudget('google {} budget of ${} is used up '
+                                     'for today'.format(name, budget))
+
+    def record(self, endpoint, who=None):
+        '''count a call to endpoint, made by who (route, userID), or
+        the current caller'''
+        if self.app is None:
+            return
+        route, userID = who or caller()
+        price = self.price(endpoint)
+        with self.lock:
+            self.rollover()
+            key = (self.day, endpoint, route, userID)
+            self.calls[key] += 1
+            self.costs[key] += price
+            self.spent[endpoint] += price
+            self.spent['total'] += price
+
+    def afterRequest(self, response):
+        if time.time() - self.lastFlush >= \
+                self.app.config['GOOGLE_USAGE_FLUSH']:
+            self.flush()
+        return response
+
+    def flush(self):
+        '''add the counts to apiUsage, and read back todays spending.
+        uses its own connection, so it leaves the session alone'''
+        # imported here since googleUtils (and so this) is loaded by
+        # the models
+        from sqlalchemy import and_, func, select
+        from sqlalchemy.exc import SQLAlchemyError
+        from project import db
+        from project.models import ApiUsage
+
+        with self.lock:
+            calls, costs = self.calls, self.costs
+            self.calls, self.costs = Counter(), Counter()
+            self.lastFlush = time.time()
+            today = self.day
+        table = ApiUsage.__table__
+        try:
+            with db.engine.begin() as connection:
+                for key, count in calls.items():
+                    day, endpoint, route, userID = key
+                    updated = connection.execute(table.update().where(and_(
+                        table.c.day == day, table.c.endpoint == endpoint,
+                        table.c.route == route, table.c.userID == userID)
+                    ).values(calls=table.c.calls + count,
+                             cost=table.c.cost + costs[key])).rowcount
+                    if not updated:
+                        connection.execute(table.insert().values(
+                            day=day, endpoint=endpoint, route=route,
+                            userID=userID, calls=count, cost=costs[key]))
+                if self.pruned != today:
+                    keep = self.app.config['GOOGLE_USAGE_DAYS']
+                    connection.execute(table.delete().where(
+                        table.c.day < today - timedelta(days=keep)))
+                spent = connection.execute(
+                    select([table.c.endpoint, func.sum(table.c.cost)]).
+                    where(table.c.day == today).
+                    group_by(table.c.endpoint)).fetchall()
+        except SQLAlchemyError:
+            # another worker made the same row first, or the db is
+            # down. keep the counts for next time
+            logger.exception('could not save google usage')
+            with self.lock:
+                self.calls.update(calls)
+                self.costs.update(costs)
+            return
+        with self.lock:
+            self.pruned = today
+            if today != self.day:
+                return
+            self.spent = Counter({endpoint: cost or 0
+                                  for endpoint, cost in spent})
+            self.spent['total'] = sum(self.spent.values())
+            # calls made while this ran aren't in the table yet
+            for (day, endpoint, route, userID), cost in self.costs.items():
+                if day == today:
+                    self.spent[endpoint] += cost
+                    self.spent['total'] += cost
+
+
+usage = GoogleUsage()
+
+
+def usageReport(days=7, by='endpoint'):
+    '''(group, calls, cost) for the last days days, grouped by
+    endpoint, route, userID or day, most expensive first'''
+    from project import db
+    from project.models import ApiUsage
+    group = getattr(ApiUsage, by)
+    since = date.today() - timedelta(days=days - 1)
+    return db.session.query(
+        group, db.func.sum(ApiUsage.calls), db.func.sum(ApiUsage.cost)).\
+        filter(ApiUsage.day >= since).group_by(group).\
+        order_by(db.func.sum(ApiUsage.cost).desc()).all()
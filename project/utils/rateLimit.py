@@ -0,0 +1,221 @@
+'''
+project.utils.rateLimit
+
+Token bucket rate limiting for routes that are expensive to serve
+(bcrypt on login, Google quota on search and register).
+
+Buckets live in process memory by default. Set RATELIMIT_STORAGE_URL
+to a redis url to share buckets between workers.
+'''
+import math
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, jsonify, make_response, render_template
+from flask import request, session
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class MemoryStore(object):
+    '''keeps buckets in a dict. buckets are only shared by the
+    threads of a single worker process'''
+
+    # once we hold this many buckets, drop the ones that have refilled
+    maxBuckets = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.limited = Counter()
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        '''take a token from the bucket at key.
+        returns (allowed, retryAfter) where retryAfter is the number
+        of seconds until the bucket has a token again'''
+        with self.lock:
+            tokens, last = self.buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now)
+                allowed, retryAfter = True, 0
+            else:
+                self.buckets[key] = (tokens, now)
+                allowed, retryAfter = False, (1 - tokens) / rate
+            if len(self.buckets) > self.maxBuckets:
+                self.prune(now)
+        return allowed, retryAfter
+
+    def prune(self, now):
+        '''forget buckets that would be full by now.
+        a full bucket is the same as no bucket. caller holds the lock'''
+        # rate and capacity aren't stored, so assume the slowest refill
+        # any bucket could have: an hour
+        stale = [key for key, (tokens, last) in self.buckets.items()
+                 if now - last > 3600]
+        for key in stale:
+            del self.buckets[key]
+
+    def incr(self, name):
+        with self.lock:
+            self.limited[name] += 1
+
+    def counters(self):
+        with self.lock:
+            return dict(self.limited)
+
+
+class RedisStore(object):
+    '''keeps buckets in redis so every worker shares them.
+    the refill and take happen in one lua script so they are atomic'''
+
+    script = '''
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local now = tonumber(ARGV[3])
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'last')
+        local tokens = tonumber(bucket[1]) or capacity
+        local last = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + (now - last) * rate)
+        local allowed = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+            allowed = 1
+        end
+        redis.call('HMSET', KEYS[1], 'tokens', tostring(tokens),
+                   'last', tostring(now))
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+        return {allowed, tostring(tokens)}
+    '''
+    countersKey = 'ratelimit:limited'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_STORAGE_URL is set '
+                               'but redis is not installed')
+        self.client = redis.StrictRedis.from_url(url)
+        self.take_script = self.client.register_script(self.script)
+
+    def take(self, key, capacity, rate, now):
+        allowed, tokens = self.take_script(
+            keys=['ratelimit:' + key], args=[capacity, rate, now])
+        if allowed:
+            return True, 0
+        return False, (1 - float(tokens)) / rate
+
+    def incr(self, name):
+        self.client.hincrby(self.countersKey, name, 1)
+
+    def counters(self):
+        return {name.decode('utf-8'): int(count) for name, count
+                in self.client.hgetall(self.countersKey).items()}
+
+
+def clientIP():
+    '''address of the client. when running behind proxies
+    (heroku's router for one) PROXY_COUNT says how many addresses at
+    the end of X-Forwarded-For were added by proxies we trust'''
+    proxies = current_app.config.get('PROXY_COUNT', 0)
+    route = request.access_route
+    if proxies and len(route) >= proxies:
+        return route[-proxies]
+    return request.remote_addr
+
+
+def sessionUser():
+    '''default user key: the logged in user, if any'''
+    return session.get('userID')
+
+
+class RateLimiter(object):
+    ''' Applies per-IP and per-user token buckets to routes.
+
+    Limits are read from the RATELIMITS config, keyed by limit name:
+        RATELIMITS = {'login': {'ip': (20, 60), 'user': (5, 60)}}
+    means 20 requests per minute per IP and 5 per minute per user,
+    with bursts up to the full amount. '''
+
+    def __init__(self, app=None):
+        self.store = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATELIMITS', {})
+        app.extensions['rateLimiter'] = self
+
+    def getStore(self):
+        '''store is created on first use so config loaded
+        after import (like in the tests) is respected'''
+        if self.store is None:
+            with self.lock:
+                if self.store is None:
+                    url = current_app.config['RATELIMIT_STORAGE_URL']
+                    self.store = RedisStore(url) if url else MemoryStore()
+        return self.store
+
+    def check(self, name, userKey):
+        '''take a token from each bucket that applies to this request.
+        returns seconds to wait, or 0 if the request may go ahead'''
+        limits = current_app.config['RATELIMITS'].get(name, {})
+        keys = []
+        if 'ip' in limits:
+            keys.append(('ip', '{}:ip:{}'.format(name, clientIP())))
+        user = userKey()
+        if 'user' in limits and user:
+            keys.append(('user', '{}:user:{}'.format(name, user)))
+
+        store = self.getStore()
+        now = time.time()
+        retryAfter = 0
+        for kind, key in keys:
+            count, seconds = limits[kind]
+            allowed, wait = store.take(key, count, count / seconds, now)
+            if not allowed:
+                store.incr('{}:{}'.format(name, kind))
+                retryAfter = max(retryAfter, wait)
+        return retryAfter
+
+    def limit(self, name, userKey=sessionUser, methods=('POST',),
+              json=False):
+        '''decorator to rate limit a route.
+        name picks the limits out of RATELIMITS, userKey returns what
+        identifies a user for this route, and only requests with one
+        of methods are counted. json routes get a json 429'''
+        def decorator(view):
+            @wraps(view)
+            def wrap(*args, **kwargs):
+                if (current_app.config['RATELIMIT_ENABLED'] and
+                        request.method in methods):
+                    retryAfter = self.check(name, userKey)
+                    if retryAfter:
+                        return tooManyRequests(retryAfter, json)
+                return view(*args, **kwargs)
+            return wrap
+        return decorator
+
+    def counters(self):
+        '''number of requests limited so far, keyed by
+        "<limit name>:<ip or user>"'''
+        return self.getStore().counters()
+
+
+def tooManyRequests(retryAfter, json=False):
+    seconds = int(math.ceil(retryAfter))
+    if json:
+        response = jsonify(message='Too many requests.',
+                           retryAfter=seconds)
+        response.status_code = 429
+    else:
+        response = make_response(
+            render_template('429.html', retryAfter=seconds), 429)
+    response.headers['Retry-After'] = str(seconds)
+    return response
@@ -0,0 +1,98 @@
+'''
+project.utils.recommendUtils
+
+"Haven't been in a while": places in a user's list ranked by how
+overdue a visit is, worked out by the database in one query.
+
+lag() over each place's visits gives the gap between consecutive
+visits, so a place's usual gap is the average of those. A place is
+scored by days since the last visit over its usual gap, so 2.0 means
+twice as long as usual. Places visited once use ONE_VISIT_GAP as
+their usual gap, and places never visited score NEVER_VISITED.
+
+Results are cached per user, keyed by the user's data version and
+the date, so writing a visit (which bumps the version) or a new day
+makes a fresh ranking.
+'''
+from datetime import date
+
+from sqlalchemy import text
+
+from project import db
+from project.utils.googleUtils import TTLCache
+from project.utils.versionUtils import dataVersion
+
+# usual gap, in days, assumed for a place visited only once
+ONE_VISIT_GAP = 90
+# score of a place never visited. on par with a place a bit overdue
+NEVER_VISITED = 1.5
+
+# days from b to a, and todays date, in each database
+DAYS = {
+    'postgresql': '({a} - {b})',
+    'sqlite': '(julianday({a}) - julianday({b}))',
+}
+TODAY = {
+    'postgresql': 'CAST(:today AS DATE)',
+    'sqlite': ':today',
+}
+
+OVERDUE = '''
+    WITH gaps AS (
+        SELECT v."placeID", v."visitDate",
+               {gap} AS gap
+        FROM visits v
+        WHERE v."userID" = :userID
+    ),
+    listed AS (
+        SELECT up."placeID", p."placeName",
+               count(g."visitDate") AS visits,
+               max(g."visitDate") AS "lastVisit",
+               avg(g.gap) AS "usualGap"
+        FROM "userPlaces" up
+        JOIN places p ON p."placeID" = up."placeID"
+        LEFT JOIN gaps g ON g."placeID" = up."placeID"
+        WHERE up."userID" = :userID
+        GROUP BY up."placeID", p."placeName"
+    )
+    SELECT "placeID", "placeName", visits, "lastVisit", "usualGap",
+           {since} AS "daysSince",
+           CASE WHEN visits = 0 THEN :neverVisited
+                ELSE {since} * 1.0 / coalesce(nullif("usualGap", 0),
+                                              :oneVisitGap)
+           END AS score
+    FROM listed
+    ORDER BY score DESC, "placeName"
+    LIMIT :limit
+'''
+
+# rankings by (userID, data version, date)
+overdueCache = TTLCache(maxSize=512, ttl=24 * 60 * 60)
+
+
+def overdueQuery(dialect):
+    days = DAYS.get(dialect, DAYS['postgresql'])
+    return text(OVERDUE.format(
+        gap=days.format(
+            a='v."visitDate"',
+            b='lag(v."visitDate") OVER (PARTITION BY v."placeID" '
+              'ORDER BY v."visitDate", v."visitID")'),
+        since=days.format(a=TODAY.get(dialect, TODAY['postgresql']),
+                          b='"lastVisit"')))
+
+
+def overduePlaces(userID, limit=20):
+    '''places in the users list, most overdue first. rows of placeID,
+    placeName, visits, lastVisit, usualGap (days, None if under two
+    visits), daysSince (None if never visited) and score'''
+    today = date.today()
+    key = (str(userID), dataVersion(userID), today, limit)
+    ranking = overdueCache.get(key)
+    if ranking is None:
+        ranking = db.session.execute(
+            overdueQuery(db.engine.dialect.name),
+            {'userID': str(userID), 'today': today.isoformat(), 'limit': limit,
+             'neverVisited': NEVER_VISITED,
+             'oneVisitGap': ONE_VISIT_GAP}).fetchall()
+        overdueCache.set(key, ranking)
+    return ranking
@@ -0,0 +1,155 @@
+'''
+project.utils.statsUtils
+
+Stats for a user's list, kept in aggregate tables so the stats page
+never scans visits:
+
+    userStats:   places, places visited and visits, per user
+    placeStats:  visits and first and last visit, per place in a list
+    monthStats:  visits per month
+
+The record* functions are called by the write they describe, before
+it commits, so the stats change in the same transaction. Caller
+commits. rebuildStats recomputes everything from visits (run
+`flask rebuild-stats` after loading data some other way).
+'''
+from collections import Counter
+from datetime import date
+
+from sqlalchemy import func
+
+from project import db
+from project.models import (UserPlace, Visit, UserStats, PlaceStats,
+                            MonthStats, Place)
+
+
+def monthOf(day):
+    return date(day.year, day.month, 1)
+
+
+def increment(model, amounts, **key):
+    '''add amounts ({column name: n}) to the row of model with key,
+    creating it if there isn't one'''
+    updated = db.session.query(model).filter_by(**key).update(
+        {getattr(model, name): getattr(model, name) + amount
+         for name, amount in amounts.items()},
+        synchronize_session=False)
+    if not updated:
+        row = model(**key)
+        for name, amount in amounts.items():
+            setattr(row, name, amount)
+        db.session.add(row)
+        db.session.flush()
+
+
+def getPlaceStats(userID, placeID):
+    '''the placeStats row, locked for the rest of the transaction.
+    made if missing'''
+    row = db.session.query(PlaceStats).filter_by(
+        userID=userID, placeID=placeID).with_for_update().first()
+    if row is None:
+        row = PlaceStats(userID=userID, placeID=placeID, visits=0)
+        db.session.add(row)
+    return row
+
+
+def recordPlaceAdded(userID, placeID):
+    increment(UserStats, {'places': 1}, userID=userID)
+    db.session.add(PlaceStats(userID=userID, placeID=placeID, visits=0))
+
+
+def recordVisitAdded(userID, placeID, visitDate):
+    stats = getPlaceStats(userID, placeID)
+    firstTime = not stats.visits
+    stats.visits = (stats.visits or 0) + 1
+    stats.firstVisit = min(filter(None, (stats.firstVisit, visitDate)))
+    stats.lastVisit = max(filter(None, (stats.lastVisit, visitDate)))
+    increment(UserStats, {'visits': 1, 'visitedPlaces': int(firstTime)},
+              userID=userID)
+    increment(MonthStats, {'visits': 1}, userID=userID,
+              month=monthOf(visitDate))
+
+
+def recordVisitChanged(userID, placeID, oldDate, newDate):
+    '''a visit moved from oldDate to newDate'''
+    if monthOf(oldDate) != monthOf(newDate):
+        increment(MonthStats, {'visits': -1}, userID=userID,
+                  month=monthOf(oldDate))
+        increment(MonthStats, {'visits': 1}, userID=userID,
+                  month=monthOf(newDate))
+    if oldDate != newDate:
+        # the moved visit may have been the first or last, so ask the
+        # visits to this one place (the change is flushed first)
+        stats = getPlaceStats(userID, placeID)
+        stats.firstVisit, stats.lastVisit = db.session.query(
+            func.min(Visit.visitDate), func.max(Visit.visitDate)).filter_by(
+            userID=userID, placeID=placeID).first()
+
+
+def rebuildStats(userID=None):
+    '''recompute the stats of one user, or everyone, from the list and
+    visits. caller commits'''
+    for model in (UserStats, PlaceStats, MonthStats):
+        query = db.session.query(model)
+        if userID is not None:
+            query = query.filter_by(userID=userID)
+        query.delete(synchronize_session=False)
+
+    def forUser(query, column):
+        return query if userID is None else query.filter(column == userID)
+
+    visits = dict(((user, place), (count, first, last))
+                  for user, place, count, first, last in forUser(
+        db.session.query(Visit.userID, Visit.placeID, func.count(),
+                         func.min(Visit.visitDate),
+                         func.max(Visit.visitDate)).
+        group_by(Visit.userID, Visit.placeID), Visit.userID))
+    totals = {}
+    placeRows = []
+    for user, place in forUser(db.session.query(
+            UserPlace.userID, UserPlace.placeID), UserPlace.userID):
+        count, first, last = visits.get((user, place), (0, None, None))
+        placeRows.append({'userID': user, 'placeID': place, 'visits': count,
+                          'firstVisit': first, 'lastVisit': last})
+        total = totals.setdefault(user, {'userID': user, 'places': 0,
+                                         'visitedPlaces': 0, 'visits': 0})
+        total['places'] += 1
+        total['visitedPlaces'] += int(count > 0)
+        total['visits'] += count
+
+    # months are counted here rather than in sql, where truncating a
+    # date to its month is different in every database
+    months = Counter((user, monthOf(day)) for user, day in forUser(
+        db.session.query(Visit.userID, Visit.visitDate), Visit.userID))
+
+    db.session.bulk_insert_mappings(UserStats, list(totals.values()))
+    db.session.bulk_insert_mappings(PlaceStats, placeRows)
+    db.session.bulk_insert_mappings(MonthStats, [
+        {'userID': user, 'month': month, 'visits': count}
+        for (user, month), count in months.items()])
+    return len(totals)
+
+
+def userStats(userID, months=12, top=5):
+    '''everything on the stats page, read from the aggregates'''
+    totals = db.session.query(UserStats).get(userID) or \
+        UserStats(userID=userID, places=0, visitedPlaces=0, visits=0)
+    placeStats = db.session.query(PlaceStats.visits, PlaceStats.lastVisit,
+                                  Place.placeID, Place.placeName).\
+        join(Place, Place.placeID == PlaceStats.placeID).\
+        filter(PlaceStats.userID == userID)
+    return {
+        'places': totals.places,
+        'visits': totals.visits,
+        'visitedPlaces': totals.visitedPlaces,
+        'neverVisited': totals.places - totals.visitedPlaces,
+        'months': list(reversed(db.session.query(
+            MonthStats.month, MonthStats.visits).
+            filter(MonthStats.userID == userID, MonthStats.visits > 0).
+            order_by(MonthStats.month.desc()).limit(months).all())),
+        'mostVisited': placeStats.filter(PlaceStats.visits > 0).order_by(
+            PlaceStats.visits.desc(), Place.placeName).limit(top).all(),
+        'longestSince': placeStats.filter(
+            PlaceStats.lastVisit.isnot(None)).order_by(
+            PlaceStats.lastVisit, Place.placeName).limit(top).all(),
+    }
@@ -0,0 +1,120 @@
+'''
+project.utils.textSearch
+
+Full text search over a user's own list: place names, notes and
+visit comments. Every word is matched as a prefix, so "ram" finds
+"ramen".
+
+On postgres this uses to_tsvector expressions, which have GIN indexes
+(see the textsearch migration). On sqlite it uses the placeSearch FTS5
+table, which triggers keep in sync. Anything else falls back to LIKE.
+'''
+import re
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from project import db
+
+# names count for more than a word in the notes
+NAME_WEIGHT = 2.0
+
+POSTGRES_SEARCH = text('''
+    SELECT hit."placeID", p."placeName", hit.kind, hit.body, hit.rank
+    FROM (
+        SELECT up."placeID", 'name' AS kind, NULL AS body,
+               ts_rank(to_tsvector('simple', p."placeName"), q) * :nameWeight
+                   AS rank
+        FROM "userPlaces" up
+        JOIN places p ON p."placeID" = up."placeID",
+             to_tsquery('simple', :query) q
+        WHERE up."userID" = :userID
+          AND to_tsvector('simple', p."placeName") @@ q
+        UNION ALL
+        SELECT up."placeID", 'notes', up.notes,
+               ts_rank(to_tsvector('simple', coalesce(up.notes, '')), q)
+        FROM "userPlaces" up, to_tsquery('simple', :query) q
+        WHERE up."userID" = :userID
+          AND to_tsvector('simple', coalesce(up.notes, '')) @@ q
+        UNION ALL
+        SELECT v."placeID", 'visit', v.comments,
+               ts_rank(to_tsvector('simple', coalesce(v.comments, '')), q)
+        FROM visits v, to_tsquery('simple', :query) q
+        WHERE v."userID" = :userID
+          AND to_tsvector('simple', coalesce(v.comments, '')) @@ q
+    ) hit
+    JOIN places p ON p."placeID" = hit."placeID"
+    ORDER BY hit.rank DESC
+    LIMIT :limit
+''')
+
+# bm25 is lower for better matches
+SQLITE_SEARCH = text('''
+    SELECT s."placeID", p."placeName", s.kind,
+           CASE WHEN s.kind = 'name' THEN NULL ELSE s.body END,
+           -bm25(placeSearch) * CASE WHEN s.kind = 'name'
+                                     THEN :nameWeight ELSE 1 END AS rank
+    FROM placeSearch s
+    JOIN places p ON p."placeID" = s."placeID"
+    WHERE placeSearch MATCH :query AND s."userID" = :userID
+    ORDER BY rank DESC
+    LIMIT :limit
+''')
+
+LIKE_SEARCH = text('''
+    SELECT up."placeID", p."placeName", 'name', NULL, :nameWeight
+    FROM "userPlaces" up JOIN places p ON p."placeID" = up."placeID"
+    WHERE up."userID" = :userID AND lower(p."placeName") LIKE :query
+    UNION ALL
+    SELECT up."placeID", p."placeName", 'notes', up.notes, 1
+    FROM "userPlaces" up JOIN places p ON p."placeID" = up."placeID"
+    WHERE up."userID" = :userID AND lower(up.notes) LIKE :query
+    UNION ALL
+    SELECT v."placeID", p."placeName", 'visit', v.comments, 1
+    FROM visits v JOIN places p ON p."placeID" = v."placeID"
+    WHERE v."userID" = :userID AND lower(v.comments) LIKE :query
+    LIMIT :limit
+''')
+
+
+def searchTerms(query):
+    '''words in what the user typed. anything but letters and numbers
+    is dropped, which keeps the query syntax of each database out'''
+    return re.findall(r'\w+', query.lower())
+
+
+def searchUserPlaces(userID, query, limit=50):
+    '''places in the users list matching every word of query (as a
+    prefix) in the name, notes or a visit comment. best first.
+
+    returns a list of dicts with placeID, placeName, rank and
+    matches, a list of (kind, text) for the notes and comments that
+    matched'''
+    terms = searchTerms(query)
+    if not terms:
+        return []
+
+    dialect = db.engine.dialect.name
+    params = {'userID': userID, 'limit': limit, 'nameWeight': NAME_WEIGHT}
+    if dialect == 'postgresql':
+        params['query'] = ' & '.join(term + ':*' for term in terms)
+        statement = POSTGRES_SEARCH
+    elif dialect == 'sqlite':
+        params['query'] = ' '.join('"{}"*'.format(term) for term in terms)
+        params['userID'] = str(userID)
+        statement = SQLITE_SEARCH
+    else:
+        # LIKE can't match each word separately, so match the phrase
+        params['query'] = '%{}%'.format(' '.join(terms))
+        statement = LIKE_SEARCH
+
+    places = OrderedDict()
+    for placeID, placeName, kind, body, rank in db.session.execute(
+            statement, params):
+        place = places.setdefault(placeID, {
+            'placeID': placeID, 'placeName': placeName,
+            'rank': 0, 'matches': []})
+        place['rank'] += rank
+        if kind != 'name':
+            place['matches'].append((kind, body))
+    return sorted(places.values(), key=lambda place: -place['rank'])
@@ -0,0 +1,71 @@
+'''
+project.utils.versionUtils
+
+Data versions for a user's list. Every write to a list bumps a
+version in the same transaction, so anything computed from the list
+(etags, cached pages) can be keyed on the version instead of the data.
+
+    users.listVersion:     bumped when a place is added to the list
+                           or a place on it is looked up again
+    userPlaces.version:    bumped when notes or visits for a place change
+
+A user's data version is the sum of the two, which only ever goes up.
+Bumping a version also drops the user's cached template fragments.
+'''
+from sqlalchemy import func
+
+from project import db, fragments
+from project.models import User, UserPlace
+
+
+def dataVersion(userID):
+    '''single number that changes whenever anything in the
+    users list, notes or visits changes'''
+    listVersion, placeVersions = db.session.query(
+        User.listVersion,
+        db.session.query(func.coalesce(func.sum(UserPlace.version), 0)).
+        filter(UserPlace.userID == userID).as_scalar()
+    ).filter(User.userID == userID).first()
+    return listVersion + placeVersions
+
+
+def listVersion(userID):
+    '''version of the set of places in the users list'''
+    return db.session.query(User.listVersion).filter_by(
+        userID=userID).first()[0]
+
+
+def placeVersion(userID, placeID):
+    '''version of notes and visits for one place in a users list.
+    None if the place isn't in the list'''
+    row = db.session.query(UserPlace.version).filter_by(
+        userID=userID, placeID=placeID).first()
+    return row[0] if row else None
+
+
+def bumpListVersion(userID):
+    '''mark the users list as changed. caller commits'''
+    db.session.query(User).filter_by(userID=userID).update(
+        {User.listVersion: User.listVersion + 1}, synchronize_session=False)
+    fragments.invalidate(userID)
+
+
+def bumpListVersions(placeID):
+    '''mark the list of every user with placeID as changed, for when
+    the stored place itself changes. caller commits'''
+    userIDs = [userID for userID, in db.session.query(
+        UserPlace.userID).filter_by(placeID=placeID)]
+    if userIDs:
+        db.session.query(User).filter(User.userID.in_(userIDs)).update(
+            {User.listVersion: User.listVersion + 1},
+            synchronize_session=False)
+    for userID in userIDs:
+        fragments.invalidate(userID)
+
+
+def bumpPlaceVersion(userID, placeID):
+    '''mark notes or visits for a place as changed. caller commits'''
+    db.session.query(UserPlace).filter_by(
+        userID=userID, placeID=placeID).update(
+        {UserPlace.version: UserPlace.version + 1}, synchronize_session=False)
+    fragments.invalidate(userID)
@@ -2,20 +2,40 @@
 project.utils.zipUtils
 
 Utilities for checking zip code
-as well as looking up lat/lng
+as well as looking up lat/lng.
+
+zipIndex keeps every zip centroid from the zipCodes table in memory,
+bucketed into a grid of CELL_DEGREES squares, so lookups, zips within
+some miles and the zip nearest a coordinate don't need the db or
+google. Load the census gazetteer with `flask load-zips` for it to
+cover the whole country; otherwise it holds the zips users have
+geocoded.
 '''
-from os import environ
+import math
+import threading
 
-import requests
+import numpy as np
+from flask import current_app
 
 from project.models import ZipCode
 from project import db
+from project.utils.googleUtils import geocode
+from project.utils.geoUtils import haversine
+
+# size of a grid cell. about 35 miles north to south
+CELL_DEGREES = 0.5
+MILES_PER_DEGREE = 69.0
+# cells out from a coordinate to look for the nearest zip before
+# giving up (about 700 miles)
+MAX_RINGS = 20
 
 
 def zipCheck(zipCode):
     '''query db for zip code
        if already in zipCode table, do nothing
-       if not, geolocate and insert'''
+       if not, geolocate and insert.
+       zipIndex is only a read cache here. the row has to be there
+       afterwards whatever the index holds'''
 
     # query db for passed zip
     lookup = ZipCode.query.filter_by(zipCode=zipCode).first()
@@ -24,28 +44,19 @@ def zipCheck(zipCode):
         # geolocateZip returns (zip, lat, lng)
         geo = geolocateZip(zipCode)
         # create new ZipCode object
-        new_zip = ZipCode(*geo)
+        lookup = ZipCode(*geo)
         # add new zip code to db
-        db.session.add(new_zip)
+        db.session.add(lookup)
         db.session.commit()
+    zipIndex.add(lookup.zipCode, lookup.latitude, lookup.longitude)
 
 
 def geolocateZip(zipCode):
     '''use google maps API to geocode a zip
        AKA takes a zip and returns tuple of zip,lat,long'''
 
-    # create url for looking up zip
-    url = ('https://maps.googleapis.com/maps/api/geocode/'
-           'json?address={}&key={}'.
-           format(zipCode, environ['GOOGLE_API_RESTIES']))
-    # use requests to request data
-    request = requests.get(url)
-    # ensure valid response
-    if request.status_code != 200:
-        raise AttributeError('Request returned bad response')
-    else:
-        # if valid response, return results from json response
-        results = request.json()['results']
+    # geocode raises if google gives a bad response
+    results = geocode(zipCode)['results']
     # if more than one result, raise error (need to test)
     if len(results) > 1:
         raise AttributeError('Zip search returned more than one result?')
@@ -56,3 +67,173 @@ def geolocateZip(zipCode):
     lng = results[0]['geometry']['location']['lng']
 
     return (zipCode, lat, lng)
+
+
+def cellOf(lat, lng):
+    return (int(math.floor(lat / CELL_DEGREES)),
+            int(math.floor(lng / CELL_DEGREES)))
+
+
+class ZipGrid(object):
+    ''' An immutable snapshot of the zip centroids: numpy arrays of
+    the coordinates, and the positions in them of each zip and of the
+    zips in each grid cell. '''
+
+    def __init__(self, rows):
+        self.zips = [row[0] for row in rows]
+        self.lats = np.array([row[1] for row in rows], dtype=float)
+        self.lngs = np.array([row[2] for row in rows], dtype=float)
+        self.positions = {zipCode: i for i, zipCode in enumerate(self.zips)}
+        cells = {}
+        for i, (lat, lng) in enumerate(zip(self.lats, self.lngs)):
+            cells.setdefault(cellOf(lat, lng), []).append(i)
+        self.cells = {cell: np.array(positions)
+                      for cell, positions in cells.items()}
+
+    def withZip(self, zipCode, lat, lng):
+        '''a new grid with one more zip. the arrays and dicts are
+        copied, but only the zips cell is rebucketed'''
+        grid = ZipGrid.__new__(ZipGrid)
+        position = len(self.zips)
+        grid.zips = self.zips + [zipCode]
+        grid.lats = np.append(self.lats, float(lat))
+        grid.lngs = np.append(self.lngs, float(lng))
+        grid.positions = dict(self.positions)
+        grid.positions[zipCode] = position
+        grid.cells = dict(self.cells)
+        cell = cellOf(lat, lng)
+        grid.cells[cell] = np.append(
+            self.cells.get(cell, np.array([], dtype=int)), position)
+        return grid
+
+    def candidates(self, cells):
+        found = [self.cells[cell] for cell in cells if cell in self.cells]
+        if not found:
+            return np.array([], dtype=int)
+        return np.concatenate(found)
+
+    def box(self, lat, lng, miles):
+        '''cells overlapping the box miles either way of lat, lng'''
+        latSpan = miles / MILES_PER_DEGREE
+        lngSpan = miles / (MILES_PER_DEGREE *
+                           max(math.cos(math.radians(lat)), 0.01))
+        south, west = cellOf(lat - latSpan, lng - lngSpan)
+        north, east = cellOf(lat + latSpan, lng + lngSpan)
+        return [(row, col) for row in range(south, north + 1)
+                for col in range(west, east + 1)]
+
+    def ring(self, lat, lng, distance):
+        '''cells exactly distance cells away from the one lat, lng is in'''
+        row, col = cellOf(lat, lng)
+        if distance == 0:
+            return [(row, col)]
+        cells = []
+        for offset in range(-distance, distance + 1):
+            cells.extend([(row - distance, col + offset),
+                          (row + distance, col + offset)])
+            if abs(offset) != distance:
+                cells.extend([(row + offset, col - distance),
+                              (row + offset, col + distance)])
+        return cells
+
+    def within(self, lat, lng, miles):
+        positions = self.candidates(self.box(lat, lng, miles))
+        if not len(positions):
+            return []
+        distances = haversine(lat, lng, self.lats[positions],
+                              self.lngs[positions])
+        order = np.argsort(distances, kind='stable')
+        order = order[distances[order] <= miles]
+        return [(self.zips[positions[i]], float(distances[i]))
+                for i in order]
+
+    def nearest(self, lat, lng):
+        for distance in range(MAX_RINGS + 1):
+            positions = self.candidates(self.ring(lat, lng, distance))
+            if len(positions):
+                break
+        else:
+            return None
+        # the closest so far bounds the search, but a closer zip can
+        # still be in a cell further out, so search the whole circle
+        closest = haversine(lat, lng, self.lats[positions],
+                            self.lngs[positions]).min()
+        return self.within(lat, lng, closest + 1e-6)[0]
+
+
+class ZipIndex(object):
+    ''' The zip centroids of a worker. Loaded from the db on first
+    use. Zips geocoded later are added with add(), which swaps in a
+    new grid so readers never see one half built. '''
+
+    def __init__(self):
+        self.grid = None
+        self.lock = threading.Lock()
+
+    def load(self, rows=None):
+        '''(re)build from rows of (zipCode, lat, lng), or the db'''
+        if rows is None:
+            rows = db.session.query(ZipCode.zipCode, ZipCode.latitude,
+                                    ZipCode.longitude).all()
+        grid = ZipGrid(rows)
+        with self.lock:
+            self.grid = grid
+        return grid
+
+    def getGrid(self):
+        grid = self.grid
+        if grid is None:
+            grid = self.load()
+        return grid
+
+    def add(self, zipCode, lat, lng):
+        # read, copy and swap under the lock so concurrent adds don't
+        # lose each other
+        with self.lock:
+            grid = self.grid
+            if grid is None or zipCode in grid.positions:
+                return
+            self.grid = grid.withZip(zipCode, lat, lng)
+
+    def __contains__(self, zipCode):
+        return zipCode in self.getGrid().positions
+
+    def __len__(self):
+        return len(self.getGrid().zips)
+
+    def lookup(self, zipCode):
+        '''(lat, lng) of zipCode, or None'''
+        grid = self.getGrid()
+        i = grid.positions.get(zipCode)
+        if i is None:
+            return None
+        return float(grid.lats[i]), float(grid.lngs[i])
+
+    def within(self, lat, lng, miles):
+        '''(zipCode, miles) of zips within miles of lat, lng, closest
+        first'''
+        return self.getGrid().within(lat, lng, miles)
+
+    def zipsNear(self, zipCode, miles):
+        '''(zipCode, miles) of zips within miles of zipCode, itself
+        included. empty if zipCode isn't known'''
+        location = self.lookup(zipCode)
+        if location is None:
+            return []
+        return self.within(location[0], location[1], miles)
+
+    def nearest(self, lat, lng):
+        '''(zipCode, miles) of the closest zip, or None if there isn't
+        one within a few hundred miles'''
+        return self.getGrid().nearest(lat, lng)
+
+
+zipIndex = ZipIndex()
+
+
+def knownZip(zipCode):
+    '''False only if zipCode is certainly not a zip. that's only known
+    once the gazetteer is loaded (see ZIP_INDEX_COMPLETE)'''
+    if len(zipIndex) < current_app.config['ZIP_INDEX_COMPLETE']:
+        return True
+    return zipCode in zipIndex
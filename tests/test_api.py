@@ -0,0 +1,296 @@
+# tests/test_api.py
+
+
+import csv
+import gzip
+import io
+import json
+import os
+import unittest
+
+from project import app, db
+from project.models import User
+from project.utils.statsUtils import rebuildStats, userStats
+from project.utils.recommendUtils import overduePlaces
+from project.utils.quotaUtils import callerAs, usage, usageReport
+
+
+class ApiTests(unittest.TestCase):
+
+    ############################
+    #    setup and teardown    #
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        app.config.from_object(os.environ['TEST_SETTINGS'])
+        self.app = app.test_client()
+        db.create_all()
+
+        self.assertEquals(app.debug, False)
+
+    # executed after each test
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    ########################
+    #    helper methods    #
+    ########################
+
+    def register(self, userName='isaac', email='iceman@yoohoo.com',
+                 password='iceyboi', zipCode='87004'):
+        return self.app.post(
+            '/register/',
+            data=dict(userName=userName, email=email, password=password,
+                      confirm=password, zipCode=zipCode),
+            follow_redirects=True)
+
+    def login(self, userName='isaac', password='iceyboi'):
+        return self.app.post('/login',
+                             data=dict(userName=userName, password=password),
+                             follow_redirects=True)
+
+    def addPlace(self, placeID='ChIJ-6zk5ZO3t4kRwi3BXpaCRjE'):
+        return self.app.post('/api/v1/places',
+                             data=json.dumps(dict(placeID=placeID)),
+                             content_type='application/json')
+
+    def getJSON(self, url, **kwargs):
+        response = self.app.get(url, **kwargs)
+        return response, json.loads(response.data.decode('utf-8'))
+
+    #############
+    #   tests   #
+    #############
+
+    def test_not_logged_in_users_get_401(self):
+        response = self.app.get('/api/v1/places')
+        self.assertEqual(response.status_code, 401)
+
+    def test_empty_list(self):
+        self.register()
+        self.login()
+        response, data = self.getJSON('/api/v1/places')
+        self.assertEqual(data, {'data': [], 'next': None})
+
+    def test_users_can_add_places(self):
+        self.register()
+        self.login()
+        response = self.addPlace()
+        self.assertEqual(response.status_code, 201)
+        response, data = self.getJSON('/api/v1/places')
+        self.assertEqual(data['data'][0]['placeName'], 'Momofuku CCDC')
+
+    def test_sparse_fieldsets(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        response, data = self.getJSON('/api/v1/places?fields=placeName')
+        self.assertEqual(data['data'], [{'placeName': 'Momofuku CCDC'}])
+
+    def test_unknown_fields(self):
+        self.register()
+        self.login()
+        response = self.app.get('/api/v1/places?fields=password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        self.addPlace('ChIJ95RxxRN4IocRUhvj7gXGxEo')
+        response, first = self.getJSON('/api/v1/places?limit=1')
+        self.assertEqual(len(first['data']), 1)
+        response, second = self.getJSON(
+            '/api/v1/places?limit=1&cursor=' + first['next'])
+        self.assertEqual(len(second['data']), 1)
+        self.assertIsNone(second['next'])
+        self.assertNotEqual(first['data'], second['data'])
+
+    def test_etag_not_modified_until_list_changes(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        response = self.app.get('/api/v1/places')
+        etag = response.headers['ETag']
+        response = self.app.get('/api/v1/places',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.app.put('/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/notes',
+                     data=json.dumps(dict(notes='Cool spot.')),
+                     content_type='application/json')
+        response = self.app.get('/api/v1/places',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_users_can_edit_notes(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        response = self.app.put(
+            '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/notes',
+            data=json.dumps(dict(notes='Cool spot.')),
+            content_type='application/json')
+        edited = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(edited['notes'], 'Cool spot.')
+        response, notes = self.getJSON(
+            '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/notes')
+        self.assertEqual(edited['version'], notes['version'])
+
+    def test_users_can_add_and_edit_visits(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        response = self.app.post(
+            '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+            data=json.dumps(dict(visitDate='2017-01-01',
+                                 comments='visited new years.')),
+            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        visitID = json.loads(response.data.decode('utf-8'))['visitID']
+        self.app.patch('/api/v1/visits/{}'.format(visitID),
+                       data=json.dumps(dict(comments='so good')),
+                       content_type='application/json')
+        response, data = self.getJSON('/api/v1/visits')
+        self.assertEqual(data['data'][0]['comments'], 'so good')
+        self.assertEqual(data['data'][0]['visitDate'], '2017-01-01')
+
+    def test_visits_require_json(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        response = self.app.post(
+            '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+            data=dict(visitDate='2017-01-01'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_stats_kept_up_to_date(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        self.addPlace('ChIJ95RxxRN4IocRUhvj7gXGxEo')
+        visitIDs = []
+        for visitDate in ('2017-01-01', '2017-03-05'):
+            response = self.app.post(
+                '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+                data=json.dumps(dict(visitDate=visitDate)),
+                content_type='application/json')
+            visitIDs.append(json.loads(response.data.decode('utf-8'))[
+                'visitID'])
+        self.app.patch('/api/v1/visits/{}'.format(visitIDs[1]),
+                       data=json.dumps(dict(visitDate='2017-02-10')),
+                       content_type='application/json')
+
+        userID = User.query.filter_by(userName='isaac').first().userID
+        stats = userStats(userID)
+        self.assertEqual((stats['places'], stats['visits'],
+                          stats['neverVisited']), (2, 2, 1))
+        self.assertEqual([(month.month, visits)
+                          for month, visits in stats['months']],
+                         [(1, 1), (2, 1)])
+        self.assertEqual(stats['mostVisited'][0].lastVisit.isoformat(),
+                         '2017-02-10')
+        # same as recomputing from scratch
+        rebuildStats(userID)
+        db.session.commit()
+        self.assertEqual(userStats(userID), stats)
+        response = self.app.get('/stats')
+        self.assertIn(b'Momofuku CCDC', response.data)
+        self.assertIn(b'never been', response.data)
+
+    def test_overdue_ranking_follows_visits(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        self.addPlace('ChIJ95RxxRN4IocRUhvj7gXGxEo')
+        userID = User.query.filter_by(userName='isaac').first().userID
+        # neither visited: never visited places tie, A-Z
+        self.assertEqual([place.visits for place in overduePlaces(userID)],
+                         [0, 0])
+        for visitDate in ('2017-01-01', '2017-01-08'):
+            self.app.post(
+                '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+                data=json.dumps(dict(visitDate=visitDate)),
+                content_type='application/json')
+        # a weekly spot not visited for years is the most overdue
+        ranking = overduePlaces(userID)
+        self.assertEqual(ranking[0].placeName, 'Momofuku CCDC')
+        self.assertEqual(ranking[0].usualGap, 7)
+        response = self.app.get('/overdue')
+        self.assertIn(b'usually every 7 days', response.data)
+        self.assertIn(b'Never been!', response.data)
+
+    def test_visit_history_pages(self):
+        app.config['VISITS_PAGE_SIZE'] = 2
+        self.register()
+        self.login()
+        self.addPlace()
+        for day in (1, 2, 3):
+            self.app.post(
+                '/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+                data=json.dumps(dict(visitDate='2017-01-0{}'.format(day),
+                                     comments='day {}'.format(day))),
+                content_type='application/json')
+        response = self.app.get('/visits')
+        self.assertIn(b'day 3', response.data)
+        self.assertIn(b'day 2', response.data)
+        self.assertNotIn(b'day 1', response.data)
+        self.assertIn(b'Older visits', response.data)
+        older = response.data.decode('utf-8').split(
+            '/visits?cursor=')[1].split('"')[0]
+        response = self.app.get('/visits?cursor=' + older)
+        self.assertIn(b'day 1', response.data)
+        self.assertNotIn(b'Older visits', response.data)
+        response = self.app.get('/details/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE')
+        self.assertIn(b"You've been here 3 times.", response.data)
+        self.assertIn(b'Older visits', response.data)
+
+    def test_export_streams_places_and_visits(self):
+        self.register()
+        self.login()
+        self.addPlace()
+        self.app.post('/api/v1/places/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE/visits',
+                      data=json.dumps(dict(visitDate='2017-01-01',
+                                           comments='tacos')),
+                      content_type='application/json')
+        response = self.app.get('/export/ndjson',
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        rows = [json.loads(line) for line in
+                gzip.decompress(response.data).decode('utf-8').splitlines()]
+        self.assertEqual([row['kind'] for row in rows], ['place', 'visit'])
+        self.assertEqual(rows[1]['visitDate'], '2017-01-01')
+        self.assertEqual(rows[1]['comments'], 'tacos')
+
+        response = self.app.get('/export/csv')
+        self.assertNotIn('Content-Encoding', response.headers)
+        rows = list(csv.DictReader(io.StringIO(
+            response.data.decode('utf-8'))))
+        self.assertEqual([row['kind'] for row in rows], ['place', 'visit'])
+        self.assertEqual(self.app.get('/export/xml').status_code, 404)
+
+    def test_google_usage_saved(self):
+        # drop calls made by earlier tests
+        usage.calls.clear()
+        usage.costs.clear()
+        with callerAs('places.search', 'abc'):
+            usage.record('nearby')
+            usage.record('nearby')
+        usage.record('details')
+        usage.flush()
+        usage.record('nearby')
+        usage.flush()
+        self.assertEqual(
+            [(endpoint, calls) for endpoint, calls, cost in usageReport()],
+            [('nearby', 3), ('details', 1)])
+        self.assertEqual(
+            [(route, calls) for route, calls, cost in
+             usageReport(by='route')],
+            [('places.search', 2), ('background', 2)])
+        self.assertAlmostEqual(usage.spent['total'], 3 * 0.032 + 0.017)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,7 @@ import os
 import unittest
 from datetime import date
 
-from project import app, db, bcrypt
+from project import app, db, bcrypt, assets
 from project._config import basedir
 from project.models import Place, User
 
@@ -184,6 +184,118 @@ class PlacesTests(unittest.TestCase):
         response = self.app.get('/', follow_redirects=True)
         self.assertIn(b'Range Cafe Bernalillo', response.data)
 
+    def test_details_not_modified_until_notes_change(self):
+        self.register()
+        self.login()
+        self.app.post('/addPlace/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                      follow_redirects=True)
+        response = self.app.get('/details/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE')
+        etag = response.headers['ETag']
+        response = self.app.get('/details/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.app.post('/editNotes/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                      data=dict(notes='Cool spot.'))
+        response = self.app.get('/details/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                                headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Cool spot.', response.data)
+
+    def test_home_page_not_modified_until_place_added(self):
+        self.register()
+        self.login()
+        etag = self.app.get('/').headers['ETag']
+        response = self.app.get('/', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.app.post('/addPlace/ChIJ95RxxRN4IocRUhvj7gXGxEo')
+        response = self.app.get('/', headers={'If-None-Match': etag})
+        self.assertIn(b'Range Cafe Bernalillo', response.data)
+
+    def test_home_page_modified_when_assets_rebuilt(self):
+        self.register()
+        self.login()
+        etag = self.app.get('/').headers['ETag']
+        assets.version, old = 'rebuilt', assets.version
+        try:
+            response = self.app.get('/', headers={'If-None-Match': etag})
+        finally:
+            assets.version = old
+        self.assertEqual(response.status_code, 200)
+
+    def test_users_can_find_places_by_prefix_in_notes(self):
+        self.register()
+        self.login()
+        self.app.post('/addPlace/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                      follow_redirects=True)
+        self.app.post('/editNotes/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                      data=dict(notes='Get the spicy noodles.'))
+        response = self.app.get('/find?q=nood')
+        self.assertIn(b'Momofuku CCDC', response.data)
+        self.assertIn(b'Get the spicy noodles.', response.data)
+        response = self.app.get('/find?q=momo')
+        self.assertIn(b'/details/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE', response.data)
+        response = self.app.get('/find?q=tacos')
+        self.assertIn(b'Nothing in your list matches', response.data)
+
+    def test_autocomplete_suggests_places_in_list(self):
+        self.register()
+        self.login()
+        self.app.post('/addPlace/ChIJ-6zk5ZO3t4kRwi3BXpaCRjE',
+                      follow_redirects=True)
+        response = self.app.get('/autocomplete?q=momo')
+        self.assertEqual(response.status_code, 200)
+        result = response.get_json()['results'][0]
+        self.assertEqual(result['placeID'], 'ChIJ-6zk5ZO3t4kRwi3BXpaCRjE')
+        self.assertTrue(result['inList'])
+
+    def test_list_near_zip(self):
+        self.register()
+        self.login()
+        self.app.post('/addPlace/ChIJ95RxxRN4IocRUhvj7gXGxEo',
+                      follow_redirects=True)
+        response = self.app.get('/?zip=87004&radius=5')
+        self.assertIn(b'Range Cafe Bernalillo', response.data)
+        self.assertIn(b' mi<', response.data)
+        response = self.app.get('/?zip=20036&radius=5')
+        self.assertNotIn(b'Range Cafe Bernalillo', response.data)
+
+    def test_list_open_now_filter(self):
+        self.register()
+        self.login()
+        # stored with known hours, so adding them doesn't ask google
+        alwaysOpen = Place('always-open-id', 'Always Open Diner')
+        alwaysOpen.hours, alwaysOpen.utcOffset = '[[0,10080]]', -420
+        neverOpen = Place('never-open-id', 'Never Open Bistro')
+        neverOpen.hours, neverOpen.utcOffset = '[]', -420
+        db.session.add_all([alwaysOpen, neverOpen])
+        db.session.commit()
+        # not following the redirect, to details, which would ask
+        # google about the made up ids
+        self.app.post('/addPlace/always-open-id')
+        self.app.post('/addPlace/never-open-id')
+        response = self.app.get('/?open=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Open now', response.data)
+        self.assertIn(b'Always Open Diner', response.data)
+        self.assertNotIn(b'Never Open Bistro', response.data)
+        response = self.app.get('/')
+        self.assertIn(b'Never Open Bistro', response.data)
+
+    def test_list_shows_map_thumbnails(self):
+        self.register()
+        self.login()
+        self.app.post('/addPlace/ChIJ95RxxRN4IocRUhvj7gXGxEo',
+                      follow_redirects=True)
+        response = self.app.get('/')
+        self.assertIn(b'class="map-thumb" src="/map/thumb/', response.data)
+        # sized in the tag, since the image is drawn at twice the size
+        self.assertIn(b'width="80" height="60"', response.data)
+        self.assertEqual(
+            self.app.get('/map/thumb/north.png').status_code, 404)
+        self.assertEqual(
+            self.app.get('/map/huge/35.31000,-106.55000.png').status_code,
+            404)
+
     # maybe test GooglePlace attributes?
 
 
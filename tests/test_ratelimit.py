@@ -0,0 +1,88 @@
+# tests/test_ratelimit.py
+
+
+import os
+import unittest
+
+from project import app, db, limiter
+from project.utils.rateLimit import MemoryStore
+
+
+class RateLimitTests(unittest.TestCase):
+
+    ############################
+    #    setup and teardown    #
+    ############################
+
+    # executed prior to each test
+    def setUp(self):
+        app.config.from_object(os.environ['TEST_SETTINGS'])
+        app.config['RATELIMIT_ENABLED'] = True
+        app.config['RATELIMITS'] = {
+            'login': {'ip': (3, 60), 'user': (2, 60)},
+        }
+        # fresh buckets for every test
+        limiter.store = MemoryStore()
+        self.app = app.test_client()
+        db.create_all()
+
+        self.assertEquals(app.debug, False)
+
+    # executed after each test
+    def tearDown(self):
+        app.config['RATELIMIT_ENABLED'] = False
+        db.session.remove()
+        db.drop_all()
+
+    ########################
+    #    helper methods    #
+    ########################
+
+    def login(self, userName='isaac', password='iceyboi'):
+        return self.app.post('/login',
+                             data=dict(userName=userName, password=password))
+
+    #############
+    #   tests   #
+    #############
+
+    def test_bucket_allows_burst_then_limits(self):
+        store = MemoryStore()
+        for i in range(3):
+            allowed, wait = store.take('k', 3, 1.0, 100.0)
+            self.assertTrue(allowed)
+        allowed, wait = store.take('k', 3, 1.0, 100.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 1.0)
+
+    def test_bucket_refills(self):
+        store = MemoryStore()
+        store.take('k', 1, 0.5, 100.0)
+        self.assertFalse(store.take('k', 1, 0.5, 101.0)[0])
+        self.assertTrue(store.take('k', 1, 0.5, 102.5)[0])
+
+    def test_login_limited_per_user(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login().status_code, 200)
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response.headers)
+        self.assertIn(b'slow down', response.data)
+
+    def test_login_limited_per_ip(self):
+        for name in ('a', 'b', 'c'):
+            self.assertEqual(self.login(userName=name).status_code, 200)
+        self.assertEqual(self.login(userName='d').status_code, 429)
+
+    def test_login_form_not_limited(self):
+        for i in range(5):
+            self.assertEqual(self.app.get('/login').status_code, 200)
+
+    def test_limited_requests_are_counted(self):
+        for i in range(3):
+            self.login()
+        self.assertEqual(limiter.counters(), {'login:user': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
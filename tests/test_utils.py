@@ -0,0 +1,442 @@
+# tests/test_utils.py
+
+
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from project import app
+from project.models import GooglePlace
+from project.utils.fragmentCache import FragmentCache
+from project.utils.textSearch import searchTerms
+from project.utils.autocomplete import PrefixIndex
+from project.utils.geoUtils import haversine, nearest
+from project.utils.zipUtils import ZipIndex
+from project.utils.hoursUtils import Hours, compileHours, openNow
+from project.utils.pageUtils import encodeCursor, decodeCursor
+from project.models import Visit
+from project.utils.importUtils import ImportProgress, readCSV, readTakeout
+from project.utils.diskCache import DiskCache
+from project.utils.quotaUtils import GoogleUsage, OverBudget, callerAs
+from project.utils.cassette import Cassette, CassetteMiss
+
+
+class FragmentCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FragmentCache()
+        self.cache.maxSize = 2
+        self.renders = 0
+
+    def render(self, name, *keyParts):
+        def caller():
+            self.renders += 1
+            return '<p>{}</p>'.format(name)
+        with app.test_request_context():
+            return self.cache.fragment(name, *keyParts, caller=caller)
+
+    def test_fragment_rendered_once_per_key(self):
+        self.render('list', 1)
+        html = self.render('list', 1)
+        self.assertEqual(self.renders, 1)
+        self.assertEqual(html, '<p>list</p>')
+        self.render('list', 2)
+        self.assertEqual(self.renders, 2)
+
+    def test_least_recently_used_evicted(self):
+        self.render('a')
+        self.render('b')
+        self.render('a')
+        self.render('c')
+        self.assertEqual(len(self.cache.entries), 2)
+        self.render('a')
+        self.assertEqual(self.renders, 3)
+        self.render('b')
+        self.assertEqual(self.renders, 4)
+
+    def test_invalidate_user(self):
+        self.cache.set(('list', 'u1', 1), 'x')
+        self.cache.set(('list', 'u2', 1), 'y')
+        self.cache.invalidate('u1')
+        self.assertEqual(list(self.cache.entries), [('list', 'u2', 1)])
+
+
+class GooglePlaceTests(unittest.TestCase):
+
+    def setUp(self):
+        self.result = {'place_id': 'abc', 'name': 'Donburi',
+                       'vicinity': '2438 18th St NW', 'reviews': []}
+
+    def test_fields_read_from_json(self):
+        place = GooglePlace('abc', self.result)
+        self.assertEqual(place.name, 'Donburi')
+        self.assertEqual(place.vicinity, '2438 18th St NW')
+        self.assertEqual(str(place), 'Donburi')
+
+    def test_missing_fields_are_none(self):
+        place = GooglePlace('abc', self.result)
+        self.assertIsNone(place.permanently_closed)
+        self.assertIsNone(place.website)
+
+    def test_location(self):
+        self.result['geometry'] = {'location': {'lat': 38.9, 'lng': -77.0}}
+        self.assertEqual(GooglePlace('abc', self.result).location,
+                         (38.9, -77.0))
+        self.assertEqual(GooglePlace('abc', {'place_id': 'abc'}).location,
+                         (None, None))
+
+
+class SearchTermsTests(unittest.TestCase):
+
+    def test_query_syntax_dropped(self):
+        self.assertEqual(searchTerms('Ramen & "tacos":* | !'),
+                         ['ramen', 'tacos'])
+
+    def test_empty_query(self):
+        self.assertEqual(searchTerms('  !? '), [])
+
+
+class PrefixIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex([('p1', 'Range Café Bernalillo'),
+                                  ('p2', 'Ramen Shop')])
+
+    def test_matches_start_of_any_word(self):
+        self.assertEqual(self.index.search('ra'),
+                         [('p1', 'Range Café Bernalillo'),
+                          ('p2', 'Ramen Shop')])
+        self.assertEqual(self.index.search('SHO'), [('p2', 'Ramen Shop')])
+        self.assertEqual(self.index.search('cafe b'),
+                         [('p1', 'Range Café Bernalillo')])
+        self.assertEqual(self.index.search('pho'), [])
+
+    def test_added_places_found(self):
+        self.index.add('p3', 'Rasika')
+        self.index.add('p3', 'Rasika')
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search('ras'), [('p3', 'Rasika')])
+
+    def test_limit(self):
+        self.assertEqual(self.index.search('r', limit=1),
+                         [('p1', 'Range Café Bernalillo')])
+
+
+class Row(object):
+
+    def __init__(self, name, latitude, longitude):
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+
+
+class GeoTests(unittest.TestCase):
+
+    def test_haversine(self):
+        # dupont circle to baltimore's inner harbor is about 35 miles
+        miles = haversine(38.9096, -77.0434, [38.9096, 39.2857],
+                          [-77.0434, -76.6131])
+        self.assertAlmostEqual(miles[0], 0)
+        self.assertAlmostEqual(miles[1], 35, delta=1)
+
+    def test_nearest_sorts_and_filters(self):
+        rows = [Row('baltimore', 39.2857, -76.6131),
+                Row('unknown', None, None),
+                Row('adams morgan', 38.9215, -77.0422)]
+        found = nearest(rows, 38.9096, -77.0434)
+        self.assertEqual([row.name for row, miles in found],
+                         ['adams morgan', 'baltimore'])
+        found = nearest(rows, 38.9096, -77.0434, radius=2)
+        self.assertEqual([row.name for row, miles in found],
+                         ['adams morgan'])
+
+
+class ZipIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ZipIndex()
+        self.index.load([('20036', 38.9087, -77.0414),
+                         ('20009', 38.9202, -77.0375),
+                         ('21202', 39.2964, -76.6078),
+                         ('87004', 35.3453, -106.5515)])
+
+    def test_lookup(self):
+        self.assertIn('20009', self.index)
+        self.assertNotIn('99999', self.index)
+        self.assertEqual(self.index.lookup('87004'), (35.3453, -106.5515))
+        self.assertIsNone(self.index.lookup('99999'))
+
+    def test_zips_near(self):
+        near = [zipCode for zipCode, miles in
+                self.index.zipsNear('20036', 5)]
+        self.assertEqual(near, ['20036', '20009'])
+        near = [zipCode for zipCode, miles in
+                self.index.zipsNear('20036', 50)]
+        self.assertEqual(near, ['20036', '20009', '21202'])
+
+    def test_nearest(self):
+        self.assertEqual(self.index.nearest(38.92, -77.04)[0], '20009')
+        # crosses into the next cell over
+        self.assertEqual(self.index.nearest(39.6, -76.6)[0], '21202')
+        self.assertIsNone(self.index.nearest(-33.9, 151.2))
+
+    def test_add(self):
+        self.index.add('20001', 38.9100, -77.0178)
+        self.assertEqual(self.index.nearest(38.91, -77.02)[0], '20001')
+        self.assertEqual(self.index.lookup('20001'), (38.91, -77.0178))
+        self.assertEqual(self.index.zipsNear('20001', 0.1)[0][0], '20001')
+
+
+def period(openDay, openTime, closeDay, closeTime):
+    return {'open': {'day': openDay, 'time': openTime},
+            'close': {'day': closeDay, 'time': closeTime}}
+
+
+class StoredHours(object):
+
+    def __init__(self, hours, utcOffset):
+        self.hours = hours
+        self.utcOffset = utcOffset
+
+
+class HoursTests(unittest.TestCase):
+
+    def setUp(self):
+        # 11am to 10pm, to 2am friday and saturday nights
+        periods = [period(day, '1100', day, '2200') for day in range(1, 5)]
+        periods += [period(5, '1100', 6, '0200'),
+                    period(6, '1100', 0, '0200')]
+        # eastern daylight time
+        self.hours = Hours(compileHours(periods), -240)
+
+    def test_saturday_night_wraps_to_sunday(self):
+        self.assertEqual(self.hours.intervals[0], [0, 120])
+        self.assertEqual(self.hours.intervals[-1], [9300, 10080])
+
+    def test_open_until_after_midnight(self):
+        # saturday 10pm local
+        now = datetime(2026, 10, 18, 2, 0)
+        self.assertTrue(self.hours.isOpen(now))
+        self.assertEqual(self.hours.status(now),
+                         {'open': True, 'change': 'Sun 2:00 AM'})
+
+    def test_closed_opens_next(self):
+        # sunday 2:30am local, closed until monday
+        now = datetime(2026, 10, 18, 6, 30)
+        self.assertFalse(self.hours.isOpen(now))
+        self.assertEqual(self.hours.status(now),
+                         {'open': False, 'change': 'Mon 11:00 AM'})
+        # monday 10am local
+        now = datetime(2026, 10, 19, 14, 0)
+        self.assertEqual(self.hours.status(now),
+                         {'open': False, 'change': '11:00 AM'})
+
+    def test_always_open(self):
+        hours = Hours(compileHours([{'open': {'day': 0, 'time': '0000'}}]), 0)
+        self.assertEqual(hours.status(),
+                         {'open': True, 'change': None})
+        self.assertIsNone(Hours.fromGoogle({'open_now': True}, 0))
+
+    def test_open_now_across_places(self):
+        now = datetime(2026, 10, 19, 16, 0)
+        places = [StoredHours(self.hours.toJSON(), -240),
+                  StoredHours(None, None),
+                  # same hours, but in utc+8 it is already tuesday 12am
+                  StoredHours(self.hours.toJSON(), 480)]
+        self.assertEqual(list(openNow(places, now)), [True, False, False])
+
+
+class CursorTests(unittest.TestCase):
+
+    def test_round_trip(self):
+        columns = (Visit.visitDate, Visit.visitID)
+        cursor = encodeCursor([datetime(2017, 1, 1).date(), 12])
+        self.assertEqual(decodeCursor(cursor, columns),
+                         [datetime(2017, 1, 1).date(), 12])
+
+    def test_bad_cursors(self):
+        columns = (Visit.visitDate, Visit.visitID)
+        for cursor in ('nope', encodeCursor([1]),
+                       encodeCursor(['January', 12])):
+            with self.assertRaises(ValueError):
+                decodeCursor(cursor, columns)
+
+
+class ImportTests(unittest.TestCase):
+
+    def test_csv(self):
+        places = readCSV(io.StringIO(
+            'Title,Note,URL\n'
+            'Dukes Grocery,the burger,'
+            'https://www.google.com/maps/search/?api=1&query=x'
+            '&query_place_id=ChIJ123\n'
+            'Range Cafe,,\n'))
+        self.assertEqual([(place['name'], place['notes'], place['placeID'])
+                          for place in places],
+                         [('Dukes Grocery', 'the burger', 'ChIJ123'),
+                          ('Range Cafe', None, None)])
+        with self.assertRaises(ValueError):
+            readCSV(io.StringIO('street,city\n1 Main St,DC\n'))
+
+    def test_takeout(self):
+        features = [
+            {'geometry': {'coordinates': [-77.04, 38.91]},
+             'properties': {'Title': 'Dukes Grocery',
+                            'Google Maps URL': 'http://maps.google.com/?cid=1',
+                            'Location': {'Address': '1513 17th St NW'}}},
+            {'geometry': {'coordinates': [0, 0]},
+             'properties': {'google_maps_url': 'http://maps.google.com/?cid=2',
+                            'location': {'name': 'Range Cafe'},
+                            'Comment': 'pie'}},
+        ]
+        places = readTakeout(io.StringIO(json.dumps(
+            {'type': 'FeatureCollection', 'features': features})))
+        self.assertEqual(
+            [(place['name'], place['address'], place['lat'], place['notes'])
+             for place in places],
+            [('Dukes Grocery', '1513 17th St NW', 38.91, None),
+             ('Range Cafe', None, None, 'pie')])
+        with self.assertRaises(ValueError):
+            readTakeout(io.StringIO('[]'))
+
+    def test_progress_resumes(self):
+        places = [{'key': key} for key in 'abc']
+        path = os.path.join(tempfile.mkdtemp(), 'import.progress')
+        ImportProgress(path).record([{'key': 'a', 'placeID': 'A'},
+                                     {'key': 'b', 'error': 'no match'}])
+        progress = ImportProgress(path)
+        self.assertEqual(progress.todo(places), [{'key': 'c'}])
+        self.assertEqual(progress.todo(places, retryFailed=True),
+                         [{'key': 'b'}, {'key': 'c'}])
+
+
+class DiskCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = DiskCache()
+        self.cache.directory = tempfile.mkdtemp()
+        self.cache.maxSize = 10
+        self.cache.load()
+
+    def test_put_and_get(self):
+        self.assertIsNone(self.cache.get('a'))
+        path = self.cache.put('a', b'1234')
+        self.assertEqual(self.cache.get('a'), path)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'1234')
+
+    def test_least_recently_used_evicted(self):
+        self.cache.put('a', b'1234')
+        self.cache.put('b', b'1234')
+        self.cache.get('a')
+        self.cache.put('c', b'1234')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertEqual(self.cache.size, 8)
+
+    def test_open_survives_eviction(self):
+        self.assertIsNone(self.cache.open('a'))
+        self.cache.put('a', b'1234')
+        with self.cache.open('a') as f:
+            # evicted by another worker while being served
+            os.remove(self.cache.get('a'))
+            self.assertEqual(f.read(), b'1234')
+        self.assertIsNone(self.cache.open('a'))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_load_existing_files(self):
+        self.cache.put('a', b'1234')
+        other = DiskCache()
+        other.directory = self.cache.directory
+        other.load()
+        self.assertEqual(other.size, 4)
+        self.assertIsNotNone(other.get('a'))
+
+
+class UsageApp(object):
+    config = {'GOOGLE_COSTS': {'details': 0.5, 'nearby': 1.0},
+              'GOOGLE_BUDGETS': {'nearby': 1.5, 'total': 2.0}}
+
+
+class GoogleUsageTests(unittest.TestCase):
+
+    def setUp(self):
+        self.usage = GoogleUsage()
+        self.usage.app = UsageApp()
+
+    def test_counted_against_caller(self):
+        with callerAs('places.search', 'abc'):
+            self.usage.record('nearby')
+            self.usage.record('nearby')
+        self.usage.record('details')
+        self.assertEqual(
+            sorted((key[1:], calls)
+                   for key, calls in self.usage.calls.items()),
+            [(('details', 'background', ''), 1),
+             (('nearby', 'places.search', 'abc'), 2)])
+        self.assertEqual(self.usage.spent['total'], 2.5)
+
+    def test_budgets(self):
+        self.usage.check('nearby')
+        self.usage.record('nearby')
+        # a second nearby would go over the nearby budget
+        with self.assertRaises(OverBudget):
+            self.usage.check('nearby')
+        self.usage.check('details')
+        self.usage.record('details')
+        self.usage.record('details')
+        # and another details over the total
+        with self.assertRaises(OverBudget):
+            self.usage.check('details')
+
+
+class CassetteTests(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'test.jsonl.gz')
+        self.cassette = Cassette()
+        self.cassette.configure('record', self.path)
+        url = 'https://maps.googleapis.com/maps/api/place/details/json'
+        for name in ('first', 'second'):
+            self.cassette.record(
+                url, {'placeid': 'abc', 'key': 'secret'}, 200,
+                'application/json; charset=UTF-8',
+                json.dumps({'result': {'name': name}}).encode('utf-8'),
+                0.25)
+        self.cassette.record(
+            'https://maps.googleapis.com/maps/api/place/photo',
+            {'photoreference': 'xyz', 'maxwidth': 400, 'key': 'secret'},
+            200, 'image/jpeg', b'\xff\xd8\xff', 0.1)
+        self.cassette.configure('replay', self.path, timing=False)
+        self.url = url
+
+    def test_key_scrubbed(self):
+        with gzip.open(self.path, 'rt') as f:
+            self.assertNotIn('secret', f.read())
+
+    def test_replayed_in_order(self):
+        names = []
+        for i in range(3):
+            status, contentType, body, delay = self.cassette.answer(
+                self.url, {'placeid': 'abc', 'key': 'other'})
+            names.append(json.loads(body.decode('utf-8'))['result']['name'])
+        self.assertEqual(names, ['first', 'second', 'second'])
+        self.assertEqual(delay, 0)
+
+    def test_images(self):
+        status, contentType, body, delay = self.cassette.answer(
+            'https://maps.googleapis.com/maps/api/place/photo',
+            {'maxwidth': '400', 'photoreference': 'xyz'})
+        self.assertEqual((contentType, body), ('image/jpeg', b'\xff\xd8\xff'))
+
+    def test_miss(self):
+        with self.assertRaises(CassetteMiss):
+            self.cassette.answer(self.url, {'placeid': 'nope'})
+
+
+if __name__ == '__main__':
+    unittest.main()